@@ -0,0 +1,164 @@
+"""
+Aggregation cube of a DataFile: the daily, monthly and annual summaries of every station,
+computed in one pass over the hourly readings when the file is loaded
+
+Every mean is taken over valid readings only: the daily mean over the valid hours of the
+day, and the monthly and annual means over the daily means of the days with a valid hour.
+Each summary comes with its number of valid hours.
+"""
+import datetime as d
+from array import array
+from typing import Dict
+from naps_parser import HOURS_PER_DAY, ALL_VALID
+
+MONTHS = 12
+
+# array typecodes of the cube: float64 means, float32 maxima and unsigned counts
+MEAN_TYPECODE = 'd'
+MAX_TYPECODE = 'f'
+DAY_COUNT_TYPECODE = 'B'
+COUNT_TYPECODE = 'I'
+
+CUBE_COLUMNS = ('daily_mean', 'daily_max', 'daily_count', 'monthly_mean', 'monthly_count',
+                'annual_mean', 'annual_count')
+
+
+class AggregationCube:
+    """
+    The daily, monthly and annual summaries of the stations of a DataFile
+
+    Daily values are stored by row of the DataFile, monthly values at index
+    station id * MONTHS + month - 1 and annual values at the station id.
+
+    Instance Attributes:
+        - daily_mean: the mean of the valid readings of every row (NaN if there are none)
+        - daily_max: the highest valid reading of every row (NaN if there are none)
+        - daily_count: the number of valid readings of every row
+        - monthly_mean: the mean of the daily means of every station and month
+        - monthly_count: the number of valid readings of every station and month
+        - annual_mean: the mean of the daily means of every station
+        - annual_count: the number of valid readings of every station
+
+    Representation Invariants:
+        - len(self.daily_mean) == len(self.daily_max) == len(self.daily_count)
+        - len(self.monthly_mean) == len(self.monthly_count) == len(self.annual_mean) * MONTHS
+    """
+    daily_mean: memoryview
+    daily_max: memoryview
+    daily_count: memoryview
+    monthly_mean: memoryview
+    monthly_count: memoryview
+    annual_mean: memoryview
+    annual_count: memoryview
+
+    def __init__(self, columns: Dict[str, memoryview]) -> None:
+        self.daily_mean = columns['daily_mean']
+        self.daily_max = columns['daily_max']
+        self.daily_count = columns['daily_count']
+        self.monthly_mean = columns['monthly_mean']
+        self.monthly_count = columns['monthly_count']
+        self.annual_mean = columns['annual_mean']
+        self.annual_count = columns['annual_count']
+
+    def columns(self) -> Dict[str, memoryview]:
+        """Return the columns of this cube by name, e.g. to store them in a binary cache"""
+        return {'daily_mean': self.daily_mean,
+                'daily_max': self.daily_max,
+                'daily_count': self.daily_count,
+                'monthly_mean': self.monthly_mean,
+                'monthly_count': self.monthly_count,
+                'annual_mean': self.annual_mean,
+                'annual_count': self.annual_count}
+
+
+def build_cube(row_station: memoryview, row_date: memoryview, hours: memoryview,
+               row_valid: memoryview, n_stations: int) -> AggregationCube:
+    """Return the aggregation cube of the given DataFile columns, in one pass over the rows
+
+    Preconditions:
+        - every station id in row_station is < n_stations
+        - the rows are all in the same year
+
+    >>> station = memoryview(array('h', [0, 0, 1]))
+    >>> dates = memoryview(array('i', [737060, 737091, 737060]))
+    >>> readings = memoryview(array('f', [1.0] * 24 + [2.0, 4.0] + [3.0] * 22 + [5.0] * 24))
+    >>> valid = memoryview(array('I', [ALL_VALID, 0b11, 0]))
+    >>> cube = build_cube(station, dates, readings, valid, 2)
+    >>> cube.daily_mean[1], cube.daily_max[1], cube.daily_count[1]
+    (3.0, 4.0, 2)
+    >>> cube.monthly_mean[0], cube.monthly_mean[1], cube.annual_mean[0], cube.annual_count[0]
+    (1.0, 3.0, 2.0, 26)
+    >>> cube.annual_count[1], cube.daily_count[2]
+    (0, 0)
+    """
+    n_rows = len(row_date)
+    nan = float('nan')
+    daily_mean = array(MEAN_TYPECODE, [nan]) * n_rows
+    daily_max = array(MAX_TYPECODE, [nan]) * n_rows
+    daily_count = array(DAY_COUNT_TYPECODE, [0]) * n_rows
+    month_sum = array(MEAN_TYPECODE, [0.0]) * (n_stations * MONTHS)
+    month_days = array(COUNT_TYPECODE, [0]) * (n_stations * MONTHS)
+    monthly_count = array(COUNT_TYPECODE, [0]) * (n_stations * MONTHS)
+
+    months = {}
+    readings = hours.tolist()
+    for row in range(n_rows):
+        valid = row_valid[row]
+        if valid == 0:
+            continue
+        day_vals = readings[row * HOURS_PER_DAY: (row + 1) * HOURS_PER_DAY]
+        if valid != ALL_VALID:
+            day_vals = [day_vals[h] for h in range(HOURS_PER_DAY) if valid >> h & 1]
+        mean = sum(day_vals) / len(day_vals)
+        daily_mean[row] = mean
+        daily_max[row] = max(day_vals)
+        daily_count[row] = len(day_vals)
+
+        day = row_date[row]
+        if day not in months:
+            months[day] = d.date.fromordinal(day).month - 1
+        index = row_station[row] * MONTHS + months[day]
+        month_sum[index] += mean
+        month_days[index] += 1
+        monthly_count[index] += len(day_vals)
+
+    monthly_mean = array(MEAN_TYPECODE, [nan]) * (n_stations * MONTHS)
+    annual_mean = array(MEAN_TYPECODE, [nan]) * n_stations
+    annual_count = array(COUNT_TYPECODE, [0]) * n_stations
+    for station in range(n_stations):
+        total, days = 0.0, 0
+        for index in range(station * MONTHS, (station + 1) * MONTHS):
+            if month_days[index] > 0:
+                monthly_mean[index] = month_sum[index] / month_days[index]
+                total += month_sum[index]
+                days += month_days[index]
+                annual_count[station] += monthly_count[index]
+        if days > 0:
+            annual_mean[station] = total / days
+
+    return AggregationCube({'daily_mean': memoryview(daily_mean),
+                            'daily_max': memoryview(daily_max),
+                            'daily_count': memoryview(daily_count),
+                            'monthly_mean': memoryview(monthly_mean),
+                            'monthly_count': memoryview(monthly_count),
+                            'annual_mean': memoryview(annual_mean),
+                            'annual_count': memoryview(annual_count)})
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['datetime', 'array', 'typing', 'naps_parser'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,54 @@
+"""
+Time the NAPS parsers: naps_parser.legacy_parse (the way the files used to be read)
+against naps_parser.parse_naps, on the csv files given on the command line (the
+doctest dataset if none are given)
+
+    python bench_parsing.py [csv file ...]
+
+The times depend on the machine and its load, so they are printed rather than tested;
+the doctests of naps_parser check that both parsers give the same rows.
+"""
+import sys
+import time
+from typing import Any, Callable, List, Tuple
+from naps_parser import legacy_parse, parse_naps
+
+DEFAULT_FILES = ['doctest_dataset/O3_2019.csv']
+# each parser is run this many times, and its best time is kept
+REPEATS = 3
+
+
+def compare_parse_times(file_path: str) -> Tuple[float, float]:
+    """Return the best seconds taken to parse the file at file_path by legacy_parse
+    (before) and by parse_naps (after), over REPEATS runs"""
+    before = min(helper_time(legacy_parse, file_path) for _ in range(REPEATS))
+    after = min(helper_time(parse_naps, file_path) for _ in range(REPEATS))
+    return (before, after)
+
+
+def helper_time(parser: Callable[[str], Any], file_path: str) -> float:
+    """Return the seconds taken by parser to parse the file at file_path"""
+    start = time.perf_counter()
+    parser(file_path)
+    return time.perf_counter() - start
+
+
+def print_parse_times(file_paths: List[str]) -> None:
+    """Print the parse times of every file in file_paths, and the speedup of parse_naps"""
+    for file_path in file_paths:
+        before, after = compare_parse_times(file_path)
+        print(file_path + ': legacy_parse ' + str(round(before, 3)) + ' s, parse_naps '
+              + str(round(after, 3)) + ' s (' + str(round(before / after, 1)) + 'x)')
+
+
+if __name__ == '__main__':
+    print_parse_times(sys.argv[1:] if len(sys.argv) > 1 else DEFAULT_FILES)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['sys', 'time', 'typing', 'naps_parser'],
+        'allowed-io': ['print_parse_times'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
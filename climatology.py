@@ -0,0 +1,349 @@
+"""
+Seasonal climatology of the stations of a pollutant, and the anomalies from it
+
+The climatology of a station is the mean of its valid hourly readings at every hour of
+the day of every month, over all of the years of a Dataset. An anomaly is a reading
+minus the climatology of its station, month and hour, so the seasonal and daily cycles
+do not get in the way of before/after comparisons and of trends.
+
+The climatology is built in one pass over the rows of the files, adding each row of 24
+readings to the sums of its station and month, and is cached in the directory of the
+dataset, in '<POLLUTANT>' + CLIMATOLOGY_SUFFIX, keyed on the NAPS files it was built from.
+Only the stations asked for are computed (and added to the cache).
+"""
+import datetime as d
+import json
+import os
+from array import array
+from math import isnan
+from typing import Any, Dict, List, Optional, Tuple
+import data_cache
+from aggregation import MONTHS
+from dataset import Dataset
+from loading_data import PARSER_VERSION, DataFile, date_to_day
+from naps_parser import ALL_VALID, HOURS_PER_DAY
+from odd_oxygen import OxFile
+
+CLIMATOLOGY_SUFFIX = '.climatology'
+# Version of the climatology, stored in the cache. Increase it whenever a change to the
+# computation changes its results.
+CLIMATOLOGY_VERSION = 1
+SLOTS = MONTHS * HOURS_PER_DAY
+
+
+class Climatology:
+    """
+    The sums and counts of the valid hourly readings of every station by month and hour
+    of the day, at index (month - 1) * HOURS_PER_DAY + hour, hour 0 being H01
+
+    Instance Attributes:
+        - sums: the sums of the readings of every station, by station code
+        - counts: the numbers of readings of every station, by station code
+
+    Representation Invariants:
+        - self.sums.keys() == self.counts.keys()
+        - all(len(self.sums[code]) == len(self.counts[code]) == SLOTS for code in self.sums)
+    """
+    sums: Dict[str, array]
+    counts: Dict[str, array]
+
+    def __init__(self) -> None:
+        self.sums = {}
+        self.counts = {}
+
+    def add_file(self, data_file: DataFile, station_ids: Optional[List[str]] = None) -> None:
+        """Add the valid readings of the given stations (every station if None) of
+        data_file to this climatology
+
+        Preconditions:
+            - station_ids is None or all(s in data_file.stations for s in station_ids)
+        """
+        data_file.ensure_loaded(station_ids)
+        codes = list(data_file.stations) if station_ids is None else station_ids
+        readings = data_file.hours
+        months = {}
+        for code in codes:
+            if code not in self.sums:
+                self.sums[code] = array('d', [0.0]) * SLOTS
+                self.counts[code] = array('I', [0]) * SLOTS
+            sums, counts = self.sums[code], self.counts[code]
+            [a, b] = data_file.stations[code]
+            for row in range(a, b + 1):
+                valid = data_file.row_valid[row]
+                if valid == 0:
+                    continue
+                day = data_file.row_date[row]
+                if day not in months:
+                    months[day] = (d.date.fromordinal(day).month - 1) * HOURS_PER_DAY
+                start = months[day]
+                values = readings[row * HOURS_PER_DAY: (row + 1) * HOURS_PER_DAY].tolist()
+                if valid == ALL_VALID:
+                    sums[start: start + HOURS_PER_DAY] = array(
+                        'd', [s + v for s, v in zip(sums[start: start + HOURS_PER_DAY], values)])
+                    counts[start: start + HOURS_PER_DAY] = array(
+                        'I', [c + 1 for c in counts[start: start + HOURS_PER_DAY]])
+                else:
+                    for hour in range(HOURS_PER_DAY):
+                        if valid >> hour & 1:
+                            sums[start + hour] += values[hour]
+                            counts[start + hour] += 1
+
+    def merge(self, other: 'Climatology') -> None:
+        """Add the sums and counts of other to this climatology, e.g. the climatology of
+        other files or stations"""
+        for code in other.sums:
+            if code not in self.sums:
+                self.sums[code] = array('d', other.sums[code])
+                self.counts[code] = array('I', other.counts[code])
+            else:
+                for i in range(SLOTS):
+                    self.sums[code][i] += other.sums[code][i]
+                    self.counts[code][i] += other.counts[code][i]
+
+    def means(self, station_id: str) -> List[float]:
+        """Return the mean of station_id at every month and hour of the day, with NaN when
+        it has no reading at that month and hour
+
+        Preconditions:
+            - station_id in self.sums
+        """
+        sums, counts = self.sums[station_id], self.counts[station_id]
+        return [sums[i] / counts[i] if counts[i] > 0 else float('nan') for i in range(SLOTS)]
+
+    def mean(self, station_id: str, month: int, hour: int) -> float:
+        """Return the mean of station_id in month (1 to 12) at hour (0 for H01 to 23)
+
+        Preconditions:
+            - station_id in self.sums
+
+        >>> climatology = Climatology()
+        >>> climatology.add_file(DataFile('doctest_dataset/O3_2019.csv'), ['010102'])
+        >>> round(climatology.mean('010102', 1, 0), 3)
+        28.885
+        """
+        i = (month - 1) * HOURS_PER_DAY + hour
+        count = self.counts[station_id][i]
+        return self.sums[station_id][i] / count if count > 0 else float('nan')
+
+
+def dataset_climatology(dataset: Dataset, pollutant: str,
+                        station_ids: Optional[List[str]] = None,
+                        use_cache: bool = True) -> Climatology:
+    """Return the climatology of the given stations (every station if None) of pollutant
+    over every year of dataset. The stations already in the cache of pollutant are read
+    from it and the others are computed and added to it.
+
+    >>> dataset = Dataset('doctest_dataset')
+    >>> climatology = dataset_climatology(dataset, 'O3', ['010102'], use_cache=False)
+    >>> round(climatology.mean('010102', 7, 12), 3)
+    17.387
+    """
+    path = os.path.join(dataset.directory, pollutant + CLIMATOLOGY_SUFFIX)
+    files = [dataset.files[(pollutant, year)] for year in dataset.years(pollutant)]
+    key = helper_cache_key(files)
+    cached = read_climatology(path, key) if use_cache else None
+    climatology = Climatology() if cached is None else cached
+
+    if station_ids is None:
+        for data_file in files:
+            data_file.ensure_loaded()
+        wanted = sorted({code for data_file in files for code in data_file.stations})
+    else:
+        wanted = station_ids
+    missing = [code for code in wanted if code not in climatology.sums]
+    if missing:
+        for data_file in files:
+            data_file.ensure_loaded(missing)
+            present = [code for code in missing if code in data_file.stations]
+            climatology.add_file(data_file, present)
+        if use_cache:
+            write_climatology(path, key, climatology)
+    return climatology
+
+
+def anomaly_hours(data_file: DataFile, climatology: Climatology,
+                  station_id: str) -> Tuple[int, List[float]]:
+    """Return the day number of the first day of station_id, and the anomalies of its
+    hourly readings from that day on, with NaN for the missing readings, as in
+    rolling.station_hours
+
+    Preconditions:
+        - station_id in data_file.stations
+        - station_id in climatology.sums
+
+    >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+    >>> climatology = Climatology()
+    >>> climatology.add_file(my_data, ['010102'])
+    >>> first_day, anomalies = anomaly_hours(my_data, climatology, '010102')
+    >>> round(anomalies[0], 3)
+    6.115
+    """
+    data_file.ensure_loaded([station_id])
+    dates = data_file.station_dates(station_id)
+    [a, _] = data_file.stations[station_id]
+    first_day = dates[0]
+    means = climatology.means(station_id)
+    anomalies = [float('nan')] * ((dates[-1] - first_day + 1) * HOURS_PER_DAY)
+    for i in range(len(dates)):
+        row = a + i
+        valid = data_file.row_valid[row]
+        if valid == 0:
+            continue
+        start = (d.date.fromordinal(dates[i]).month - 1) * HOURS_PER_DAY
+        values = data_file.row_hours(row).tolist()
+        offset = (dates[i] - first_day) * HOURS_PER_DAY
+        for hour in range(HOURS_PER_DAY):
+            if valid >> hour & 1:
+                anomalies[offset + hour] = values[hour] - means[start + hour]
+    return (first_day, anomalies)
+
+
+def anomaly_table(data_file: DataFile, climatology: Climatology,
+                  station_ids: Optional[List[str]] = None) \
+        -> Tuple[List[int], List[str], List[List[float]]]:
+    """Return the daily averages of the hourly anomalies of the given stations (every
+    station if None) of data_file, in the layout of DataFile.daily_table, so they can go
+    straight into the batched regressions of compute
+
+    Preconditions:
+        - station_ids is None or all(s in data_file.stations for s in station_ids)
+        - all the stations are in climatology.sums
+
+    >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+    >>> climatology = Climatology()
+    >>> climatology.add_file(my_data, ['010102'])
+    >>> days, codes, table = anomaly_table(my_data, climatology, ['010102'])
+    >>> len(days), codes, round(table[0][0], 3)
+    (365, ['010102'], 1.68)
+    """
+    data_file.ensure_loaded(station_ids)
+    codes = list(data_file.stations) if station_ids is None else station_ids
+    first_day = date_to_day(data_file.year + '0101')
+    days = list(range(first_day, date_to_day(data_file.year + '1231') + 1))
+    table = []
+    for code in codes:
+        station_first, anomalies = anomaly_hours(data_file, climatology, code)
+        series = [float('nan')] * len(days)
+        for day in range(len(anomalies) // HOURS_PER_DAY):
+            valid = [a for a in anomalies[day * HOURS_PER_DAY: (day + 1) * HOURS_PER_DAY]
+                     if not isnan(a)]
+            if valid:
+                series[station_first + day - first_day] = sum(valid) / len(valid)
+        table.append(series)
+    return (days, codes, table)
+
+
+def anomaly_query(dataset: Dataset, pollutant: str, climatology: Climatology,
+                  stations: Optional[List[str]] = None, start_date: Optional[str] = None,
+                  end_date: Optional[str] = None) \
+        -> Dict[str, Tuple[List[d.datetime], List[float]]]:
+    """Return the daily anomalies of pollutant for every station in stations (every
+    station if None), between start_date and end_date (INCLUSIVE, formatted as
+    'YYYYMMDD'), as the (x-coordinates, y-coordinates) of Dataset.query
+
+    Preconditions:
+        - all the stations are in climatology.sums
+
+    >>> dataset = Dataset('doctest_dataset')
+    >>> climatology = dataset_climatology(dataset, 'O3', ['010102'], use_cache=False)
+    >>> x_cor, y_cor = anomaly_query(dataset, 'O3', climatology, ['010102'], '20190101',
+    ...                              '20190102')['010102']
+    >>> x_cor[0].day, [round(y, 3) for y in y_cor]
+    (1, [1.68, 1.055])
+    """
+    series = {}
+    for data_file, code, [first, last] in dataset.plan(pollutant, stations,
+                                                       start_date, end_date):
+        if last < first:
+            continue
+        first_day, anomalies = anomaly_hours(data_file, climatology, code)
+        if code not in series:
+            series[code] = ([], [])
+        for row in range(first, last + 1):
+            day = data_file.row_date[row] - first_day
+            valid = [a for a in anomalies[day * HOURS_PER_DAY: (day + 1) * HOURS_PER_DAY]
+                     if not isnan(a)]
+            if valid:
+                series[code][0].append(d.datetime.fromordinal(data_file.row_date[row]))
+                series[code][1].append(sum(valid) / len(valid))
+    return series
+
+
+def helper_cache_key(files: List[DataFile]) -> List[Dict[str, Any]]:
+    """Return the values that must match for a cached climatology of files to be valid:
+    the files, the version of the parser that reads them and the version of the
+    climatology. An OxFile has no csv file of its own, so it is keyed on its O3 and NO2
+    files and its radius (see OxFile.helper_pairs_key).
+
+    >>> o3 = DataFile('doctest_dataset/O3_2019.csv')
+    >>> key = helper_cache_key([o3])
+    >>> key[0]['parser'] == PARSER_VERSION, key[0]['climatology'] == CLIMATOLOGY_VERSION
+    (True, True)
+    >>> key = helper_cache_key([OxFile(o3, o3, 25.0)])
+    >>> key[0]['path'], key[0]['ox']['radius']
+    ('doctest_dataset/Ox_2019.csv', 25.0)
+    """
+    key = []
+    for data_file in files:
+        if isinstance(data_file, OxFile):
+            file_key = {'path': data_file.file_path, 'ox': data_file.helper_pairs_key(),
+                        'parser': PARSER_VERSION}
+        else:
+            file_key = data_cache.cache_key(data_file.file_path, PARSER_VERSION)
+        file_key['climatology'] = CLIMATOLOGY_VERSION
+        key.append(file_key)
+    return sorted(key, key=lambda k: k['path'])
+
+
+def read_climatology(path: str, key: List[Dict[str, Any]]) -> Optional[Climatology]:
+    """Return the climatology stored in the cache file at path, or None if there is no
+    such file or it was not written with the given key"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            stored = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(stored, dict) or stored.get('key') != key:
+        return None
+    climatology = Climatology()
+    for code in stored['stations']:
+        climatology.sums[code] = array('d', stored['stations'][code][0])
+        climatology.counts[code] = array('I', stored['stations'][code][1])
+    return climatology
+
+
+def write_climatology(path: str, key: List[Dict[str, Any]], climatology: Climatology) -> bool:
+    """Write climatology with its key to the cache file at path. Returns whether the file
+    was written; a cache that cannot be written is simply skipped."""
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'key': key,
+                       'stations': {code: [climatology.sums[code].tolist(),
+                                           climatology.counts[code].tolist()]
+                                    for code in climatology.sums}}, file)
+        os.replace(temp_path, path)
+    except OSError:
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['datetime', 'json', 'os', 'array', 'math', 'typing', 'data_cache',
+                          'aggregation', 'dataset', 'loading_data', 'naps_parser',
+                          'odd_oxygen'],
+        'allowed-io': ['read_climatology', 'write_climatology'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
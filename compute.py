@@ -2,16 +2,26 @@
 hold all of the computations that are preformed on the collected data
 """
 
-from typing import List, Tuple, Any
-from math import log, sqrt
+from typing import List, Tuple, Any, Iterable, Optional, Sequence
+from math import comb, isnan, log, sqrt
+from itertools import accumulate
+from heapq import heappush, heappushpop
+from operator import mul
 from matrix import Matrix
 
+# PrefixSums refits the points of a window spanning less than this fraction of the x-values
+MIN_WINDOW_FRACTION = 0.25
+# the ways join_series keeps the keys of two series
+JOIN_MODES = ('inner', 'left', 'outer')
+
 
 def add_values(val1: Tuple[List[Any], List[int]], val2: Tuple[List[Any], List[int]]) -> \
         Tuple[List[str], List[int]]:
     """
     Calculate the combined average of the inputted values for the days that have data available.
 
+    The dates are matched with join_series, in linear time.
+
     Preconditions:
         - len(val1[1]) > 0
         - len(val2[1]) > 0
@@ -22,20 +32,8 @@ def add_values(val1: Tuple[List[Any], List[int]], val2: Tuple[List[Any], List[in
     (['2019010101', '2019010103', '2019010105'], [39, 39, 38])
     """
 
-    # resulting dates and summed values
-    date_list = []
-    sum_list = []
-
-    for i in range(0, len(val1[0])):
-        for j in range(0, len(val2[0])):
-            # matching the dates
-            if val1[0][i] == val2[0][j]:
-
-                # calculating summed value
-                date_list.append(val1[0][i])
-                sum_list.append(val1[1][i] + val2[1][j])
-
-    return (date_list, sum_list)
+    (date_list, values1, values2) = join_series(val1, val2)
+    return (date_list, [values1[i] + values2[i] for i in range(len(date_list))])
 
 
 def calculate_average_collection(points: tuple) -> tuple:
@@ -102,48 +100,128 @@ def simple_linear_regression(points: Tuple[List[float], List[float]]) -> tuple:
     return (a, b)
 
 
-def polynomial_regression(deg: int, x_val: List[float], y_val: List[float]) -> List[float]:
+def polynomial_regression(deg: int, x_val: List[float], y_val: List[float],
+                          weights: Optional[List[float]] = None) -> List[float]:
     """
     Calculate the coefficients of a polynomial function with degree deg
     that best fits the input data
 
     the output is ordered in increasing degree
 
+    The fit is done by fit_polynomial, on centered and scaled x-values, so that it stays
+    accurate for x-values like years or day numbers. If weights is given, the squared
+    error of each point is multiplied by its weight.
+
     Preconditions:
         - deg > 0
-        - len(x_val) > 0
+        - len(x_val) > deg
         - len(x_val) == len(y_val)
+        - weights is None or (len(weights) == len(x_val) and all(w >= 0 for w in weights))
 
     >>> polynomial_regression(2, [10, 20, 30, 40, 50, 60, 0.354, 0.38, 0.405, 0.43],\
         [0.1245, 0.185, 0.2285, 0.265, 0.297, 0.3285, 70, 80, 90, 100])
-    [80.44857677401095, -4.871378463853153, 0.06236668350454819]
+    [80.44857677401087, -4.871378463853146, 0.06236668350454807]
     >>> polynomial_regression(1, [1985, 1990, 1995, 2000, 2005, 2010, 2015],\
         [116576, 130482, 145562, 155328, 158401, 159440, 167543])
-    [-3047466.8571428573, 1597.5428571428572]
+    [-3047466.8571428536, 1597.5428571428556]
+    >>> [round(c, 9) for c in polynomial_regression(1, [0, 1, 2, 3], [0, 1, 2, 9],
+    ...                                              [1, 1, 1, 0])]
+    [0.0, 1.0]
+    """
+    coefficients, center, scale = fit_polynomial(deg, x_val, y_val, weights)
+    return helper_expand_polynomial(coefficients, center, scale)
+
+
+def fit_polynomial(deg: int, x_val: Sequence[float], y_val: Sequence[float],
+                   weights: Optional[Sequence[float]] = None) -> Tuple[List[float], float, float]:
     """
+    Fit a polynomial of degree deg to the points (x_val[i], y_val[i]) by weighted least
+    squares, and return (coefficients, center, scale): the polynomial is
+    sum(coefficients[k] * ((x - center) / scale) ** k).
+
+    See fit_polynomial_many, which this calls with the single series y_val.
 
-    matrix_r = Matrix(deg + 1, deg + 1)
-    matrix_l = [[]]
+    Preconditions:
+        - deg >= 0
+        - len(x_val) == len(y_val) and len(x_val) > deg
+        - weights is None or (len(weights) == len(x_val) and all(w >= 0 for w in weights))
+        - there are more than deg distinct x-values with a positive weight
+
+    >>> coefficients, center, scale = fit_polynomial(2, [2000.0, 2001.0, 2002.0],
+    ...                                              [1.0, 2.0, 5.0])
+    >>> [round(c, 9) for c in coefficients], center, scale
+    ([2.0, 2.0, 1.0], 2001.0, 1.0)
+    """
+    coefficients, center, scale = fit_polynomial_many(deg, x_val, [y_val], weights)
+    return (coefficients[0], center, scale)
 
-    # fills the coefficient matrix
-    for row in range(0, (deg + 1)):
-        for column in range(0, deg + 1):
-            matrix_l[row].append(sum([pow(x, row + column) for x in x_val]))
-        if row != deg:
-            matrix_l.append([])
 
-    constant_vec = []
-    x_temp = 0
+def fit_polynomial_many(deg: int, x_val: Sequence[float], y_vals: List[Sequence[float]],
+                        weights: Optional[Sequence[float]] = None) \
+        -> Tuple[List[List[float]], float, float]:
+    """
+    Fit a polynomial of degree deg to every series of y_vals against the same x-values,
+    by weighted least squares. Returns the
+    coefficients of every series, and the center and scale of x (see fit_polynomial).
 
-    # fills the column vector of constants
-    for row in range(0, (deg + 1)):
-        for i in range(0, len(x_val)):
-            x_temp += pow(x_val[i], row) * y_val[i]
-        constant_vec.append(x_temp)
-        x_temp = 0
+    Centering and scaling x keeps its powers near 1 however large x is. The design matrix
+    is built one column at a time (each column is the previous one times the scaled
+    x-values), and the least squares problems are solved with one Householder QR
+    factorization of it rather than by forming the normal equations, which would square
+    its condition number.
 
-    matrix_r.set_matrix(matrix_l)
-    return matrix_r.solve(constant_vec)
+    Preconditions:
+        - deg >= 0
+        - all(len(y_val) == len(x_val) for y_val in y_vals) and len(x_val) > deg
+        - weights is None or (len(weights) == len(x_val) and all(w >= 0 for w in weights))
+        - there are more than deg distinct x-values with a positive weight
+
+    >>> coefficients, _, _ = fit_polynomial_many(1, [1.0, 2.0, 3.0], [[1.0, 2.0, 3.0],
+    ...                                                           [2.0, 4.0, 6.0]])
+    >>> [[round(c, 9) for c in row] for row in coefficients]
+    [[2.0, 1.0], [4.0, 2.0]]
+    """
+    center = sum(x_val) / len(x_val)
+    scale = max(abs(x - center) for x in x_val)
+    if scale == 0:
+        scale = 1.0
+    scaled = [(x - center) / scale for x in x_val]
+
+    if weights is None:
+        columns = [[1.0] * len(scaled)]
+        rhs = [[float(y) for y in y_val] for y_val in y_vals]
+    else:
+        roots = [sqrt(w) for w in weights]
+        columns = [roots]
+        rhs = [list(map(mul, roots, y_val)) for y_val in y_vals]
+    for _ in range(deg):
+        columns.append(list(map(mul, columns[-1], scaled)))
+
+    design = Matrix(len(scaled), deg + 1)
+    design.set_columns(columns)
+    return (design.least_squares_many(rhs), center, scale)
+
+
+def helper_expand_polynomial(coefficients: List[float], center: float,
+                             scale: float) -> List[float]:
+    """Return the coefficients in x, in increasing degree, of the polynomial
+    sum(coefficients[k] * ((x - center) / scale) ** k)
+
+    >>> helper_expand_polynomial([1.0, 2.0, 1.0], 1.0, 2.0)
+    [0.25, 0.5, 0.25]
+    """
+    # Horner's rule in the variable (x - center) / scale, on coefficient lists in x
+    expanded = [0.0] * len(coefficients)
+    for coefficient in reversed(coefficients):
+        shifted = [0.0] * len(coefficients)
+        for j in range(len(coefficients)):
+            if expanded[j] != 0:
+                shifted[j] -= expanded[j] * center / scale
+                if j + 1 < len(coefficients):
+                    shifted[j + 1] += expanded[j] / scale
+        shifted[0] += coefficient
+        expanded = shifted
+    return expanded
 
 
 def exponential_regression(x_val: List[float], y_val: List[float]) -> List[float]:
@@ -159,7 +237,7 @@ def exponential_regression(x_val: List[float], y_val: List[float]) -> List[float
 
     >>> exponential_regression([1985, 1990, 1995, 2000, 2005, 2010, 2015] ,\
         [56593071, 56719240, 56844303, 56942108, 57969485, 59277417, 61336387])
-    [1.0024980484455097, 394317.0737279723]
+    [1.002498048445548, 394317.0736980098]
     """
     valids = [log(y) for y in y_val if y != 0]
     place_avg = sum(valids) / len(valids)
@@ -175,6 +253,537 @@ def exponential_regression(x_val: List[float], y_val: List[float]) -> List[float
     return [pow(10, coefficients[1]), pow(10, coefficients[0])]
 
 
+def batch_polynomial_regression(deg: int, x_val: Sequence[float],
+                                y_stack: Sequence[Sequence[float]],
+                                masks: Optional[Sequence[Sequence[bool]]] = None) \
+        -> Tuple[List[List[float]], List[float]]:
+    """
+    Fit a polynomial of degree deg to every series of y_stack against the shared
+    x-values x_val, in one call
+
+    Returns the table of the coefficients of every series (in increasing degree, as in
+    polynomial_regression) and the R squared value of every series.
+
+    A point of a series is left out of its fit if its value is NaN, or if the series'
+    mask is given and is False at that point. A series with fewer than deg + 1 points
+    left gets NaN coefficients and R squared.
+
+    The powers of x (centered and scaled as in fit_polynomial) are computed once for the
+    whole stack, and the normal equations of the series with no missing point are shared
+    and factorized once; each series only adds its weighted sums of y, each computed by
+    one reduction over the series.
+
+    Preconditions:
+        - deg > 0
+        - all(len(y) == len(x_val) for y in y_stack)
+        - masks is None or len(masks) == len(y_stack)
+
+    >>> nan = float('nan')
+    >>> coefficients, r_squared = batch_polynomial_regression(1, [1.0, 2.0, 3.0, 4.0],
+    ...     [[2.0, 4.0, 6.0, 8.0], [1.0, nan, 3.0, 4.0], [5.0, 5.0, 0.0, 0.0]],
+    ...     [[True] * 4, [True] * 4, [True, True, False, False]])
+    >>> [[round(c, 6) for c in row] for row in coefficients[:2]], r_squared[:2]
+    ([[0.0, 2.0], [0.0, 1.0]], [1.0, 1.0])
+    >>> coefficients[2], r_squared[2]
+    ([5.0, 0.0], nan)
+    >>> batch_polynomial_regression(1, [1.0, 2.0], [[1.0, nan]])
+    ([[nan, nan]], [nan])
+    """
+    n_terms = deg + 1
+    center = sum(x_val) / len(x_val)
+    scale = max(abs(x - center) for x in x_val)
+    if scale == 0:
+        scale = 1.0
+    scaled = [(x - center) / scale for x in x_val]
+    x_pows = [[1.0] * len(x_val)]
+    for _ in range(2 * deg):
+        x_pows.append(list(map(mul, x_pows[-1], scaled)))
+    full_moments = [sum(x_pow) for x_pow in x_pows]
+
+    # the normal equations of the series with no missing point, factorized once
+    full_matrix = Matrix(n_terms, n_terms)
+    full_matrix.set_matrix([[full_moments[row + column] for column in range(n_terms)]
+                            for row in range(n_terms)])
+
+    coefficients, r_squared = [], []
+    for s in range(len(y_stack)):
+        y_list = list(y_stack[s])
+        keep = [i for i in range(len(y_list)) if not isnan(y_list[i])
+                and (masks is None or masks[s][i])]
+        if len(keep) < n_terms:
+            coefficients.append([float('nan')] * n_terms)
+            r_squared.append(float('nan'))
+            continue
+
+        if len(keep) == len(y_list):
+            matrix_r, pows = full_matrix, x_pows
+        else:
+            y_list = [y_list[i] for i in keep]
+            pows = [[x_pow[i] for i in keep] for x_pow in x_pows]
+            moments = [sum(x_pow) for x_pow in pows]
+            matrix_r = Matrix(n_terms, n_terms)
+            matrix_r.set_matrix([[moments[row + column] for column in range(n_terms)]
+                                 for row in range(n_terms)])
+        constant_vec = [sum(map(mul, pows[row], y_list)) for row in range(n_terms)]
+        fit = matrix_r.solve(constant_vec)
+        coefficients.append(helper_expand_polynomial(fit, center, scale))
+        r_squared.append(helper_r_squared(pows[1], y_list, fit))
+
+    return (coefficients, r_squared)
+
+
+def batch_linear_regression(x_val: Sequence[float], y_stack: Sequence[Sequence[float]],
+                            masks: Optional[Sequence[Sequence[bool]]] = None) \
+        -> Tuple[List[List[float]], List[float]]:
+    """
+    Fit a line y = a + bx to every series of y_stack, as in batch_polynomial_regression
+
+    Returns the table of the [a, b] of every series and the R squared value of every series.
+
+    >>> batch_linear_regression([10.0, 20.0, 30.0], [[3.0, 6.0, 12.0], [1.0, 2.0, 3.0]])[0]
+    [[-2.0, 0.45], [0.0, 0.1]]
+    """
+    return batch_polynomial_regression(1, x_val, y_stack, masks)
+
+
+def batch_exponential_regression(x_val: Sequence[float], y_stack: Sequence[Sequence[float]],
+                                 masks: Optional[Sequence[Sequence[bool]]] = None) \
+        -> Tuple[List[List[float]], List[float]]:
+    """
+    Fit an exponential function y = b * a^x to every series of y_stack, as in
+    batch_polynomial_regression
+
+    Returns the table of the [a, b] of every series (as in exponential_regression) and the
+    R squared value of the fit of the base 10 logarithm of every series. As in
+    PrefixSums.exponential_fit, a value that is not positive (or NaN) is left out of the
+    fit of its series, so the fit of a series agrees with the fit of its window.
+
+    >>> table = batch_exponential_regression([0.0, 1.0, 2.0, 3.0],
+    ...     [[1.0, 10.0, 100.0, 1000.0], [1.0, 0.0, -5.0, 1000.0]])
+    >>> [[round(c, 6) for c in row] for row in table[0]], table[1]
+    ([[10.0, 1.0], [10.0, 1.0]], [1.0, 1.0])
+    """
+    log_stack = [[log(y, 10) if y > 0 else float('nan') for y in series]
+                 for series in y_stack]
+
+    coefficients, r_squared = batch_polynomial_regression(1, x_val, log_stack, masks)
+    return ([[pow(10, c[1]), pow(10, c[0])] for c in coefficients], r_squared)
+
+
+def helper_r_squared(x_val: List[float], y_val: List[float], coefficients: List[float]) \
+        -> float:
+    """Return the R squared value of the polynomial with the given coefficients (in
+    increasing degree) as a model of the points (x_val[i], y_val[i]). Returns NaN if
+    the y-values are all equal.
+
+    >>> helper_r_squared([1.0, 2.0, 3.0], [1.0, 2.0, 4.0], [0.0, 1.0])
+    0.7857142857142857
+    """
+    y_bar = sum(y_val) / len(y_val)
+    s_tot = sum([(y - y_bar) ** 2 for y in y_val])
+    if s_tot == 0:
+        return float('nan')
+    s_res = 0.0
+    for i in range(len(x_val)):
+        predicted = 0.0
+        for coefficient in reversed(coefficients):
+            predicted = predicted * x_val[i] + coefficient
+        s_res += (y_val[i] - predicted) ** 2
+    return 1 - s_res / s_tot
+
+
+class PrefixSums:
+    """
+    Prefix sums of the powers of x, of the powers of x times y and of the powers of x
+    times log10(y) of a series of points, so that the linear, polynomial and exponential
+    regressions of a window of consecutive points take constant time (in the number of
+    points) instead of a pass over the window.
+
+    x is centered and scaled over the whole series (as in fit_polynomial) before its
+    powers are summed. The sums of a window are the differences of two prefix sums, and
+    they are re-centered on the middle of the window (a binomial shift) before the
+    normal equations are solved. The differences lose digits when the window only spans
+    a small part of the x-values of the series, so a window narrower than
+    MIN_WINDOW_FRACTION of them is refitted from its points instead (a short window
+    being cheap to refit).
+
+    Fits are returned as (coefficients, center, scale), as by fit_polynomial, and are
+    evaluated with evaluate_polynomial.
+
+    Instance Attributes:
+        - max_deg: the highest degree of polynomial that can be fitted
+        - x_val: the x-values of the points
+        - y_val: the y-values of the points
+        - center: the center of the x-values
+        - scale: the scale of the x-values
+        - power_sums: the prefix sums of t^k for k = 0 to 2 * max_deg, where
+          t = (x - center) / scale; power_sums[k][i] is the sum over the first i points
+        - weighted_sums: the prefix sums of t^k * y for k = 0 to max_deg
+        - log_power_sums: the prefix sums of t^k for k = 0 to 2, over the points with y > 0
+        - log_weighted_sums: the prefix sums of t^k * log10(y) for k = 0 and 1, over the
+          points with y > 0
+
+    Representation Invariants:
+        - self.max_deg >= 1
+        - len(self.x_val) == len(self.y_val)
+        - self.x_val == sorted(self.x_val)
+        - len(self.power_sums) == 2 * self.max_deg + 1
+        - len(self.weighted_sums) == self.max_deg + 1
+
+    >>> x = [1985, 1990, 1995, 2000, 2005, 2010, 2015]
+    >>> y = [116576, 130482, 145562, 155328, 158401, 159440, 167543]
+    >>> sums = PrefixSums(x, y)
+    >>> [round(c, 4) for c in sums.polynomial(1, 0, 7)]
+    [-3047466.8571, 1597.5429]
+    >>> [round(c, 2) for c in sums.polynomial(2, 2, 6)]
+    [-351586350.85, 350410.49, -87.27]
+    >>> [round(c, 2) for c in polynomial_regression(2, x[2:6], y[2:6])]
+    [-351586350.85, 350410.49, -87.27]
+
+    A short window at the end of a long series gives the fit of its own points:
+
+    >>> import random
+    >>> noise = random.Random(0)
+    >>> x = list(range(8760))
+    >>> y = [30 + (i % 500) / 50 + noise.gauss(0, 3) for i in x]
+    >>> sums = PrefixSums(x, y)
+    >>> fit = sums.polynomial(2, 8736, 8760)
+    >>> expected = polynomial_regression(2, x[8736:8760], y[8736:8760])
+    >>> all(abs(fit[k] - expected[k]) <= 1e-9 * abs(expected[k]) for k in range(3))
+    True
+    >>> fit = sums.fit(2, 2000, 8760)
+    >>> expected = fit_polynomial(2, x[2000:8760], y[2000:8760])
+    >>> abs(evaluate_polynomial(fit, 8000) - evaluate_polynomial(expected, 8000)) < 1e-9
+    True
+    """
+    max_deg: int
+    x_val: List[float]
+    y_val: List[float]
+    center: float
+    scale: float
+    power_sums: List[List[float]]
+    weighted_sums: List[List[float]]
+    log_power_sums: List[List[float]]
+    log_weighted_sums: List[List[float]]
+
+    def __init__(self, x_val: Sequence[float], y_val: Sequence[float], max_deg: int = 2) -> None:
+        self.max_deg = max_deg
+        self.x_val = [float(x) for x in x_val]
+        self.y_val = [float(y) for y in y_val]
+        self.center = sum(x_val) / len(x_val) if len(x_val) > 0 else 0.0
+        self.scale = max([abs(x - self.center) for x in x_val], default=0.0)
+        if self.scale == 0:
+            self.scale = 1.0
+        scaled = [(x - self.center) / self.scale for x in x_val]
+
+        powers = [[1.0] * len(scaled)]
+        for _ in range(2 * max_deg):
+            powers.append(list(map(mul, powers[-1], scaled)))
+        self.power_sums = [helper_prefix(power) for power in powers]
+        self.weighted_sums = [helper_prefix(map(mul, powers[k], y_val))
+                              for k in range(max_deg + 1)]
+
+        positive = [1.0 if y > 0 else 0.0 for y in y_val]
+        logs = [log(y, 10) if y > 0 else 0.0 for y in y_val]
+        self.log_power_sums = [helper_prefix(map(mul, powers[k], positive)) for k in range(3)]
+        self.log_weighted_sums = [helper_prefix(map(mul, powers[k], logs)) for k in range(2)]
+
+    def fit(self, deg: int, start: int, end: int) -> Tuple[List[float], float, float]:
+        """Return the polynomial of degree deg that best fits the points start to end - 1,
+        as (coefficients, center, scale) (see fit_polynomial)
+
+        Preconditions:
+            - 1 <= deg <= self.max_deg
+            - 0 <= start and end - start > deg
+        """
+        if self.helper_is_narrow(start, end):
+            return fit_polynomial(deg, self.x_val[start: end], self.y_val[start: end])
+        return self.helper_window_fit(self.power_sums, self.weighted_sums, deg, start, end)
+
+    def exponential_fit(self, start: int, end: int) \
+            -> Optional[Tuple[List[float], float, float]]:
+        """Return the line that best fits log10(y) of the points start to end - 1 with
+        y > 0, as (coefficients, center, scale): the exponential function is
+        10 ** evaluate_polynomial(fit, x). Return None if fewer than 2 of these points
+        have distinct x (e.g. a window of anomalies that are mostly negative).
+
+        Preconditions:
+            - 0 <= start
+
+        >>> sums = PrefixSums([1, 2, 3, 4], [-1.0, 2.0, -3.0, 8.0])
+        >>> [round(c, 4) for c in helper_expand_polynomial(*sums.exponential_fit(0, 4))]
+        [-0.301, 0.301]
+        >>> sums.exponential_fit(0, 3) is None
+        True
+        >>> PrefixSums([1, 1, 2], [2.0, 3.0, -1.0]).exponential_fit(0, 3) is None
+        True
+        """
+        if self.log_power_sums[0][end] - self.log_power_sums[0][start] < 2:
+            return None
+        first = next(i for i in range(start, end) if self.y_val[i] > 0)
+        last = next(i for i in range(end - 1, start - 1, -1) if self.y_val[i] > 0)
+        if self.x_val[first] == self.x_val[last]:
+            return None
+        if self.helper_is_narrow(start, end):
+            positive = [i for i in range(first, last + 1) if self.y_val[i] > 0]
+            return fit_polynomial(1, [self.x_val[i] for i in positive],
+                                  [log(self.y_val[i], 10) for i in positive])
+        return self.helper_window_fit(self.log_power_sums, self.log_weighted_sums, 1,
+                                      start, end)
+
+    def polynomial(self, deg: int, start: int, end: int) -> List[float]:
+        """Return the coefficients in x (in increasing degree, as in polynomial_regression)
+        of the polynomial of degree deg that best fits the points start to end - 1
+
+        Preconditions:
+            - 1 <= deg <= self.max_deg
+            - 0 <= start and end - start > deg
+        """
+        return helper_expand_polynomial(*self.fit(deg, start, end))
+
+    def linear(self, start: int, end: int) -> Tuple[float, float]:
+        """Return the (a, b) of the line y = a + bx that best fits the points start to
+        end - 1, as in simple_linear_regression
+
+        Preconditions:
+            - 0 <= start and end - start > 1
+        """
+        coefficients = self.polynomial(1, start, end)
+        return (coefficients[0], coefficients[1])
+
+    def exponential(self, start: int, end: int) -> List[float]:
+        """Return the [a, b] of the exponential function y = b * a^x that best fits the
+        points start to end - 1 with y > 0, as in exponential_regression
+
+        Preconditions:
+            - 0 <= start
+            - at least 2 of the points start to end - 1 have distinct x and y > 0
+        """
+        fit = self.exponential_fit(start, end)
+        assert fit is not None
+        coefficients = helper_expand_polynomial(*fit)
+        return [pow(10, coefficients[1]), pow(10, coefficients[0])]
+
+    def helper_is_narrow(self, start: int, end: int) -> bool:
+        """Return whether the x-values of the points start to end - 1 span less than
+        MIN_WINDOW_FRACTION of the x-values of the series"""
+        span = self.x_val[-1] - self.x_val[0]
+        return span == 0 or self.x_val[end - 1] - self.x_val[start] < MIN_WINDOW_FRACTION * span
+
+    def helper_window_fit(self, power_sums: List[List[float]],
+                          weighted_sums: List[List[float]], deg: int, start: int,
+                          end: int) -> Tuple[List[float], float, float]:
+        """Return the least squares polynomial of degree deg of the points start to
+        end - 1 from the given prefix sums, re-centered on the middle of the window"""
+        low = (self.x_val[start] - self.center) / self.scale
+        high = (self.x_val[end - 1] - self.center) / self.scale
+        middle = (low + high) / 2
+        half = abs(high - low) / 2
+        moments = helper_shift_moments([sums[end] - sums[start] for sums in power_sums],
+                                       middle, half)
+        weighted = helper_shift_moments([sums[end] - sums[start] for sums in weighted_sums],
+                                        middle, half)
+        matrix_r = Matrix(deg + 1, deg + 1)
+        matrix_r.set_matrix([[moments[row + column] for column in range(deg + 1)]
+                             for row in range(deg + 1)])
+        return (matrix_r.solve(weighted[:deg + 1]), self.center + middle * self.scale,
+                half * self.scale)
+
+
+def helper_shift_moments(moments: List[float], middle: float, half: float) -> List[float]:
+    """Return the sums of u^k (or of u^k * y) given the sums of t^k (or of t^k * y), where
+    u = (t - middle) / half, by the binomial theorem
+
+    >>> helper_shift_moments([3.0, 6.0, 14.0], 2.0, 1.0)  # t = 1, 2, 3
+    [3.0, 0.0, 2.0]
+    """
+    shifted = []
+    for k in range(len(moments)):
+        total = sum(comb(k, j) * moments[j] * (-middle) ** (k - j) for j in range(k + 1))
+        shifted.append(total / half ** k)
+    return shifted
+
+
+def evaluate_polynomial(fit: Tuple[List[float], float, float], x: float) -> float:
+    """Return the value at x of a polynomial given as (coefficients, center, scale), as
+    returned by fit_polynomial, by Horner's rule in the variable (x - center) / scale
+
+    >>> evaluate_polynomial(([2.0, 2.0, 1.0], 2001.0, 1.0), 2003.0)
+    10.0
+    """
+    (coefficients, center, scale) = fit
+    t = (x - center) / scale
+    value = 0.0
+    for coefficient in reversed(coefficients):
+        value = value * t + coefficient
+    return value
+
+
+def helper_prefix(values: Iterable[float]) -> List[float]:
+    """Return the prefix sums of values, starting with 0
+
+    >>> helper_prefix([1.0, 2.0, 3.0])
+    [0.0, 1.0, 3.0, 6.0]
+    """
+    return list(accumulate(values, initial=0.0))
+
+
+class RunningStats:
+    """
+    Summary statistics of a stream of values, updated one value or one chunk of values at
+    a time without keeping the values (Welford's algorithm). Two RunningStats of separate
+    streams, e.g. of two files or two worker processes, merge into the RunningStats of
+    both streams. NaN values (missing readings) are skipped.
+
+    Instance Attributes:
+        - count: the number of values seen
+        - mean: the mean of the values seen (NaN if there are none)
+        - m2: the sum of the squared differences between the values seen and their mean
+        - minimum: the lowest value seen (inf if there are none)
+        - maximum: the highest value seen (-inf if there are none)
+
+    Representation Invariants:
+        - self.count >= 0
+        - self.m2 >= 0
+
+    >>> first, second = RunningStats(), RunningStats()
+    >>> first.update_many([10.0, 12.0, 23.0, 23.0])
+    >>> for value in [16.0, 23.0, float('nan'), 21.0, 16.0]:
+    ...     second.update(value)
+    >>> first.merge(second)
+    >>> first.count, first.mean, first.minimum, first.maximum
+    (8, 18.0, 10.0, 23.0)
+    >>> round(first.standard_deviation(), 9)
+    5.237229366
+    """
+    count: int
+    mean: float
+    m2: float
+    minimum: float
+    maximum: float
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.mean = float('nan')
+        self.m2 = 0.0
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+
+    def update(self, value: float) -> None:
+        """Add value to the values seen"""
+        if isnan(value):
+            return
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+        else:
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def update_many(self, values: Iterable[float]) -> None:
+        """Add a chunk of values to the values seen. The chunk is summarized on its own
+        (two passes over the chunk) and merged in, which is faster and as accurate as
+        adding its values one at a time."""
+        chunk = [value for value in values if not isnan(value)]
+        if chunk == []:
+            return
+        other = RunningStats()
+        other.count = len(chunk)
+        other.mean = sum(chunk) / len(chunk)
+        other.m2 = sum([(value - other.mean) ** 2 for value in chunk])
+        other.minimum = min(chunk)
+        other.maximum = max(chunk)
+        self.merge(other)
+
+    def merge(self, other: 'RunningStats') -> None:
+        """Add the values seen by other to the values seen (Chan et al.'s formula)"""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.minimum, self.maximum = other.minimum, other.maximum
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def variance(self) -> float:
+        """Return the sample variance of the values seen (NaN if there are fewer than 2)"""
+        if self.count < 2:
+            return float('nan')
+        return self.m2 / (self.count - 1)
+
+    def standard_deviation(self) -> float:
+        """Return the sample standard deviation of the values seen"""
+        return sqrt(self.variance())
+
+    def relative_standard_deviation(self) -> float:
+        """Return the sample standard deviation of the values seen as a percentage of
+        their mean"""
+        return (self.standard_deviation() / self.mean) * 100
+
+
+class TopK:
+    """
+    The k highest values of a stream of values, exactly, in a min-heap of k values. Two
+    TopK of separate streams merge into the TopK of both streams. NaN values are skipped.
+
+    Instance Attributes:
+        - k: the number of highest values kept
+        - heap: the highest values seen, as a min-heap (heap[0] is the lowest of them)
+
+    Representation Invariants:
+        - self.k > 0
+        - len(self.heap) <= self.k
+
+    >>> top = TopK(3)
+    >>> top.update_many([5.0, 1.0, 9.0, float('nan'), 7.0, 3.0])
+    >>> top.values(), top.kth()
+    ([9.0, 7.0, 5.0], 5.0)
+    >>> TopK(4).kth()
+    nan
+    """
+    k: int
+    heap: List[float]
+
+    def __init__(self, k: int) -> None:
+        self.k = k
+        self.heap = []
+
+    def update(self, value: float) -> None:
+        """Add value to the values seen"""
+        if isnan(value):
+            return
+        if len(self.heap) < self.k:
+            heappush(self.heap, value)
+        elif value > self.heap[0]:
+            heappushpop(self.heap, value)
+
+    def update_many(self, values: Iterable[float]) -> None:
+        """Add a chunk of values to the values seen"""
+        for value in values:
+            self.update(value)
+
+    def merge(self, other: 'TopK') -> None:
+        """Add the values seen by other to the values seen"""
+        self.update_many(other.heap)
+
+    def values(self) -> List[float]:
+        """Return the highest values seen, from the highest"""
+        return sorted(self.heap, reverse=True)
+
+    def kth(self) -> float:
+        """Return the k-th highest value seen, or NaN if fewer than k values were seen"""
+        return self.heap[0] if len(self.heap) == self.k else float('nan')
+
+
 def standard_deviation(points: Tuple[List[float], List[float]]) -> float:
     """Return the standard deviation of a sample of data passed in as a tuple of floats.
 
@@ -187,21 +796,15 @@ def standard_deviation(points: Tuple[List[float], List[float]]) -> float:
     >>> points = ([1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0], [10.0, 12.0, 23.0, 23.0, 16.0, 23.0, 21.0, 16.0])
     >>> standard_deviation(points)
     5.237229365663817
-    """
-    x_coords, y_coords = points[0], points[1]
 
-    # Finding the mean of the y values in the data set:
-    mean = sum(y_coords) / len(x_coords)
+    The y values are accumulated in one pass by a RunningStats.
 
-    # Calculating the sum of the square of every y value minus the mean y value
-    total = 0
-    for y in y_coords:
-        total = total + ((y - mean) ** 2)
-
-    # Dividing the total by the number of x values minus 1 and then taking the square root
-    standard_dev = sqrt(total / (len(x_coords) - 1))
-
-    return standard_dev
+    >>> standard_deviation(([1.0], [3.0]))
+    nan
+    """
+    stats = RunningStats()
+    stats.update_many(points[1])
+    return stats.standard_deviation()
 
 
 def relative_standard_deviation(points: Tuple[List[float], List[float]]) -> float:
@@ -217,18 +820,9 @@ def relative_standard_deviation(points: Tuple[List[float], List[float]]) -> floa
     >>> relative_standard_deviation(points)
     29.095718698132316
     """
-    x_coords, y_coords = points[0], points[1]
-
-    # Finding the mean of the y values in the sample data set:
-    mean = sum(y_coords) / len(x_coords)
-
-    # Calculating the standard deviation of a sample size:
-    standard_dev = standard_deviation(points)
-
-    # Determining the percentage of the standard deviation by the mean
-    rel_standard_dev = (standard_dev / mean) * 100
-
-    return rel_standard_dev
+    stats = RunningStats()
+    stats.update_many(points[1])
+    return stats.relative_standard_deviation()
 
 
 def gen_points_matching_date(data1: Tuple[List[Any], List[float]],
@@ -238,6 +832,7 @@ def gen_points_matching_date(data1: Tuple[List[Any], List[float]],
 
     NOTE: data1 y-values become the x-values, and data2 y-values become the y-values
     NOTE: x-values are sorted in ascending order for the plotting software
+    NOTE: the dates are matched with join_series, in linear time
 
     Preconditions:
         - len(data1) > 0 and len(data2) > 0
@@ -245,26 +840,149 @@ def gen_points_matching_date(data1: Tuple[List[Any], List[float]],
 
     >>> gen_points_matching_date((['a', 'b', 'd'], [1, 2, 3]), (['a', 'b', 'c'], [4, 5, 6]))
     ([1, 2], [4, 5])
+    >>> gen_points_matching_date((['a'], [1]), (['b'], [2]))
+    ([], [])
     """
-    x_cor, y_cor = [], []
-    for i in range(len(data1[0])):
-        date = data1[0][i]
-        for j in range(len(data2[0])):
-            other_date = data2[0][j]
-            if date == other_date:
-                x_cor.append(int(data1[1][i]))
-                y_cor.append(int(data2[1][j]))
+    (_, values1, values2) = join_series(data1, data2)
+    x_cor = [int(value) for value in values1]
+    y_cor = [int(value) for value in values2]
+    if x_cor == []:
+        return ([], [])
     zippy = zip(x_cor, y_cor)
     x_cor, y_cor = [list(a) for a in zip(*sorted(zippy))]
 
     return (x_cor, y_cor)
 
 
+def join_series(data1: Tuple[List[Any], List[Any]], data2: Tuple[List[Any], List[Any]],
+                how: str = 'inner') -> Tuple[List[Any], List[Any], List[Any]]:
+    """Return the (keys, values of data1, values of data2) of the rows of data1 and data2
+    with matching keys (e.g. dates), where each series is a tuple (keys, values).
+
+    With how == 'inner' only the keys in both series are kept; 'left' also keeps the keys
+    only in data1 and 'outer' the keys only in either series, with None as the missing
+    value. A key repeated in both series gives every pair of their values.
+
+    Rows come in the order of data1, then (for 'outer') the unmatched rows of data2 in
+    their order. When both series have sorted keys, this is the order of the keys.
+
+    Preconditions:
+        - how in JOIN_MODES
+        - len(data1[0]) == len(data1[1]) and len(data2[0]) == len(data2[1])
+
+    >>> a = (['0101', '0103', '0104'], [35, 34, 36])
+    >>> b = (['0101', '0102', '0103'], [4, 5, 6])
+    >>> join_series(a, b)
+    (['0101', '0103'], [35, 34], [4, 6])
+    >>> join_series(a, b, 'outer')
+    (['0101', '0102', '0103', '0104'], [35, None, 34, 36], [4, 5, 6, None])
+    >>> join_series((['x', 'y'], [1, 2]), (['y', 'x', 'x'], [3, 4, 5]), 'left')
+    (['x', 'x', 'y'], [1, 1, 2], [4, 5, 3])
+    """
+    if helper_is_sorted(data1[0]) and helper_is_sorted(data2[0]):
+        pairs = merge_join(data1[0], data2[0], how)
+    else:
+        pairs = hash_join(data1[0], data2[0], how)
+
+    keys, values1, values2 = [], [], []
+    for (i, j) in pairs:
+        keys.append(data1[0][i] if i != -1 else data2[0][j])
+        values1.append(data1[1][i] if i != -1 else None)
+        values2.append(data2[1][j] if j != -1 else None)
+    return (keys, values1, values2)
+
+
+def merge_join(keys1: List[Any], keys2: List[Any], how: str = 'inner') -> List[Tuple[int, int]]:
+    """Return the (index in keys1, index in keys2) pairs of the matching keys of two sorted
+    key lists, walking both lists once. An unmatched key kept by how (see join_series)
+    gets -1 as its other index.
+
+    Preconditions:
+        - how in JOIN_MODES
+        - keys1 and keys2 are sorted in ascending order
+
+    >>> merge_join([1, 2, 2, 4], [2, 3, 4, 4], 'outer')
+    [(0, -1), (1, 0), (2, 0), (-1, 1), (3, 2), (3, 3)]
+    """
+    pairs = []
+    i, j = 0, 0
+    while i < len(keys1) and j < len(keys2):
+        if keys1[i] < keys2[j]:
+            if how != 'inner':
+                pairs.append((i, -1))
+            i += 1
+        elif keys2[j] < keys1[i]:
+            if how == 'outer':
+                pairs.append((-1, j))
+            j += 1
+        else:
+            # pair the run of equal keys of keys1 with the run of equal keys of keys2
+            end = j
+            while end < len(keys2) and keys2[end] == keys1[i]:
+                end += 1
+            key = keys1[i]
+            while i < len(keys1) and keys1[i] == key:
+                pairs.extend([(i, k) for k in range(j, end)])
+                i += 1
+            j = end
+
+    if how != 'inner':
+        pairs.extend([(k, -1) for k in range(i, len(keys1))])
+    if how == 'outer':
+        pairs.extend([(-1, k) for k in range(j, len(keys2))])
+    return pairs
+
+
+def hash_join(keys1: List[Any], keys2: List[Any], how: str = 'inner') -> List[Tuple[int, int]]:
+    """Return the (index in keys1, index in keys2) pairs of the matching keys of two key
+    lists in any order, by indexing keys2 in a dictionary. An unmatched key kept by how
+    (see join_series) gets -1 as its other index.
+
+    Preconditions:
+        - how in JOIN_MODES
+        - the keys are hashable
+
+    >>> hash_join(['c', 'a', 'b'], ['b', 'd', 'c'], 'outer')
+    [(0, 2), (1, -1), (2, 0), (-1, 1)]
+    """
+    index = {}
+    for j in range(len(keys2)):
+        if keys2[j] not in index:
+            index[keys2[j]] = []
+        index[keys2[j]].append(j)
+
+    pairs = []
+    for i in range(len(keys1)):
+        if keys1[i] in index:
+            pairs.extend([(i, j) for j in index[keys1[i]]])
+        elif how != 'inner':
+            pairs.append((i, -1))
+
+    if how == 'outer':
+        matched = set(keys1)
+        pairs.extend([(-1, j) for j in range(len(keys2)) if keys2[j] not in matched])
+    return pairs
+
+
+def helper_is_sorted(keys: List[Any]) -> bool:
+    """Return whether keys is sorted in ascending order. Keys that cannot be compared are
+    not sorted.
+
+    >>> helper_is_sorted([1, 2, 2, 5]), helper_is_sorted(['b', 'a']), helper_is_sorted([1, 'a'])
+    (True, False, False)
+    """
+    try:
+        return all(keys[i] <= keys[i + 1] for i in range(len(keys) - 1))
+    except TypeError:
+        return False
+
+
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['matrix', 'math', 'python_ta.contracts'],
+        'extra-imports': ['matrix', 'math', 'itertools', 'operator', 'heapq',
+                          'python_ta.contracts'],
         'allowed-io': [],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200'],
@@ -0,0 +1,194 @@
+"""
+Binary sidecar cache for parsed NAPS csv files
+
+The first time a csv file is loaded its parsed columns are written next to it in
+'<file_path>.cache'. Later loads memory-map that file instead of parsing the csv again.
+A cache file is only used when the path, size, modification time and parser version
+of the csv file all match the ones recorded in it.
+
+Cache file layout:
+    - MAGIC
+    - the length of the metadata (4 byte unsigned int)
+    - the metadata as utf-8 json: the key, the DataFile attributes and where each
+      column starts, its array typecode and its length
+    - the columns, one after the other, each starting on an ALIGNMENT byte boundary
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+MAGIC = b'NAPSCOL\n'
+CACHE_SUFFIX = '.cache'
+ALIGNMENT = 8
+LENGTH_FORMAT = '<I'
+
+
+def cache_path(file_path: str) -> str:
+    """Return the path of the cache file of the csv file at file_path
+
+    >>> cache_path('csv_files/O3_2010.csv')
+    'csv_files/O3_2010.csv.cache'
+    """
+    return file_path + CACHE_SUFFIX
+
+
+def cache_key(file_path: str, parser_version: int) -> Dict[str, Any]:
+    """Return the values that must match for a cache file of file_path to be valid
+
+    Preconditions:
+        - os.path.isfile(file_path)
+    """
+    stat = os.stat(file_path)
+    return {'path': os.path.abspath(file_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'parser': parser_version,
+            'byteorder': sys.byteorder}
+
+
+def write_cache(file_path: str, parser_version: int, attributes: Dict[str, Any],
+                columns: Dict[str, memoryview]) -> bool:
+    """Write the parsed attributes and columns of the csv file at file_path to its cache file
+
+    attributes must be json serializable. Returns whether the cache file was written;
+    a cache that cannot be written (e.g. read-only directory) is simply skipped.
+    """
+    layout = {}
+    offset = 0
+    for name in columns:
+        layout[name] = [offset, columns[name].format, len(columns[name])]
+        offset = helper_align(offset + columns[name].nbytes)
+
+    meta = json.dumps({'key': cache_key(file_path, parser_version),
+                       'attributes': attributes,
+                       'columns': layout}).encode('utf-8')
+    data_start = helper_align(len(MAGIC) + struct.calcsize(LENGTH_FORMAT) + len(meta))
+
+    temp_path = cache_path(file_path) + '.tmp'
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(MAGIC)
+            file.write(struct.pack(LENGTH_FORMAT, len(meta)))
+            file.write(meta)
+            for name in columns:
+                file.seek(data_start + layout[name][0])
+                file.write(columns[name].cast('B'))
+            file.truncate(data_start + offset)
+        os.replace(temp_path, cache_path(file_path))
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    return True
+
+
+def read_cache(file_path: str, parser_version: int) \
+        -> Optional[Tuple[Dict[str, Any], Dict[str, memoryview], mmap.mmap]]:
+    """Return the attributes and columns stored in the cache file of file_path, and the
+    memory-map of the cache file, or None if there is no valid cache file for it.
+
+    The columns are read-only views of the memory-map, so nothing is copied until the
+    values are used. Pass the columns and the memory-map to close_cache once they are
+    no longer needed.
+
+    >>> import loading_data
+    >>> first = loading_data.DataFile('doctest_dataset/O3_2019.csv')
+    >>> first.load()
+    >>> attributes, columns, mapped = read_cache(first.file_path,
+    ...                                          loading_data.PARSER_VERSION)
+    >>> attributes['pollutant'], columns['hours'].format
+    ('O3', 'f')
+    >>> columns['hours'].tobytes() == first.hours.tobytes()
+    True
+    >>> close_cache(columns, mapped), mapped.closed
+    (True, True)
+    >>> read_cache(first.file_path, loading_data.PARSER_VERSION - 1) is None
+    True
+
+    A cache file cut short is not used:
+
+    >>> import shutil
+    >>> shutil.copy(first.file_path, 'doctest_dataset/short.csv')
+    'doctest_dataset/short.csv'
+    >>> write_cache('doctest_dataset/short.csv', 0, {}, {'hours': first.hours})
+    True
+    >>> size = os.path.getsize(cache_path('doctest_dataset/short.csv'))
+    >>> os.truncate(cache_path('doctest_dataset/short.csv'), size - 8)
+    >>> read_cache('doctest_dataset/short.csv', 0) is None
+    True
+    >>> os.remove('doctest_dataset/short.csv')
+    >>> os.remove(cache_path('doctest_dataset/short.csv'))
+    """
+    try:
+        with open(cache_path(file_path), 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                return None
+            meta_length = struct.unpack(LENGTH_FORMAT,
+                                        file.read(struct.calcsize(LENGTH_FORMAT)))[0]
+            meta = json.loads(file.read(meta_length).decode('utf-8'))
+            if meta['key'] != cache_key(file_path, parser_version):
+                return None
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return None
+
+    data_start = helper_align(len(MAGIC) + struct.calcsize(LENGTH_FORMAT) + meta_length)
+    buffer = memoryview(mapped)
+    columns = {}
+    try:
+        for name in meta['columns']:
+            start, typecode, length = meta['columns'][name]
+            start += data_start
+            end = start + length * struct.calcsize(typecode)
+            if end > len(buffer):
+                raise ValueError('the cache file is shorter than its columns')
+            columns[name] = buffer[start: end].cast(typecode)
+            if len(columns[name]) != length:
+                raise ValueError('a column of the cache file has the wrong length')
+        attributes = meta['attributes']
+    except (ValueError, KeyError, TypeError, struct.error):
+        buffer.release()
+        close_cache(columns, mapped)
+        return None
+    buffer.release()
+    return (attributes, columns, mapped)
+
+
+def close_cache(columns: Dict[str, memoryview], mapped: mmap.mmap) -> bool:
+    """Release the columns read from a cache file by read_cache and close its
+    memory-map. Returns whether it was closed: it stays open while other views of it
+    (e.g. slices of the columns) are still in use, and is closed when they are all
+    garbage collected."""
+    for column in columns.values():
+        column.release()
+    try:
+        mapped.close()
+    except BufferError:
+        return False
+    return True
+
+
+def helper_align(offset: int) -> int:
+    """Round offset up to the next multiple of ALIGNMENT
+
+    >>> helper_align(0), helper_align(1), helper_align(8)
+    (0, 8, 8)
+    """
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['json', 'mmap', 'os', 'struct', 'sys', 'loading_data'],
+        'allowed-io': ['write_cache', 'read_cache'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
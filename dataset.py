@@ -0,0 +1,187 @@
+"""
+A catalog of the NAPS files in a directory, queried by pollutant, stations, dates and
+resolution
+
+A NAPS file holds one pollutant for one year, and is named <POLLUTANT>_<YEAR>.csv
+(e.g. csv_files/O3_2010.csv). A Dataset only reads the files, and the rows of the files,
+that a query needs.
+
+Every year with both an O3 and an NO2 file also has its hourly Ox (see odd_oxygen), which
+is queried like a pollutant of its own. The O3 stations without NO2 get the Ox of the
+closest NO2 station within ox_radius_km, DEFAULT_RADIUS_KM (25 km) unless another radius
+is given; with None, only stations measuring both pollutants have Ox. NO2 stations
+without O3 have no Ox (see odd_oxygen).
+"""
+import datetime as d
+import os
+from typing import Dict, List, Optional, Tuple
+from loading_data import DataFile, day_to_str
+from odd_oxygen import DEFAULT_RADIUS_KM, OX, OxFile
+
+RESOLUTIONS = ('hourly', 'daily', 'monthly')
+
+
+class Dataset:
+    """
+    The NAPS files of a directory, by pollutant and year. The files are lazy
+    DataFiles: none of them is read until a query needs it.
+
+    Instance Attributes:
+        - directory: the directory of the files
+        - files: the DataFile of every (pollutant, year) in the directory, and the OxFile
+          of every year with both O3 and NO2, pairing stations within ox_radius_km (or
+          only stations with the same code if it is None)
+
+    >>> dataset = Dataset('doctest_dataset')
+    >>> dataset.pollutants(), dataset.years('O3')
+    (['O3'], [2019])
+    >>> series = dataset.query('O3', ['010102'], '20190101', '20190102')
+    >>> series['010102'][1]
+    [31.875, 31.25]
+    >>> [(f.year, code, rows) for f, code, rows in dataset.plan('O3', ['010102'],
+    ...                                                         '20190201', '20190228')]
+    [('2019', '010102', [31, 58])]
+    """
+    directory: str
+    files: Dict[Tuple[str, int], DataFile]
+
+    def __init__(self, directory: str, ox_radius_km: Optional[float] = DEFAULT_RADIUS_KM) \
+            -> None:
+        self.directory = directory
+        self.files = {}
+        for name in sorted(os.listdir(directory)):
+            key = helper_file_key(name)
+            if key is not None:
+                self.files[key] = DataFile(os.path.join(directory, name))
+        for (pollutant, year) in list(self.files):
+            if pollutant == 'O3' and ('NO2', year) in self.files \
+                    and (OX, year) not in self.files:
+                self.files[(OX, year)] = OxFile(self.files[('O3', year)],
+                                                self.files[('NO2', year)], ox_radius_km)
+
+    def pollutants(self) -> List[str]:
+        """Return the pollutants in this dataset, sorted"""
+        return sorted({key[0] for key in self.files})
+
+    def years(self, pollutant: str) -> List[int]:
+        """Return the years of the files of pollutant in this dataset, sorted"""
+        return sorted([key[1] for key in self.files if key[0] == pollutant])
+
+    def plan(self, pollutant: str, stations: Optional[List[str]] = None,
+             start_date: Optional[str] = None, end_date: Optional[str] = None) \
+            -> List[Tuple[DataFile, str, List[int]]]:
+        """Return the (file, station id, [first row, last row]) ranges to read for a query,
+        in date order. Only the files of pollutant overlapping the dates are opened, and
+        only the rows of the stations requested (every station if None) are read.
+
+        Preconditions:
+            - start_date is None or end_date is None or start_date <= end_date
+        """
+        first_year = int(start_date[0:4]) if start_date is not None else -1
+        last_year = int(end_date[0:4]) if end_date is not None else 10000
+        plan = []
+        for year in self.years(pollutant):
+            if not first_year <= year <= last_year:
+                continue
+            data_file = self.files[(pollutant, year)]
+            data_file.ensure_loaded(stations)
+            codes = stations if stations is not None else list(data_file.stations)
+            start = start_date if start_date is not None else str(year) + '0101'
+            end = end_date if end_date is not None else str(year) + '1231'
+            for code in codes:
+                if code in data_file.stations:
+                    plan.append((data_file, code, data_file.get_row_range(code, start, end)))
+        return plan
+
+    def query(self, pollutant: str, stations: Optional[List[str]] = None,
+              start_date: Optional[str] = None, end_date: Optional[str] = None,
+              resolution: str = 'daily') -> Dict[str, Tuple[List[d.datetime], List[float]]]:
+        """Return the (x-coordinates, y-coordinates) of pollutant for every station in
+        stations (every station if None), between start_date and end_date (INCLUSIVE,
+        formatted as 'YYYYMMDD'), at the given resolution.
+
+        Monthly values are the averages of the daily averages of each month, with the
+        first day of the month as x-coordinate.
+
+        Preconditions:
+            - resolution in RESOLUTIONS
+        """
+        series = {}
+        for data_file, code, [first, last] in self.plan(pollutant, stations,
+                                                       start_date, end_date):
+            if last < first:
+                continue
+            start = day_to_str(data_file.row_date[first])
+            end = day_to_str(data_file.row_date[last])
+            if resolution == 'hourly':
+                _, x_cor, y_cor = data_file.return_plot_hourly(code, start, end)
+            else:
+                _, x_cor, y_cor = data_file.return_plot_daily(code, start, end)
+            if code not in series:
+                series[code] = ([], [])
+            series[code][0].extend(x_cor)
+            series[code][1].extend(y_cor)
+
+        if resolution == 'monthly':
+            for code in series:
+                series[code] = helper_monthly(series[code][0], series[code][1])
+        return series
+
+
+def helper_monthly(x_cor: List[d.datetime], y_cor: List[float]) \
+        -> Tuple[List[d.datetime], List[float]]:
+    """Return the average of the values of each month of a date-sorted daily series
+
+    >>> days = [d.datetime(2019, 1, 30), d.datetime(2019, 1, 31), d.datetime(2019, 2, 1)]
+    >>> helper_monthly(days, [1.0, 2.0, 4.0])
+    ([datetime.datetime(2019, 1, 1, 0, 0), datetime.datetime(2019, 2, 1, 0, 0)], [1.5, 4.0])
+    """
+    months, averages = [], []
+    total, count = 0.0, 0
+    for i in range(len(x_cor)):
+        month = d.datetime(x_cor[i].year, x_cor[i].month, 1)
+        if months == [] or months[-1] != month:
+            if count > 0:
+                averages.append(total / count)
+            months.append(month)
+            total, count = 0.0, 0
+        total += y_cor[i]
+        count += 1
+    if count > 0:
+        averages.append(total / count)
+    return (months, averages)
+
+
+def helper_file_key(name: str) -> Optional[Tuple[str, int]]:
+    """Return the (pollutant, year) of a NAPS file name, or None if it isn't one
+
+    >>> helper_file_key('O3_2010.csv'), helper_file_key('PM25_1999.csv')
+    (('O3', 2010), ('PM25', 1999))
+    >>> helper_file_key('O3_2010.csv.cache') is None
+    True
+    """
+    if not name.lower().endswith('.csv'):
+        return None
+    parts = name[:-4].rsplit('_', 1)
+    if len(parts) != 2 or not parts[1].isdigit() or len(parts[1]) != 4:
+        return None
+    return (parts[0], int(parts[1]))
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['datetime', 'os', 'typing', 'loading_data', 'odd_oxygen'],
+        'allowed-io': ['__init__'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
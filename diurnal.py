@@ -0,0 +1,227 @@
+"""
+Diurnal and weekly cycles of a station: its hourly readings by season, weekday or weekend
+and hour of the day
+
+A NAPS row already holds the 24 hourly readings of a station for a day, so the profiles
+are a reduction over the rows: every valid reading goes to the group of its season and
+type of day, at its hour. The groups are collected in one pass over the rows, and sorted
+once, the first time an order statistic (median or percentile) is asked for.
+
+Seasons are meteorological: winter is December to February, spring March to May, summer
+June to August and autumn September to November. Weekends are Saturdays and Sundays.
+Comparing the weekday and weekend profiles of O3 shows the weekend effect: the lower NO
+emissions of weekends leave more O3.
+"""
+import datetime as d
+from heapq import merge
+from typing import Dict, List, Optional
+from dataset import Dataset
+from loading_data import DataFile
+from naps_parser import ALL_VALID, HOURS_PER_DAY
+
+SEASONS = ('winter', 'spring', 'summer', 'autumn')
+DAY_TYPES = ('weekday', 'weekend')
+# the season of every month, from January
+SEASON_OF_MONTH = (0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0)
+
+
+class DiurnalCube:
+    """
+    The valid hourly readings of a station by season, type of day and hour of the day
+
+    Profiles are lists of HOURS_PER_DAY values, the first one for H01, with NaN at the
+    hours without readings. A season or day type of None takes every season or day type.
+
+    Instance Attributes:
+        - groups: the readings of every season and day type, at index
+          season * len(DAY_TYPES) + day type, by hour of the day
+        - ordered: whether the readings of every group and hour are sorted
+
+    Representation Invariants:
+        - len(self.groups) == len(SEASONS) * len(DAY_TYPES)
+        - all(len(group) == HOURS_PER_DAY for group in self.groups)
+    """
+    groups: List[List[List[float]]]
+    ordered: bool
+
+    def __init__(self) -> None:
+        self.groups = [[[] for _ in range(HOURS_PER_DAY)]
+                       for _ in range(len(SEASONS) * len(DAY_TYPES))]
+        self.ordered = True
+
+    def add_rows(self, data_file: DataFile, first: int, last: int) -> None:
+        """Add the valid readings of the rows first to last (INCLUSIVE) of data_file
+
+        Preconditions:
+            - 0 <= first and last < data_file.num_rows()
+        """
+        groups = {}
+        readings = data_file.hours
+        for row in range(first, last + 1):
+            valid = data_file.row_valid[row]
+            if valid == 0:
+                continue
+            day = data_file.row_date[row]
+            if day not in groups:
+                groups[day] = self.groups[helper_group(day)]
+            group = groups[day]
+            values = readings[row * HOURS_PER_DAY: (row + 1) * HOURS_PER_DAY].tolist()
+            for hour in range(HOURS_PER_DAY):
+                if valid == ALL_VALID or valid >> hour & 1:
+                    group[hour].append(values[hour])
+        self.ordered = False
+
+    def counts(self, season: Optional[str] = None,
+               day_type: Optional[str] = None) -> List[int]:
+        """Return the number of readings at every hour of the day"""
+        return [sum(len(self.groups[g][hour]) for g in helper_groups(season, day_type))
+                for hour in range(HOURS_PER_DAY)]
+
+    def mean(self, season: Optional[str] = None,
+             day_type: Optional[str] = None) -> List[float]:
+        """Return the mean profile
+
+        >>> cube = DiurnalCube()
+        >>> cube.groups[0][0].extend([1.0, 2.0])
+        >>> cube.groups[1][0].append(6.0)
+        >>> cube.mean('winter')[:2]
+        [3.0, nan]
+        """
+        profile = []
+        for hour in range(HOURS_PER_DAY):
+            total, count = 0.0, 0
+            for g in helper_groups(season, day_type):
+                total += sum(self.groups[g][hour])
+                count += len(self.groups[g][hour])
+            profile.append(total / count if count > 0 else float('nan'))
+        return profile
+
+    def median(self, season: Optional[str] = None,
+               day_type: Optional[str] = None) -> List[float]:
+        """Return the median profile"""
+        return self.percentile(50.0, season, day_type)
+
+    def percentile(self, q: float, season: Optional[str] = None,
+                   day_type: Optional[str] = None) -> List[float]:
+        """Return the q-th percentile profile, interpolating linearly between readings
+
+        Preconditions:
+            - 0 <= q <= 100
+
+        >>> cube = DiurnalCube()
+        >>> cube.groups[4][0].extend([4.0, 1.0])
+        >>> cube.groups[5][0].extend([3.0, 2.0])
+        >>> cube.ordered = False
+        >>> cube.percentile(25.0, 'summer')[0], cube.median('summer', 'weekday')[0]
+        (1.75, 2.5)
+        """
+        if not self.ordered:
+            for group in self.groups:
+                for values in group:
+                    values.sort()
+            self.ordered = True
+        profile = []
+        for hour in range(HOURS_PER_DAY):
+            chosen = [self.groups[g][hour] for g in helper_groups(season, day_type)]
+            values = chosen[0] if len(chosen) == 1 else list(merge(*chosen))
+            profile.append(helper_percentile(values, q))
+        return profile
+
+
+def helper_group(day: int) -> int:
+    """Return the index of the group of the day with the given day number
+
+    >>> helper_group(d.date(2019, 7, 6).toordinal())  # a Saturday of summer
+    5
+    """
+    season = SEASON_OF_MONTH[d.date.fromordinal(day).month - 1]
+    weekend = 1 if (day - 1) % 7 >= 5 else 0
+    return season * len(DAY_TYPES) + weekend
+
+
+def helper_groups(season: Optional[str], day_type: Optional[str]) -> List[int]:
+    """Return the indices of the groups of season and day_type (every one if None)
+
+    >>> helper_groups('spring', None), helper_groups(None, 'weekend')
+    ([2, 3], [1, 3, 5, 7])
+    """
+    seasons = range(len(SEASONS)) if season is None else [SEASONS.index(season)]
+    day_types = range(len(DAY_TYPES)) if day_type is None else [DAY_TYPES.index(day_type)]
+    return [s * len(DAY_TYPES) + t for s in seasons for t in day_types]
+
+
+def helper_percentile(values: List[float], q: float) -> float:
+    """Return the q-th percentile of the sorted values, interpolating linearly between
+    them, or NaN if there are none
+
+    >>> helper_percentile([1.0, 2.0, 3.0, 4.0], 50.0), helper_percentile([5.0], 90.0)
+    (2.5, 5.0)
+    """
+    if not values:
+        return float('nan')
+    position = q / 100 * (len(values) - 1)
+    below = int(position)
+    if below + 1 >= len(values):
+        return values[-1]
+    return values[below] + (position - below) * (values[below + 1] - values[below])
+
+
+def file_diurnal(data_file: DataFile, station_ids: Optional[List[str]] = None) \
+        -> Dict[str, DiurnalCube]:
+    """Return the diurnal cube of every station in station_ids (every station if None) of
+    data_file, by station code
+
+    Preconditions:
+        - station_ids is None or all(s in data_file.stations for s in station_ids)
+
+    >>> cubes = file_diurnal(DataFile('doctest_dataset/O3_2019.csv'), ['010102'])
+    >>> sum(cubes['010102'].counts()) == sum(len(v) for _, _, v in DataFile(
+    ...     'doctest_dataset/O3_2019.csv').iter_rows(['010102']))
+    True
+    """
+    data_file.ensure_loaded(station_ids)
+    codes = list(data_file.stations) if station_ids is None else station_ids
+    cubes = {}
+    for code in codes:
+        cubes[code] = DiurnalCube()
+        [a, b] = data_file.stations[code]
+        cubes[code].add_rows(data_file, a, b)
+    return cubes
+
+
+def dataset_diurnal(dataset: Dataset, pollutant: str, station_id: str,
+                    start_date: Optional[str] = None,
+                    end_date: Optional[str] = None) -> DiurnalCube:
+    """Return the diurnal cube of station_id for pollutant, over the days of dataset
+    between start_date and end_date (INCLUSIVE, formatted as 'YYYYMMDD')
+
+    >>> cube = dataset_diurnal(Dataset('doctest_dataset'), 'O3', '010102')
+    >>> weekday, weekend = cube.mean('summer', 'weekday'), cube.mean('summer', 'weekend')
+    >>> round(weekday[12], 3), round(weekend[12], 3), cube.median('summer')[12]
+    (20.277, 19.815, 21.0)
+    """
+    cube = DiurnalCube()
+    for data_file, _, [first, last] in dataset.plan(pollutant, [station_id],
+                                                    start_date, end_date):
+        cube.add_rows(data_file, first, last)
+    return cube
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['datetime', 'heapq', 'typing', 'dataset', 'loading_data',
+                          'naps_parser'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
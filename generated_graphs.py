@@ -1,60 +1,75 @@
-"""This file generates the necessary DataFiles for the viewing part of our project, and preloads
-them into the software.
+"""This file generates the necessary graphs for the viewing part of our project.
+
+The data comes from the Dataset of csv_files, which is lazy: a file is only read when
+a graph first needs it, and only the rows of the stations that are displayed are read.
 """
+from math import isnan
 from typing import List, Any, Tuple
 import pygame
-from loading_data import DataFile
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from dataset import Dataset
 import graph
 import compute
-NO2_1999 = DataFile('csv_files/NO2_1999.csv')
-NO2_2001 = DataFile('csv_files/NO2_2001.csv')
-NO2_2010 = DataFile('csv_files/NO2_2010.csv')
-O3_1999 = DataFile('csv_files/O3_1999.csv')
-O3_2001 = DataFile('csv_files/O3_2001.csv')
-O3_2010 = DataFile('csv_files/O3_2010.csv')
+import climatology
+import diurnal
+DATASET = Dataset('csv_files')
 
-FILES = [NO2_1999, NO2_2001, NO2_2010, O3_1999, O3_2001, O3_2010]
+# The years with an emission regulation that our graphs look at
+REGULATION_YEARS = ['1999', '2001', '2010']
 
-for FILE in FILES:
-    FILE.load()
+# The part of the title of a diurnal graph before its station code
+DIURNAL_TITLE = " diurnal median at "
 
 
 def generate_time_graphs(station_id: str, window: pygame.Surface) -> List[graph.Graph]:
     """This function generates the graphs needed to fulfill our research goals
     and stores them for viewing and plotting. This returns our preloaded graphs
-    which is called in main() and added to the general inventory."""
+    which is called in main() and added to the general inventory.
+
+    A station with no rows in a year has no graphs for that pollutant and year."""
 
     new_graphs = []
+    o3_climatology = climatology.dataset_climatology(DATASET, 'O3', [station_id])
 
-    ox_matches = [(NO2_1999, O3_1999), (NO2_2001, O3_2001), (NO2_2010, O3_2010)]
-    for tup in ox_matches:
-        (properties_no2, x_cor_no2, y_cor_no2) \
-            = tup[0].return_plot_daily(station_id)
-        (properties_o3, x_cor_o3, y_cor_o3) \
-            = tup[1].return_plot_daily(station_id)
+    for year in REGULATION_YEARS:
+        (x_cor_no2, y_cor_no2) = DATASET.query('NO2', [station_id], year + '0101',
+                                               year + '1231').get(station_id, ([], []))
+        (x_cor_o3, y_cor_o3) = DATASET.query('O3', [station_id], year + '0101',
+                                             year + '1231').get(station_id, ([], []))
+        properties_no2 = ("NO2 over " + year, year, "NO2 (ppb)")
+        properties_o3 = ("O3 over " + year, year, "O3 (ppb)")
 
         # NO2 GRAPH
-        new_graphs.append(make_a_graph(window, properties_no2, x_cor_no2, y_cor_no2))
+        if x_cor_no2:
+            new_graphs.append(make_a_graph(window, properties_no2, x_cor_no2, y_cor_no2))
 
         # O3 GRAPH
-        new_graphs.append(make_a_graph(window, properties_o3, x_cor_o3, y_cor_o3))
-
-        # Ox GRAPH
-        coord_sets = compute.add_values((x_cor_no2, y_cor_no2), (x_cor_o3, y_cor_o3))
-        properties_ox = ("Ox " + tup[0].year, tup[0].year, "Ox (ppb)")
-        new_graph = graph.Graph(window)
-        new_graph.properties[0] = properties_ox[0]
-        new_graph.labels = properties_ox[1], properties_ox[2]
-        new_graph.x_values = [(i, coord_sets[0][i]) for i in range(len(coord_sets[0]))]
-        new_graph.y_values = coord_sets[1]
-        new_graph.properties[3] = True
-        new_graphs.append(new_graph)
+        if x_cor_o3:
+            new_graphs.append(make_a_graph(window, properties_o3, x_cor_o3, y_cor_o3))
+
+        # O3 ANOMALY GRAPH: daily averages of the hourly O3 minus its climatology
+        anomalies = climatology.anomaly_query(DATASET, 'O3', o3_climatology, [station_id],
+                                              year + '0101', year + '1231')
+        (x_cor_an, y_cor_an) = anomalies.get(station_id, ([], []))
+        properties_an = ("O3 anomaly over " + year, year, "O3 anomaly (ppb)")
+        if x_cor_an:
+            new_graphs.append(make_a_graph(window, properties_an, x_cor_an, y_cor_an))
+
+        # Ox GRAPH: daily averages of the hourly O3 + NO2 readings
+        (x_cor_ox, y_cor_ox) = DATASET.query('Ox', [station_id], year + '0101',
+                                             year + '1231').get(station_id, ([], []))
+        properties_ox = ("Ox " + year, year, "Ox (ppb)")
+        if x_cor_ox:
+            new_graphs.append(make_a_graph(window, properties_ox, x_cor_ox, y_cor_ox))
 
         # O3 vs NO2
         coord_sets = compute.gen_points_matching_date((x_cor_o3, y_cor_o3),
                                                       (x_cor_no2, y_cor_no2))
+        if not coord_sets[0]:
+            continue
         new_graph = graph.Graph(window)
-        new_graph.properties[0] = "NO2 vs O3 " + tup[0].year
+        new_graph.properties[0] = "NO2 vs O3 " + year
         new_graph.labels = "O3 (ppb)", "NO2 (ppb)"
         new_graph.x_values = [(coord_sets[0][i], "fill") for i in range(len(coord_sets[0]))]
         new_graph.y_values = coord_sets[1]
@@ -64,6 +79,74 @@ def generate_time_graphs(station_id: str, window: pygame.Surface) -> List[graph.
     return new_graphs
 
 
+def generate_diurnal_graphs(station_id: str, window: pygame.Surface,
+                            pollutant: str = 'O3', season: str = 'summer') -> List[graph.Graph]:
+    """This function generates the weekday and weekend diurnal profiles (the median at
+    every hour of the day) of pollutant at station_id in season, over every year of the
+    dataset, to show the weekend effect
+
+    The hours without readings are left out, and so are the profiles with fewer than 2
+    hours, which cannot be drawn as a line."""
+    cube = diurnal.dataset_diurnal(DATASET, pollutant, station_id)
+    new_graphs = []
+    for day_type in diurnal.DAY_TYPES:
+        profile = cube.median(season, day_type)
+        hours = [hour for hour in range(len(profile)) if not isnan(profile[hour])]
+        if len(hours) < 2:
+            continue
+        new_graph = graph.Graph(window)
+        new_graph.properties[0] = pollutant + " " + season + " " + day_type + DIURNAL_TITLE \
+            + station_id
+        new_graph.labels = "Hour of the day", pollutant + " (ppb)"
+        new_graph.x_values = [(hour + 1, "fill") for hour in hours]
+        new_graph.y_values = [profile[hour] for hour in hours]
+        new_graph.properties[3] = False
+        new_graphs.append(new_graph)
+    return new_graphs
+
+
+def is_diurnal_graph(diurnal_graph: graph.Graph) -> bool:
+    """Return whether diurnal_graph is a diurnal profile of generate_diurnal_graphs"""
+    return DIURNAL_TITLE in diurnal_graph.properties[0]
+
+
+def plotly_diurnal_graph(diurnal_graph: graph.Graph) -> None:
+    """Plot the diurnal profiles of every season of the pollutant and station of
+    diurnal_graph, a graph of generate_diurnal_graphs (see plotly_diurnal)
+
+    Preconditions:
+        - is_diurnal_graph(diurnal_graph)
+    """
+    title = diurnal_graph.properties[0]
+    plotly_diurnal(title.split(DIURNAL_TITLE)[1], title.split()[0])
+
+
+def plotly_diurnal(station_id: str, pollutant: str = 'O3') -> None:
+    """Plot the weekday and weekend diurnal profiles of pollutant at station_id in every
+    season: the median at every hour of the day, between the 25th and 75th percentiles"""
+    cube = diurnal.dataset_diurnal(DATASET, pollutant, station_id)
+    hours = list(range(1, 25))
+    fig = make_subplots(rows=2, cols=2, subplot_titles=diurnal.SEASONS)
+    for i in range(len(diurnal.SEASONS)):
+        season = diurnal.SEASONS[i]
+        for day_type in diurnal.DAY_TYPES:
+            name = season + " " + day_type
+            fig.add_trace(go.Scatter(x=hours, y=cube.percentile(75.0, season, day_type),
+                                     mode='lines', line={'width': 0}, showlegend=False,
+                                     name=name + " 75th percentile"),
+                          row=i // 2 + 1, col=i % 2 + 1)
+            fig.add_trace(go.Scatter(x=hours, y=cube.percentile(25.0, season, day_type),
+                                     mode='lines', line={'width': 0}, fill='tonexty',
+                                     showlegend=False, name=name + " 25th percentile"),
+                          row=i // 2 + 1, col=i % 2 + 1)
+            fig.add_trace(go.Scatter(x=hours, y=cube.median(season, day_type),
+                                     mode='lines+markers', name=name + " median"),
+                          row=i // 2 + 1, col=i % 2 + 1)
+    fig.update_layout(title=pollutant + " diurnal cycle at " + station_id,
+                      xaxis_title="Hour of the day")
+    fig.show()
+
+
 def make_a_graph(window: pygame.Surface,
                  properties: Tuple[str],
                  x_cor: List[Any],
@@ -87,7 +170,7 @@ if __name__ == '__main__':
         'extra-imports': ['pygame', 'plotly.graph_objects',
                           'plotly.subplots', 'python_ta.contracts',
                           'graph', 'dataclass', 'user_input', 'random',
-                          'loading_data', 'compute'],
+                          'dataset', 'compute', 'climatology', 'diurnal', 'math'],
         'allowed-io': [],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200'],
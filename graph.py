@@ -1,11 +1,14 @@
 """
 Class for a graph to be plotted with related functions
 """
-from typing import List, Any, Tuple
+from typing import List, Any, Optional, Tuple
 import random
 import datetime
 import pygame
 import plotly.graph_objects as go
+import compute
+import regulations
+import robust_trend
 pygame.init()
 
 OFFSET_X_TEXT_Y = 5
@@ -25,6 +28,8 @@ class Graph:
         - labels: stores label for the x and y axis
         - properties: stores graph title, colour, window it draws on (in that order), and type
         - x_pos: restriction of the domain such that for all x, x_pos[0] < x < x_pos[1]
+        - prefix: the prefix sums of the points for window_fits, or None until they are
+          needed. Set it back to None after changing x_values or y_values in place.
 
     Representation Invariants:
         - len(x_values > 0)
@@ -46,6 +51,7 @@ class Graph:
     labels: List[str]
     properties: List[Any]
     x_pos: List[int]
+    prefix: Optional[compute.PrefixSums]
 
     def __init__(self, window: pygame.Surface) -> None:
         """
@@ -57,6 +63,7 @@ class Graph:
         self.labels = ['', '']
         self.properties = ['', random_colour(), window, False]
         self.x_pos = [0, 0]
+        self.prefix = None
 
     def draw_graph(self, x_se: Tuple[float, float],
                    y_se: Tuple[float, float],
@@ -185,26 +192,22 @@ class Graph:
                                              - title_text.get_rect().height))
 
     def draw_bar_v(self, fig: go.Figure) -> None:
-        """This is a helper function to plot Odd Oxygen Graphs"""
-        title = self.properties[0]
-        x_loc = None
-        x_text = ''
-        if "1999" in title:
-            x_loc = datetime.datetime(1999, 9, 14)
-            x_text = 'CEPA'
-        elif "2001" in title:
-            x_loc = datetime.datetime(2001, 2, 13)
-            x_text = 'FACVEF'
-        elif "2010" in title:
-            x_loc = datetime.datetime(2010, 6, 10)
-            x_text = 'CEPAA'
+        """This is a helper function to plot Odd Oxygen Graphs
+
+        A vertical bar marks every regulation of the registry passed within the dates of
+        the current domain.
+        """
+        x_port = [self.x_values[i][1] for i in self.x_portion]
         y_max = max(self.y_portion)
-        fig.add_trace(go.Scatter(x=[x_loc, x_loc], y=[0, y_max],
-                                 mode='lines+text',
-                                 name=x_text,
-                                 text=[x_text],
-                                 textposition='bottom center',
-                                 fillcolor='rgb(255,0,0)'))
+        for regulation in regulations.regulations_between(x_port[0].date(), x_port[-1].date()):
+            x_loc = datetime.datetime(regulation.date.year, regulation.date.month,
+                                      regulation.date.day)
+            fig.add_trace(go.Scatter(x=[x_loc, x_loc], y=[0, y_max],
+                                     mode='lines+text',
+                                     name=regulation.code,
+                                     text=[regulation.code],
+                                     textposition='bottom center',
+                                     fillcolor='rgb(255,0,0)'))
 
     def draw_bar_h(self, fig: go.Figure) -> None:
         """This is a helper function to plot limits on O3"""
@@ -239,7 +242,8 @@ class Graph:
             if 'Ox' in self.properties[0]:
                 self.draw_bar_v(fig)
 
-            if 'O3' in self.properties[0]:
+            # the 80 ppb limit applies to O3 readings, not to their anomalies
+            if 'O3' in self.properties[0] and 'anomaly' not in self.properties[0]:
                 self.draw_bar_h(fig)
 
         fig.update_layout(title=self.properties[0],
@@ -247,12 +251,51 @@ class Graph:
                           yaxis_title=self.labels[1])
         fig.show()
 
-    def plotly_with_reg(self, lin_reg: Tuple[float, float],
-                        quad_reg: List[float],
-                        exp_reg: List[float]) -> None:
+    def window_fits(self) -> Tuple[Optional[Tuple[List[float], float, float]], ...]:
+        """
+        Return the linear, quadratic and exponential regressions of the points in the
+        current domain [x_pos[0], x_pos[1]), as in plotly_with_reg: each one is
+        (coefficients, center, scale) in the scaled variable (x - center) / scale (see
+        compute.evaluate_polynomial), the exponential one being the line of log10(y), or
+        None if fewer than 2 of the points have distinct x and y > 0 (as in an anomaly
+        graph whose values are mostly negative)
+
+        The fits are computed from the prefix sums of all of the points, built the first
+        time they are needed, so refitting after the domain changes (e.g. while a slider
+        is dragged) does not depend on the number of points in it.
+
+        Preconditions:
+            - self.x_pos[1] - self.x_pos[0] > 2
+        """
+        if self.prefix is None or len(self.prefix.power_sums[0]) != len(self.y_values) + 1:
+            self.prefix = compute.PrefixSums([x[0] for x in self.x_values], self.y_values)
+        start, end = self.x_pos[0], self.x_pos[1]
+        return (self.prefix.fit(1, start, end),
+                self.prefix.fit(2, start, end),
+                self.prefix.exponential_fit(start, end))
+
+    def window_trend(self) -> Optional[robust_trend.RobustTrend]:
+        """
+        Return the robust trend (Sen's slope and the Mann-Kendall test) of the points in
+        the current domain [x_pos[0], x_pos[1]), or None if they have fewer than 2
+        distinct x-values. Pairs of points with the same x (e.g. in a scatter of two
+        pollutants) are left out of the trend.
+        """
+        start, end = self.x_pos[0], self.x_pos[1]
+        return robust_trend.robust_trend([x[0] for x in self.x_values[start: end]],
+                                         [float(y) for y in self.y_values[start: end]])
+
+    def plotly_with_reg(self, lin_reg: Tuple[List[float], float, float],
+                        quad_reg: Tuple[List[float], float, float],
+                        exp_reg: Optional[Tuple[List[float], float, float]],
+                        trend: Optional[robust_trend.RobustTrend] = None) -> None:
         """
         This function uses plotly to plot the currently viewed graph and
-        three regressions on top of it
+        three regressions on top of it, and the robust trend if there is one. The
+        exponential regression is left out if exp_reg is None.
+
+        The regressions are (coefficients, center, scale), as returned by window_fits, and
+        are evaluated in the scaled variable, which keeps their digits for large x-values.
         """
         fig = go.Figure()
         title = self.properties[0]
@@ -263,25 +306,31 @@ class Graph:
                                  name=title))
 
         # Linear Reg
-        (a, b) = lin_reg
-        vals_y = [a + b * x for x in self.x_portion]
+        vals_y = [compute.evaluate_polynomial(lin_reg, x) for x in self.x_portion]
         fig.add_trace(go.Scatter(x=self.x_portion, y=vals_y,
                                  mode='lines+markers',
                                  name="Linear"))
 
         # Quad Reg
-        c, b, a = quad_reg[0], quad_reg[1], quad_reg[2]
-        vals_y = [a * (x ** 2) + b * x + c for x in self.x_portion]
+        vals_y = [compute.evaluate_polynomial(quad_reg, x) for x in self.x_portion]
         fig.add_trace(go.Scatter(x=self.x_portion, y=vals_y,
                                  mode='lines+markers',
                                  name="Quadratic"))
 
         # Exp Reg
-        a, b = exp_reg[0], exp_reg[1]
-        vals_y = [b * (a ** x) for x in self.x_portion]
-        fig.add_trace(go.Scatter(x=self.x_portion, y=vals_y,
-                                 mode='lines+markers',
-                                 name="Exponential"))
+        if exp_reg is not None:
+            vals_y = [10 ** compute.evaluate_polynomial(exp_reg, x) for x in self.x_portion]
+            fig.add_trace(go.Scatter(x=self.x_portion, y=vals_y,
+                                     mode='lines+markers',
+                                     name="Exponential"))
+
+        # Robust trend
+        if trend is not None:
+            vals_y = [trend.intercept + trend.slope * x for x in self.x_portion]
+            fig.add_trace(go.Scatter(x=self.x_portion, y=vals_y,
+                                     mode='lines',
+                                     name='Theil-Sen (Mann-Kendall p = '
+                                          + str(round(trend.p_value, 4)) + ')'))
 
         fig.update_layout(title=self.properties[0],
                           xaxis_title=self.labels[0],
@@ -328,7 +377,7 @@ if __name__ == '__main__':
         'extra-imports': ['pygame', 'plotly.graph_objects',
                           'plotly.subplots', 'python_ta.contracts',
                           'graph', 'dataclass', 'user_input', 'random',
-                          'datetime'],
+                          'datetime', 'compute', 'regulations', 'robust_trend'],
         'allowed-io': [],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200'],
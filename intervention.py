@@ -0,0 +1,225 @@
+"""
+Before/after (segmented regression) analysis of the regulations of the registry
+
+For a regulation, a pollutant and a station, the daily averages within window_days of
+the date of the regulation are split at that date, and a line is fitted to each side:
+
+    y = level + slope * t
+
+where t is the time since the regulation, in years. The change in level and the change
+in slope at the date of the regulation measure its effect. Every station of a pollutant
+is fitted at once, by the batched regressions of compute.
+
+The effects of a dataset are cached in its directory, in INTERVENTION_CACHE, keyed on
+the NAPS files of the dataset, the window and the regulations.
+"""
+import datetime as d
+import json
+import os
+from math import isnan
+from typing import Any, Dict, List, Optional, Tuple
+import compute
+import data_cache
+from dataset import Dataset
+from odd_oxygen import OxFile
+from regulations import REGULATIONS, Regulation
+
+INTERVENTION_CACHE = 'interventions.cache'
+# Version of the analysis, stored in the cache. Increase it whenever a change to the
+# analysis changes its results.
+INTERVENTION_VERSION = 1
+DAYS_PER_YEAR = 365.25
+DEFAULT_WINDOW_DAYS = 365
+
+
+class InterventionEffect:
+    """
+    The levels and trends of the daily averages of a station before and after a
+    regulation. Levels are at the date of the regulation, in the units of the pollutant,
+    and slopes are per year. A side with fewer than 2 days of data has NaN level and slope.
+
+    Instance Attributes:
+        - pre_level: the level of the fit before the regulation
+        - pre_slope: the slope of the fit before the regulation
+        - post_level: the level of the fit from the regulation on
+        - post_slope: the slope of the fit from the regulation on
+        - pre_days: the number of days with data before the regulation
+        - post_days: the number of days with data from the regulation on
+
+    Representation Invariants:
+        - self.pre_days >= 0 and self.post_days >= 0
+    """
+    pre_level: float
+    pre_slope: float
+    post_level: float
+    post_slope: float
+    pre_days: int
+    post_days: int
+
+    def __init__(self, values: List[Any]) -> None:
+        (self.pre_level, self.pre_slope, self.post_level, self.post_slope,
+         self.pre_days, self.post_days) = values
+
+    def values(self) -> List[Any]:
+        """Return the values of this effect, in the order taken by __init__"""
+        return [self.pre_level, self.pre_slope, self.post_level, self.post_slope,
+                self.pre_days, self.post_days]
+
+    def level_change(self) -> float:
+        """Return the change in level at the date of the regulation"""
+        return self.post_level - self.pre_level
+
+    def slope_change(self) -> float:
+        """Return the change in slope at the date of the regulation, per year"""
+        return self.post_slope - self.pre_slope
+
+
+def intervention_effects(dataset: Dataset, pollutants: Optional[List[str]] = None,
+                         window_days: int = DEFAULT_WINDOW_DAYS,
+                         registry: Optional[List[Regulation]] = None,
+                         use_cache: bool = True) \
+        -> Dict[Tuple[str, str, str], InterventionEffect]:
+    """Return the effect of every regulation of registry (REGULATIONS if None) on every
+    station of every pollutant in pollutants (every pollutant of dataset if None), by
+    (regulation code, pollutant, station code).
+
+    Stations without data on either side of a regulation are left out.
+
+    >>> import regulations
+    >>> test = [regulations.Regulation('TEST', 'Test', d.date(2019, 7, 1))]
+    >>> effects = intervention_effects(Dataset('doctest_dataset'), window_days=90,
+    ...                                registry=test, use_cache=False)
+    >>> effect = effects[('TEST', 'O3', '010102')]
+    >>> effect.pre_days, effect.post_days
+    (90, 91)
+    >>> round(effect.level_change(), 3), round(effect.slope_change(), 3)
+    (1.591, 126.907)
+    """
+    registry = REGULATIONS if registry is None else registry
+    pollutants = dataset.pollutants() if pollutants is None else pollutants
+    key = helper_cache_key(dataset, pollutants, window_days, registry)
+    path = os.path.join(dataset.directory, INTERVENTION_CACHE)
+    if use_cache:
+        cached = read_effects(path, key)
+        if cached is not None:
+            return cached
+
+    effects = {}
+    for regulation in registry:
+        for pollutant in pollutants:
+            effects.update(helper_regulation_effects(dataset, pollutant, regulation,
+                                                     window_days))
+    if use_cache:
+        write_effects(path, key, effects)
+    return effects
+
+
+def helper_regulation_effects(dataset: Dataset, pollutant: str, regulation: Regulation,
+                              window_days: int) \
+        -> Dict[Tuple[str, str, str], InterventionEffect]:
+    """Return the effect of regulation on every station of pollutant, fitting the
+    stations before and after the regulation with two batched regressions"""
+    start = regulation.date - d.timedelta(days=window_days)
+    end = regulation.date + d.timedelta(days=window_days)
+    series = dataset.query(pollutant, None, start.strftime('%Y%m%d'), end.strftime('%Y%m%d'))
+
+    reg_day = regulation.date.toordinal()
+    times = [(day - reg_day) / DAYS_PER_YEAR
+             for day in range(start.toordinal(), end.toordinal() + 1)]
+    codes = sorted(series)
+    table = []
+    for code in codes:
+        row = [float('nan')] * len(times)
+        for i in range(len(series[code][0])):
+            row[series[code][0][i].toordinal() - start.toordinal()] = series[code][1][i]
+        table.append(row)
+
+    pre_mask = [t < 0 for t in times]
+    post_mask = [t >= 0 for t in times]
+    pre_fit = compute.batch_linear_regression(times, table, [pre_mask] * len(codes))[0]
+    post_fit = compute.batch_linear_regression(times, table, [post_mask] * len(codes))[0]
+
+    effects = {}
+    for s in range(len(codes)):
+        pre_days = sum(1 for i in range(len(times)) if pre_mask[i] and not isnan(table[s][i]))
+        post_days = sum(1 for i in range(len(times))
+                        if post_mask[i] and not isnan(table[s][i]))
+        if pre_days > 0 and post_days > 0:
+            effects[(regulation.code, pollutant, codes[s])] = InterventionEffect(
+                [pre_fit[s][0], pre_fit[s][1], post_fit[s][0], post_fit[s][1],
+                 pre_days, post_days])
+    return effects
+
+
+def helper_cache_key(dataset: Dataset, pollutants: List[str], window_days: int,
+                     registry: List[Regulation]) -> Dict[str, Any]:
+    """Return the values that must match for the cached effects of dataset to be valid:
+    the csv files, and how the stations of every OxFile are paired (its O3 and NO2 files
+    and its radius)
+
+    >>> dataset = Dataset('doctest_dataset')
+    >>> o3 = dataset.files[('O3', 2019)]
+    >>> dataset.files[('Ox', 2019)] = OxFile(o3, o3, None)
+    >>> key = helper_cache_key(dataset, ['Ox'], 90, [])
+    >>> dataset.files[('Ox', 2019)] = OxFile(o3, o3, 25.0)
+    >>> key == helper_cache_key(dataset, ['Ox'], 90, [])
+    False
+    """
+    files = [data_cache.cache_key(f.file_path, INTERVENTION_VERSION)
+             for f in dataset.files.values() if not isinstance(f, OxFile)]
+    ox_files = [[f.file_path, f.helper_pairs_key()]
+                for f in dataset.files.values() if isinstance(f, OxFile)]
+    return {'files': sorted(files, key=lambda k: k['path']),
+            'ox': sorted(ox_files),
+            'pollutants': sorted(pollutants),
+            'window': window_days,
+            'regulations': [[r.code, r.date.isoformat()] for r in registry]}
+
+
+def read_effects(path: str, key: Dict[str, Any]) \
+        -> Optional[Dict[Tuple[str, str, str], InterventionEffect]]:
+    """Return the effects stored in the cache file at path, or None if there is no such
+    file or it was not written with the given key"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            stored = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(stored, dict) or stored.get('key') != key:
+        return None
+    return {tuple(item[0]): InterventionEffect(item[1]) for item in stored['effects']}
+
+
+def write_effects(path: str, key: Dict[str, Any],
+                  effects: Dict[Tuple[str, str, str], InterventionEffect]) -> bool:
+    """Write effects with their key to the cache file at path. Returns whether the file
+    was written; a cache that cannot be written is simply skipped."""
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'key': key,
+                       'effects': [[list(k), effects[k].values()] for k in effects]}, file)
+        os.replace(temp_path, path)
+    except OSError:
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['datetime', 'json', 'os', 'math', 'typing', 'compute',
+                          'data_cache', 'dataset', 'odd_oxygen', 'regulations'],
+        'allowed-io': ['read_effects', 'write_effects'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
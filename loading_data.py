@@ -1,8 +1,20 @@
 """Loading data from the csv module"""
 
-import csv
+import bisect
 import datetime as d
-from typing import List, Optional, Dict, Tuple, Any
+import mmap
+from array import array
+from typing import List, Optional, Dict, Tuple, Any, Iterator, Sequence
+import data_cache
+import naps_parser
+from aggregation import AggregationCube, CUBE_COLUMNS, MONTHS, build_cube
+from stations import Station, StationCatalog
+from naps_parser import ID_COL, DATE_COL, FIRST_HOUR_COL, HOURS_PER_DAY, ALL_VALID, \
+    STATION_TYPECODE, DATE_TYPECODE, HOURLY_TYPECODE, VALID_TYPECODE
+
+# Version of the parsed representation, stored in the binary cache files.
+# Increase it whenever a change to the parsing changes what gets stored.
+PARSER_VERSION = 4
 
 
 class DataFile:
@@ -12,83 +24,223 @@ class DataFile:
     main application framework. This also includes basic
     statisticl analysis.
 
+    The data is stored in columns rather than as a list of rows:
+    every station code is given a small integer id, every date is stored as
+    a day number (see datetime.date.toordinal) and the H01-H24 readings of all
+    the rows are held in one contiguous float32 array, row after row.
+    Missing readings are stored as NaN, and every row has a validity mask
+    whose bit h is set when the reading of hour h + 1 is valid.
+
     Some CSV files have been provided for example usage
 
+    A DataFile is loaded lazily: the file is only read when its data is first
+    needed, and a request for one station only reads the rows of the stations
+    requested so far (unless the whole file is already in the binary cache).
+
     Instance Attributes:
-        - data: stores all the data
         - file_path: string to store the csv file path
+        - loaded: whether the file has been read
+        - station_filter: the only station ids that were read, or None if every station was
         - header_row: represents the column headers:
         - stations: represents data rows corresponding to station ids
         - pollutant: pollutant in this data file
         - year: year this data was collected
+        - station_codes: the station code of every station id
+        - station_info: the city, province, latitude and longitude of every station id
+        - row_station: the station id of every row
+        - row_date: the day number of every row
+        - hours: the hourly readings of every row, HOURS_PER_DAY values per row
+        - row_valid: the validity mask of every row
+        - catalog: the stations of this file with their locations
+        - cube: the daily, monthly and annual summaries of every station
+        - mapped: the memory-map of the binary cache the columns are views of, or None if
+          they were parsed
+
+    Representation Invariants:
+        - len(self.row_station) == len(self.row_date) == len(self.row_valid)
+        - len(self.hours) == len(self.row_date) * HOURS_PER_DAY
+        - len(self.station_codes) == len(self.station_info) == len(self.stations)
     """
-    data: List[List[Any]]
     file_path: str
+    loaded: bool
+    station_filter: Optional[List[str]]
     header_row: List[Any]
     stations: Dict[str, List[int]]
     pollutant: str
     year: str
+    station_codes: List[str]
+    station_info: List[List[str]]
+    row_station: memoryview
+    row_date: memoryview
+    hours: memoryview
+    row_valid: memoryview
+    catalog: StationCatalog
+    cube: AggregationCube
+    mapped: Optional[mmap.mmap]
 
     def __init__(self, file_path: str) -> None:
         self.file_path = file_path
-        self.data = []
+        self.loaded = False
+        self.station_filter = None
         self.header_row = []
         self.stations = {}
         self.pollutant = ""
         self.year = ""
+        self.station_codes = []
+        self.station_info = []
+        self.row_station = memoryview(array(STATION_TYPECODE))
+        self.row_date = memoryview(array(DATE_TYPECODE))
+        self.hours = memoryview(array(HOURLY_TYPECODE))
+        self.row_valid = memoryview(array(VALID_TYPECODE))
+        self.catalog = StationCatalog()
+        self.cube = build_cube(self.row_station, self.row_date, self.hours, self.row_valid, 0)
+        self.mapped = None
+
+    def load(self, use_cache: bool = True, station_filter: Optional[List[str]] = None) -> None:
+        """Read from file_path into the columns of this DataFile
+
+        By default (use_cache is True), station_filter is ignored: the columns are
+        memory-mapped from the binary cache of file_path if it is valid, and otherwise
+        every station is parsed and the cache is written, so that the next load (e.g. the
+        next start of the GUI, which always asks for a few stations) maps the cache
+        instead of parsing the file again. On the doctest dataset, parsing every station
+        takes about 0.7 s, parsing the rows of one station 0.004 s to 0.1 s (depending on
+        where they are in the file), and mapping the cache about 1 ms (see data_cache).
+
+        When use_cache is False, the file is parsed and the cache is neither read nor
+        written; only the rows of the stations in station_filter are read if it is given.
 
-    def format(self) -> None:
-        """standardize the data appearance for ID and DATE
-        This is for ease of use, so data can be accessed easily"""
+        >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+        >>> my_data.load()
+        >>> my_data.num_rows()
+        82490
+        >>> len(my_data.stations)
+        226
+        >>> my_data.catalog.nearest(47.56, -52.71, 1)
+        [Station(010102, St Johns, NL)]
+        """
 
-        for i in range(len(self.data)):
-            for j in range(len(self.data[i])):
-                if j == 1 and len(self.data[i][j]) < 6:  # format ID
-                    self.data[i][j] = '0' + self.data[i][j]
-                if j == 6:  # format DATE
-                    self.data[i][j] = self.data[i][j].replace('-', '')
-                    self.data[i][j] = self.data[i][j].replace('/', '')
-                if i > 0 and 7 <= j <= 31:  # format measurements
-                    self.data[i][j] = float(self.data[i][j])
+        self.loaded = True
+        self.station_filter = None
+        if use_cache and self.load_cache():
+            return
+
+        if use_cache:
+            station_filter = None
+        attributes, columns = naps_parser.parse_naps(self.file_path, station_filter)
+        self.helper_set_columns(attributes, columns)
+        if station_filter is not None:
+            self.station_filter = list(station_filter)
+        elif use_cache:
+            self.save_cache()
+
+    def ensure_loaded(self, station_filter: Optional[List[str]] = None) -> None:
+        """Load this DataFile if it has not been loaded yet, or if the stations in
+        station_filter (every station if None) have not been read
+
+        >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+        >>> my_data.ensure_loaded(['010102'])
+        >>> my_data.loaded and my_data.num_rows() > 0
+        True
+        """
+        if not self.loaded:
+            self.load(station_filter=station_filter)
+        elif self.station_filter is None:
+            return
+        elif station_filter is None:
+            self.load()
+        elif any(s not in self.station_filter for s in station_filter):
+            self.load(station_filter=self.station_filter
+                      + [s for s in station_filter if s not in self.station_filter])
+
+    def save_cache(self) -> bool:
+        """Write the columns of this DataFile to the binary cache of file_path.
+        Returns whether the cache was written."""
+        attributes = {'header_row': self.header_row,
+                      'stations': self.stations,
+                      'pollutant': self.pollutant,
+                      'year': self.year,
+                      'station_codes': self.station_codes,
+                      'station_info': self.station_info}
+        columns = {'row_station': self.row_station,
+                   'row_date': self.row_date,
+                   'hours': self.hours,
+                   'row_valid': self.row_valid}
+        columns.update(self.cube.columns())
+        return data_cache.write_cache(self.file_path, PARSER_VERSION, attributes, columns)
+
+    def load_cache(self) -> bool:
+        """Memory-map the columns of this DataFile from the binary cache of file_path.
+        Returns False, leaving this DataFile unchanged, if there is no valid cache."""
+        cached = data_cache.read_cache(self.file_path, PARSER_VERSION)
+        if cached is None:
+            return False
+        self.helper_set_columns(cached[0], cached[1])
+        self.mapped = cached[2]
+        return True
 
-    def load(self) -> None:
-        """Read from file_path into the collection 'data'
+    def close_cache(self) -> None:
+        """Release the columns memory-mapped from the binary cache, if they are, and close
+        the memory-map, before they are replaced (see data_cache.close_cache)
 
         >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+        >>> my_data.load()  # writes the cache if there is none
         >>> my_data.load()
-        >>> len(my_data.data)
-        52554
+        >>> mapped = my_data.mapped
+        >>> my_data.load(use_cache=False)
+        >>> mapped.closed, my_data.mapped is None, my_data.num_rows()
+        (True, True, 82490)
         """
+        if self.mapped is None:
+            return
+        columns = {'row_station': self.row_station,
+                   'row_date': self.row_date,
+                   'hours': self.hours,
+                   'row_valid': self.row_valid}
+        columns.update(self.cube.columns())
+        data_cache.close_cache(columns, self.mapped)
+        self.mapped = None
+
+    def helper_set_columns(self, attributes: Dict[str, Any],
+                           columns: Dict[str, memoryview]) -> None:
+        """Set the attributes and columns of this DataFile from the parsed form used by
+        naps_parser.parse_naps and data_cache.read_cache, building the aggregation cube
+        if it isn't in columns"""
+        self.close_cache()
+        self.header_row = attributes['header_row']
+        self.stations = attributes['stations']
+        self.pollutant = attributes['pollutant']
+        self.year = attributes['year']
+        self.station_codes = attributes['station_codes']
+        self.station_info = attributes['station_info']
+        self.row_station = columns['row_station']
+        self.row_date = columns['row_date']
+        self.hours = columns['hours']
+        self.row_valid = columns['row_valid']
+        self.catalog = StationCatalog()
+        for i in range(len(self.station_codes)):
+            city, province, latitude, longitude = self.station_info[i]
+            self.catalog.add(Station(self.station_codes[i], city, province,
+                                     float(latitude), float(longitude)))
+        if all(name in columns for name in CUBE_COLUMNS):
+            self.cube = AggregationCube(columns)
+        else:
+            self.cube = build_cube(self.row_station, self.row_date, self.hours,
+                                   self.row_valid, len(self.station_codes))
 
-        found_header = False
-        self.data = []
-        with open(self.file_path, 'r', errors='replace') as file:
-            csv_reader = csv.reader(file, delimiter=',')
-            line_count = 0
-
-            for row in csv_reader:  # csv reader using module
-                if not found_header and helper_header(row):  # finding table header
-                    found_header = True
-                    self.header_row = row
-                    self.data.append(row)
-                    line_count += 1
-                    continue
-                if found_header:
-                    good_row = False
-                    if '-999' not in row:
-                        good_row = True
-                        self.data.append(row)
-                        line_count += 1
-                    st_id = row[1]
-                    if st_id in self.stations and good_row:  # updating stations dictionary
-                        self.stations[st_id][1] = line_count - 1
-                    elif good_row:
-                        self.stations[st_id] = [line_count - 1, line_count - 1]
-        file.close()
-
-        self.pollutant = self.data[1][0]
-        self.year = self.data[1][6][0:4]
-        self.format()
+    def num_rows(self) -> int:
+        """Return the number of station-day rows stored in this DataFile"""
+        self.ensure_loaded()
+        return len(self.row_date)
+
+    def row_hours(self, row_index: int) -> memoryview:
+        """Return a view of the HOURS_PER_DAY readings of the given row
+
+        Preconditions:
+            - 0 <= row_index < self.num_rows()
+        """
+        start = row_index * HOURS_PER_DAY
+        return self.hours[start: start + HOURS_PER_DAY]
 
     def helper_is_valid_date(self, station_id: str, date: str) -> bool:
         """
@@ -100,8 +252,79 @@ class DataFile:
 
         """
 
-        col = self.get_col(6, self.stations[station_id][0], self.stations[station_id][1])
-        return date in col
+        return self.helper_find_row(station_id, date) != -1
+
+    def helper_find_row(self, station_id: str, date: str) -> int:
+        """Return the index of the row of station_id on date, or -1 if there is no such row
+
+        The rows of a station are sorted by date and usually have one row per day, so the
+        row is first looked for at its offset from the station's first day, and otherwise
+        found by binary search.
+
+        Preconditions:
+            - station_id in self.stations
+
+        >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+        >>> my_data.helper_find_row('010102', '20190111')
+        10
+        >>> my_data.helper_find_row('010102', '20180101')
+        -1
+        """
+        self.ensure_loaded([station_id])
+        day = date_to_day(date)
+        [a, b] = self.stations[station_id]
+        guess = a + day - self.row_date[a]
+        if a <= guess <= b and self.row_date[guess] == day:
+            return guess
+        ind = bisect.bisect_left(self.row_date, day, a, b + 1)
+        if ind <= b and self.row_date[ind] == day:
+            return ind
+        return -1
+
+    def get_row_range(self, station_id: str, start_date: str, end_date: str) -> List[int]:
+        """Return the first and last row (INCLUSIVE) of station_id with a date between
+        start_date and end_date (INCLUSIVE), found by binary search. The last row is
+        before the first one if there is no such row.
+
+        Preconditions:
+            - station_id in self.stations
+            - start_date <= end_date
+
+        >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+        >>> my_data.get_row_range('010102', '20190201', '20190228')
+        [31, 58]
+        >>> my_data.get_row_range('010102', '20200101', '20201231')
+        [365, 364]
+        """
+        self.ensure_loaded([station_id])
+        [a, b] = self.stations[station_id]
+        first = bisect.bisect_left(self.row_date, date_to_day(start_date), a, b + 1)
+        last = bisect.bisect_right(self.row_date, date_to_day(end_date), a, b + 1) - 1
+        return [first, last]
+
+    def helper_station_rows(self, station_id: str, start_date: Optional[str],
+                            end_date: Optional[str]) -> List[int]:
+        """Return the first and last row (INCLUSIVE) of station_id, restricted to the dates
+        between start_date and end_date if they are given
+
+        Preconditions:
+            - station_id in self.stations
+            - (start_date is None) == (end_date is None)
+        """
+        if start_date is None or end_date is None:
+            self.ensure_loaded([station_id])
+            return self.stations[station_id]
+        return self.get_row_range(station_id, start_date, end_date)
+
+    def station_dates(self, station_id: str) -> memoryview:
+        """Return a view of the sorted day numbers of the rows of station_id
+
+        Preconditions:
+            - station_id in self.stations
+        """
+        self.ensure_loaded([station_id])
+        [a, b] = self.stations[station_id]
+        return self.row_date[a: b + 1]
 
     def get_row(self, station_id: str, date: str,
                 start_col: Optional[int] = 0,
@@ -120,12 +343,13 @@ class DataFile:
             - helper_is_valid_date(station_id, date)
 
         """
-        row_index = self.stations[station_id][0]
-        for ind in range(self.stations[station_id][0], self.stations[station_id][1]):
-            if self.data[ind][6] == date:
-                row_index = ind
-                break
-        return self.data[row_index][start_col: end_col]
+        row_index = self.helper_find_row(station_id, date)
+        if row_index == -1:
+            return []
+        st = self.row_station[row_index]
+        row = [self.pollutant, self.station_codes[st]] + self.station_info[st] \
+            + [day_to_str(self.row_date[row_index])] + self.row_hours(row_index).tolist()
+        return row[start_col: end_col]
 
     def get_col(self, header_ind: int,
                 start_row: Optional[int] = 0,
@@ -140,84 +364,179 @@ class DataFile:
         Preconditions:
             - start_row <= end_row
         """
-
-        if 0 <= header_ind <= len(self.header_row):
-            return [self.data[i][header_ind] for i in range(start_row, end_row + 1)]
+        self.ensure_loaded()
+        if end_row == -1:
+            end_row = self.num_rows() - 1
+
+        if header_ind == 0:
+            return [self.pollutant] * (end_row + 1 - start_row)
+        elif header_ind == ID_COL:
+            return [self.station_codes[s] for s in self.row_station[start_row: end_row + 1]]
+        elif ID_COL < header_ind < DATE_COL:
+            return [self.station_info[s][header_ind - ID_COL - 1]
+                    for s in self.row_station[start_row: end_row + 1]]
+        elif header_ind == DATE_COL:
+            return [day_to_str(day) for day in self.row_date[start_row: end_row + 1]]
+        elif FIRST_HOUR_COL <= header_ind < FIRST_HOUR_COL + HOURS_PER_DAY:
+            hour = header_ind - FIRST_HOUR_COL
+            return self.hours[start_row * HOURS_PER_DAY + hour:
+                              (end_row + 1) * HOURS_PER_DAY: HOURS_PER_DAY].tolist()
         else:
             return []
 
-    def return_plot_hourly(self, station_id: str) \
+    def return_plot_hourly(self, station_id: str,
+                           start_date: Optional[str] = None,
+                           end_date: Optional[str] = None) \
             -> Tuple[Tuple[str, str, str], List[d.datetime], List[float]]:
         """ Return the coordinates of average concentration versus
         time
 
-        The x-coordinates are strings representing the date formated as:
-            'YYYYMMDDHH'
+        The x-coordinates are the datetimes of the readings. Missing readings
+        are left out. If start_date and end_date are given, only the days
+        between them (INCLUSIVE) are returned.
 
         Preconditions:
             - station_id in self.stations
         """
-
-        [a, b] = self.stations[station_id]
+        [a, b] = self.helper_station_rows(station_id, start_date, end_date)
         x_cor = []
         y_cor = []
         for i in range(a, b + 1):
-            for j in range(7, 31):
-                x_coord = self.data[i][6]
-                if (j - 6) < 10:
-                    x_coord += '0'
-                x_coord += str(j - 6)
-
-                x_cor.append(str_to_date(x_coord))
-                y_cor.append(int(self.data[i][j]))
+            day = d.datetime.fromordinal(self.row_date[i])
+            valid = self.row_valid[i]
+            values = self.row_hours(i)
+            for hour in range(HOURS_PER_DAY):
+                if valid >> hour & 1:
+                    x_cor.append(day + d.timedelta(hours=hour))
+                    y_cor.append(int(values[hour]))
         title = self.pollutant + " over " + self.year
         (x_lab, y_lab) = (self.year, self.pollutant + ' (ppb)')
         return((title, x_lab, y_lab), x_cor, y_cor)
 
-    def return_plot_daily(self, station_id: str)\
+    def return_plot_daily(self, station_id: str,
+                          start_date: Optional[str] = None,
+                          end_date: Optional[str] = None)\
             -> Tuple[Tuple[str, str, str], List[d.datetime], List[float]]:
         """This returns the x-coordinates and corresponding y-coordinates
         for the daily average emissions given a station_id.
 
+        Each day is averaged over its valid readings, and days with
+        no valid reading are left out. If start_date and end_date are given,
+        only the days between them (INCLUSIVE) are returned. The averages
+        are read from the aggregation cube.
+
         Preconditions:
             - station_id in self.stations
+
+        >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+        >>> my_data.return_plot_daily('010102', '20190101', '20190102')[2]
+        [31.875, 31.25]
         """
-        [a, b] = self.stations[station_id]
+        [a, b] = self.helper_station_rows(station_id, start_date, end_date)
         x_cor = []
         y_cor = []
+        daily_count = self.cube.daily_count
+        daily_mean = self.cube.daily_mean
         for i in range(a, b + 1):
-            x_cor.append(str_to_date(self.data[i][6]))
-            y_cor.append(help_average_day(self.data[i]))
+            if daily_count[i] != 0:
+                x_cor.append(d.datetime.fromordinal(self.row_date[i]))
+                y_cor.append(daily_mean[i])
         title = self.pollutant + " over " + self.year
         (x_lab, y_lab) = (self.year, self.pollutant + ' (ppb)')
         return ((title, x_lab, y_lab), x_cor, y_cor)
 
-    def return_plot_monthly(self, station_id: str) -> Tuple[List[d.datetime], List[float]]:
-        """ Returns the monthly averages for a given station
+    def return_plot_monthly(self, station_id: str) -> Tuple[List[int], List[float]]:
+        """ Returns the monthly averages for a given station: the months
+        with data and the average of their daily averages, read from the
+        aggregation cube.
 
         Preconditions:
             - station_id in self.stations
-        """
-        x_cor = self.return_plot_daily(station_id)[1]
-        y_cor = self.return_plot_daily(station_id)[2]
-        months = {1: [], 2: [], 3: [], 4: [], 5: [], 6: [],
-                  7: [], 8: [], 9: [], 10: [], 11: [], 12: []}
-        prev = x_cor[0].month
-        for x in range(len(x_cor)):
-            month = x_cor[x].month
-            months[month].append(y_cor[x])
-            if month != prev:
-                months[prev] = sum(months[prev]) / len(months[prev])
-                prev = month
-        months[prev] = sum(months[prev]) // len(months[prev])
 
+        >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+        >>> months, averages = my_data.return_plot_monthly('010102')
+        >>> months[0], round(averages[0], 3)
+        (1, 30.14)
+        """
+        self.ensure_loaded([station_id])
+        st = self.row_station[self.stations[station_id][0]]
         x_cor, y_cor = [], []
-        for k in months:
-            if months[k] != []:
-                x_cor.append(k)
-                y_cor.append(months[k])
+        for month in range(1, MONTHS + 1):
+            if self.cube.monthly_count[st * MONTHS + month - 1] > 0:
+                x_cor.append(month)
+                y_cor.append(self.cube.monthly_mean[st * MONTHS + month - 1])
         return (x_cor, y_cor)
 
+    def iter_rows(self, station_ids: Optional[List[str]] = None,
+                  keep_missing: bool = False) -> Iterator[Tuple[str, int, List[float]]]:
+        """Return an iterator over the rows of the given stations (every station if None),
+        giving the station code, the day number and the valid readings of each row.
+        If keep_missing is True, every row gives its HOURS_PER_DAY readings instead, with
+        NaN for the missing ones, so each reading stays at its hour.
+
+        The rows are produced one at a time from the columns (memory-mapped from the
+        binary cache when there is one), so e.g. a compute.RunningStats can summarize a
+        file without a list of all of its readings.
+
+        Preconditions:
+            - station_ids is None or all(s in self.stations for s in station_ids)
+
+        >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+        >>> rows = my_data.iter_rows(['010102'])
+        >>> code, day, values = next(rows)
+        >>> code, day_to_str(day), len(values), sum(values) / len(values)
+        ('010102', '20190101', 24, 31.875)
+        >>> all(len(row[2]) == HOURS_PER_DAY for row in my_data.iter_rows(['010102'], True))
+        True
+        """
+        self.ensure_loaded(station_ids)
+        codes = list(self.stations) if station_ids is None else station_ids
+        for code in codes:
+            [a, b] = self.stations[code]
+            for i in range(a, b + 1):
+                valid = self.row_valid[i]
+                if valid == 0 and not keep_missing:
+                    continue
+                values = self.row_hours(i).tolist()
+                if valid != ALL_VALID and not keep_missing:
+                    values = [values[h] for h in range(HOURS_PER_DAY) if valid >> h & 1]
+                yield (code, self.row_date[i], values)
+
+    def daily_table(self, station_ids: Optional[List[str]] = None) \
+            -> Tuple[List[int], List[str], List[List[float]]]:
+        """Return the day numbers of every day of the year, the given stations (every
+        station if None) and the daily averages of each of those stations on each of those
+        days, with NaN on the days without data.
+
+        This is the stack of series taken by the batched regressions of compute, e.g. to
+        fit the trend of every station of the file in one call.
+
+        Preconditions:
+            - station_ids is None or all(s in self.stations for s in station_ids)
+
+        >>> import compute
+        >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+        >>> days, codes, table = my_data.daily_table()
+        >>> len(days), len(codes), table[0][:2]
+        (365, 226, [31.875, 31.25])
+        >>> coefficients, r_squared = compute.batch_linear_regression(days, table)
+        >>> len(coefficients), len(r_squared)
+        (226, 226)
+        """
+        self.ensure_loaded(station_ids)
+        codes = list(self.stations) if station_ids is None else station_ids
+        first_day = date_to_day(self.year + '0101')
+        days = list(range(first_day, date_to_day(self.year + '1231') + 1))
+        table = []
+        for code in codes:
+            [a, b] = self.stations[code]
+            series = [float('nan')] * len(days)
+            for i in range(a, b + 1):
+                if self.cube.daily_count[i] != 0:
+                    series[self.row_date[i] - first_day] = self.cube.daily_mean[i]
+            table.append(series)
+        return (days, codes, table)
+
 
 def str_to_date(date: str) -> d.datetime:
     """This helper function converts string dates to datetime objects
@@ -236,12 +555,45 @@ def str_to_date(date: str) -> d.datetime:
     return dt_obj
 
 
-def help_average_day(row: List[int]) -> float:
+def date_to_day(date: str) -> int:
+    """Convert a 'YYYYMMDD' date to its day number
+
+    Preconditions:
+        - len(date) == 8
+        - all([e.isdigit() for e in date])
+
+    >>> date_to_day('20190101') == d.date(2019, 1, 1).toordinal()
+    True
+    """
+    return d.date(int(date[0:4]), int(date[4:6]), int(date[6:8])).toordinal()
+
+
+def day_to_str(day: int) -> str:
+    """Convert a day number back to a 'YYYYMMDD' date
+
+    >>> day_to_str(date_to_day('20190101'))
+    '20190101'
+    """
+    return d.date.fromordinal(day).strftime('%Y%m%d')
+
+
+def help_average_day(day_vals: Sequence[float], valid: int = ALL_VALID) -> float:
     """This returns the emission average for
-    a given day, given the row
+    a given day, given the day's hourly readings
+    and its validity mask. Only the valid readings are averaged.
+
+    Preconditions:
+        - valid != 0
+
+    >>> help_average_day([1.0, 2.0, 3.0], 0b111)
+    2.0
+    >>> help_average_day([1.0, float('nan'), 4.0], 0b101)
+    2.5
      """
-    day_vals = row[7: len(row)]
-    return sum(day_vals) / len(day_vals)
+    if valid == ALL_VALID or valid == (1 << len(day_vals)) - 1:
+        return sum(day_vals) / len(day_vals)
+    valid_vals = [day_vals[h] for h in range(len(day_vals)) if valid >> h & 1]
+    return sum(valid_vals) / len(valid_vals)
 
 
 def helper_header(row: List[str]) -> bool:
@@ -264,9 +616,10 @@ if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['csv', 'typing', 'datetime'],
-        'allowed-io': ['helper_header', 'format',
-                       'load', 'helper_is_valid_date',
+        'extra-imports': ['bisect', 'typing', 'datetime', 'mmap', 'array', 'data_cache',
+                          'naps_parser', 'stations', 'aggregation'],
+        'allowed-io': ['helper_header',
+                       'load', 'ensure_loaded', 'helper_is_valid_date',
                        'get_row', 'get_col',
                        'return_plot_hourly',
                        'help_average_day',
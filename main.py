@@ -21,7 +21,6 @@ import graph
 import graphics_UI
 import user_input
 import generated_graphs
-import compute
 
 # **Constants** #
 
@@ -299,7 +298,7 @@ def handle_right_graph(window: pygame.surface, u_input: user_input.Userinput,
 def handle_reg_graph(window: pygame.surface, u_input: user_input.Userinput,
                      gui: graphics_UI.GuiSlider) -> None:
     """ This handles the event of computing the best regression on a graph
-    It plots linear, polynomial, and exponential regressions """
+    It plots linear, polynomial, and exponential regressions, and the robust trend """
 
     # fade the pressed button
     gui.reg_graph_col = (255, 255, 255)
@@ -308,11 +307,10 @@ def handle_reg_graph(window: pygame.surface, u_input: user_input.Userinput,
 
     graph_r = u_input.list_of_graphs[u_input.current_graph]
 
-    lin_reg = compute.simple_linear_regression((graph_r.x_portion, graph_r.y_portion))
-    quad_reg = compute.polynomial_regression(2, graph_r.x_portion, graph_r.y_portion)
-    exp_reg = compute.exponential_regression(graph_r.x_portion, graph_r.y_portion)
+    # fits over the current domain, from the graph's prefix sums
+    lin_reg, quad_reg, exp_reg = graph_r.window_fits()
 
-    graph_r.plotly_with_reg(lin_reg, quad_reg, exp_reg)
+    graph_r.plotly_with_reg(lin_reg, quad_reg, exp_reg, graph_r.window_trend())
 
 
 def handle_plotly_all(u_input: user_input.Userinput) -> None:
@@ -327,7 +325,8 @@ def handle_plotly_all(u_input: user_input.Userinput) -> None:
 
 def handle_plotly(u_input: user_input.Userinput, gui: graphics_UI.GuiSlider) -> None:
     """
-    generate the plotly for the currently viewed graph
+    generate the plotly for the currently viewed graph, or the diurnal profiles of
+    every season for a diurnal graph
     Called when the user presses on the upper left most whit rectangle
 
     * u_input has been initialized correctly *
@@ -335,9 +334,15 @@ def handle_plotly(u_input: user_input.Userinput, gui: graphics_UI.GuiSlider) ->
 
     # Different calls depending on if the graph has been stored or not
     if u_input.preview_graph:
-        gui.graph_ex.generate_plotly()
+        current = gui.graph_ex
     else:
-        u_input.list_of_graphs[u_input.current_graph].generate_plotly()
+        current = u_input.list_of_graphs[u_input.current_graph]
+
+    # a diurnal profile opens the profiles of every season, between their percentiles
+    if generated_graphs.is_diurnal_graph(current):
+        generated_graphs.plotly_diurnal_graph(current)
+    else:
+        current.generate_plotly()
 
 
 def handle_start_x(u_input: user_input) -> None:
@@ -1071,6 +1076,7 @@ def main() -> None:
 
     # generate time graphs for pollutants
     time_graphs = generated_graphs.generate_time_graphs('010102', window)
+    time_graphs.extend(generated_graphs.generate_diurnal_graphs('010102', window))
     for graph_in in time_graphs:
         add_new_graph(window, gui, u_input, graph_in)
         handle_add_graph(window, u_input, gui)
@@ -1,28 +1,47 @@
 """
-Matrix ADT, ** only implemented for square matrices **
+Matrix ADT
+
+The entries are kept in a flat array, row after row. Solving a square system factorizes
+the matrix once (LU decomposition with partial pivoting) and keeps the factors, so the
+same matrix can be solved for any number of constant vectors. Matrices with more rows
+than columns are solved in the least squares sense, with a kept QR factorization.
+
+The matrix attribute (the entries as a list of rows) and add_multiple_of_row of earlier
+versions were removed on purpose: nothing used them once solve moved to the LU factors.
+Read the entries as a list of rows with get_matrix instead.
 """
-from typing import List
+from array import array
+from math import sqrt
+from operator import mul
+from typing import List, Optional
 
 
 class Matrix:
     """
-    2D list implementation of a matrix each element of the instance attribute:
-    'matrix' contains a row
+    A matrix of floats, its entries stored row after row in a flat array
 
     Instance Attributes:
         - rows: number of rows
         - columns: number of columns
-        - Matrix: the 2D list that holds the entries
+        - entries: the entries of the matrix in a flat array of floats, row after row
+        - lu: the LU factors of the matrix, or None if it has not been factorized yet
+        - pivots: the row of the matrix that ended up in each row of the LU factors
+        - qr: the Householder QR factors of the matrix by column, or None if it has not
+          been factorized yet
 
     Representation Invariants:
         - rows > 0
         - columns > 0
+        - len(self.entries) == 0 or len(self.entries) == self.rows * self.columns
 
     # Example initialization: Matrix(3, 3)
     """
     rows: int
     columns: int
-    matrix: List[List]
+    entries: array
+    lu: Optional[array]
+    pivots: List[int]
+    qr: Optional[List[List[float]]]
 
     def __init__(self, row: int, column: int) -> None:
         """
@@ -30,89 +49,217 @@ class Matrix:
         """
         self.rows = row
         self.columns = column
-        self.matrix = []
+        self.entries = array('d')
+        self.lu = None
+        self.pivots = []
+        self.qr = None
 
     def set_matrix(self, matrix: List[List]) -> None:
         """
-        change the matrix instance attribute
+        change the entries to those of matrix, given as a list of rows
+
+        The factorizations of the previous entries are dropped. matrix is copied, so
+        changing it afterwards does not change this Matrix.
 
         Preconditions:
             - all([len(matrix[i]) == self.columns for i in matrix])
             - len(matrix[i]) == rows
         """
-        self.matrix = matrix
+        self.entries = array('d', [entry for row in matrix for entry in row])
+        self.lu = None
+        self.pivots = []
+        self.qr = None
 
-    def add_multiple_of_row(self, row_add: int, row_added: int, multiple: float,
-                            matrix: List[list]) -> List[List]:
+    def get_matrix(self) -> List[List[float]]:
         """
-        Elementary row operation, add a multiple of one row to another
-        the rows are the list indices
+        Return the entries as a list of rows
 
-        row_add is the row to add
-        row_added is the row being added to
+        >>> matrix_test = Matrix(2, 2)
+        >>> matrix_test.set_matrix([[1, 2], [3, 4]])
+        >>> matrix_test.get_matrix()
+        [[1.0, 2.0], [3.0, 4.0]]
+        """
+        return [self.entries[i * self.columns: (i + 1) * self.columns].tolist()
+                for i in range(self.rows)]
+
+    def set_columns(self, columns: List[List[float]]) -> None:
+        """
+        change the matrix to the one with the given columns, e.g. a design matrix
+        built one column at a time
 
         Preconditions:
-            - 0 <= row_add < len(matrix)
-            - 0 <= row_added < len(matrix)
-            - row_add != row_added
+            - len(columns) == self.columns
+            - all([len(column) == self.rows for column in columns])
 
-        >>> matrix_test = Matrix(3, 3)
-        >>> matrix_test.set_matrix([[2, 3, 4], [5, 2, 1], [-2, -3, 4]])
-        >>> matrix_test.add_multiple_of_row(0, 1, 2, matrix_test.matrix)
-        [[2, 3, 4], [9, 8, 9], [-2, -3, 4]]
+        >>> matrix_test = Matrix(3, 2)
+        >>> matrix_test.set_columns([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+        >>> matrix_test.get_matrix()
+        [[1.0, 4.0], [2.0, 5.0], [3.0, 6.0]]
+        """
+        self.set_matrix([list(row) for row in zip(*columns)])
+
+    def factorize(self) -> None:
         """
-        for entry in range(0, self.columns):
-            matrix[row_added][entry] += multiple * matrix[row_add][entry]
+        Compute and keep the LU factorization of this square matrix, choosing the
+        largest remaining entry of each column as its pivot (partial pivoting)
 
-        return matrix
+        Raises ValueError if the matrix is singular.
+
+        Preconditions:
+            - self.rows == self.columns
+        """
+        n = self.rows
+        lu = array('d', self.entries)
+        pivots = list(range(n))
+        for k in range(n):
+            pivot = max(range(k, n), key=lambda i: abs(lu[i * n + k]))
+            if lu[pivot * n + k] == 0:
+                raise ValueError('the matrix is singular')
+            if pivot != k:
+                row_k = lu[k * n: (k + 1) * n]
+                lu[k * n: (k + 1) * n] = lu[pivot * n: (pivot + 1) * n]
+                lu[pivot * n: (pivot + 1) * n] = row_k
+                pivots[k], pivots[pivot] = pivots[pivot], pivots[k]
+            for i in range(k + 1, n):
+                factor = lu[i * n + k] / lu[k * n + k]
+                lu[i * n + k] = factor
+                if factor != 0:
+                    for j in range(k + 1, n):
+                        lu[i * n + j] -= factor * lu[k * n + j]
+        self.lu = lu
+        self.pivots = pivots
 
     def solve(self, constants: List[float]) -> List[float]:
         """
-        Solve a square matrix for a given list of constants by row reduction
+        Solve a square matrix for a given list of constants by LU decomposition
         Output is the list of variables corresponding to the order of the columns
 
+        Neither the matrix nor constants are changed, and the factorization is kept, so
+        solving the same matrix again only costs the substitutions.
+
         Preconditions:
-            - len(constants) == len(self.matrix)
+            - len(constants) == self.rows
 
        * Assumes that the Matrix has a unique solution *
 
         >>> matrix_test = Matrix(3, 3)
         >>> matrix_test.set_matrix([[2, -4, 5], [4, -1, 0], [-2, 2, -3]])
-        >>> matrix_test.solve([-33, -5, 19])
+        >>> constants = [-33, -5, 19]
+        >>> [round(x, 9) for x in matrix_test.solve(constants)]
         [-0.5, 3.0, -4.0]
+        >>> [round(x, 9) for x in matrix_test.solve(constants)], constants
+        ([-0.5, 3.0, -4.0], [-33, -5, 19])
         """
-        matrix = list.copy(self.matrix)
+        if self.lu is None:
+            self.factorize()
+        n = self.rows
+        lu = self.lu
 
-        # Puts the matrix in row echelon form
-        for column in range(0, self.columns):
+        # forward substitution with the unit lower triangular factor
+        solution = [float(constants[p]) for p in self.pivots]
+        for i in range(1, n):
+            solution[i] -= sum(map(mul, lu[i * n: i * n + i], solution[:i]))
 
-            for row in range(column + 1, self.rows):
-                if matrix[column][column] != 0:
-                    multiple = matrix[row][column] / - matrix[column][column]
-                    matrix = self.add_multiple_of_row(column, row, multiple, matrix)
-                    constants[row] = constants[row] + multiple * constants[column]
+        # back substitution with the upper triangular factor
+        for i in range(n - 1, -1, -1):
+            total = solution[i] - sum(map(mul, lu[i * n + i + 1: (i + 1) * n], solution[i + 1:]))
+            solution[i] = total / lu[i * n + i]
+        return solution
 
-        # Puts the matrix in reduced row echelon form (except the pivots are not one)
-        for column in range(self.columns - 1, 0, -1):
+    def solve_many(self, constant_vectors: List[List[float]]) -> List[List[float]]:
+        """
+        Solve this square matrix for every list of constants in constant_vectors, with
+        one factorization
+
+        >>> matrix_test = Matrix(2, 2)
+        >>> matrix_test.set_matrix([[0, 1], [2, 0]])
+        >>> matrix_test.solve_many([[1, 2], [3, 4]])
+        [[1.0, 1.0], [2.0, 3.0]]
+        """
+        return [self.solve(constants) for constants in constant_vectors]
 
-            for row in range(column - 1, -1, -1):
-                if matrix[column][column] != 0:
-                    multiple = -matrix[row][column] / matrix[column][column]
-                    matrix = self.add_multiple_of_row(column, row, multiple, matrix)
-                    constants[row] = constants[row] + multiple * constants[column]
+    def factorize_qr(self) -> None:
+        """
+        Compute and keep the Householder QR factorization of this matrix, column by
+        column. Each column holds its part of the triangular factor R above the diagonal
+        and its Householder vector from the diagonal down, whose diagonal entry is kept
+        as the last entry of the column.
 
-        # Makes the pivots 1
-        for column in range(0, self.columns):
-            constants[column] = constants[column] / matrix[column][column]
+        Raises ValueError if the columns are not linearly independent.
 
-        return constants
+        Preconditions:
+            - self.rows >= self.columns
+        """
+        columns = [self.entries[j::self.columns].tolist() for j in range(self.columns)]
+        for k in range(self.columns):
+            # the reflection v maps column k below the diagonal onto its first entry
+            v = columns[k][k:]
+            norm = sqrt(sum(map(mul, v, v)))
+            if norm == 0:
+                raise ValueError('the columns are not linearly independent')
+            alpha = -norm if v[0] >= 0 else norm
+            v[0] -= alpha
+            beta = sum(map(mul, v, v))
+            for target in columns[k + 1:]:
+                helper_reflect(target, v, beta, k)
+            columns[k][k:] = [alpha] + v[1:] + [v[0]]
+        self.qr = columns
+
+    def least_squares(self, constants: List[float]) -> List[float]:
+        """
+        Return the variables minimizing the sum of the squared differences between the
+        product of this matrix with them and constants, using the kept QR factorization
+
+        Preconditions:
+            - len(constants) == self.rows
+            - self.rows >= self.columns
+
+        >>> matrix_test = Matrix(3, 2)
+        >>> matrix_test.set_matrix([[1, 0], [1, 1], [1, 2]])
+        >>> [round(x, 9) for x in matrix_test.least_squares([1, 2, 4])]
+        [0.833333333, 1.5]
+        """
+        if self.qr is None:
+            self.factorize_qr()
+        rhs = [float(c) for c in constants]
+        for k in range(self.columns):
+            column = self.qr[k]
+            v = [column[-1]] + column[k + 1: self.rows]
+            helper_reflect(rhs, v, sum(map(mul, v, v)), k)
+
+        solution = [0.0] * self.columns
+        for k in range(self.columns - 1, -1, -1):
+            total = rhs[k] - sum(self.qr[j][k] * solution[j] for j in range(k + 1, self.columns))
+            solution[k] = total / self.qr[k][k]
+        return solution
+
+    def least_squares_many(self, constant_vectors: List[List[float]]) -> List[List[float]]:
+        """
+        Return the least squares solution of this matrix for every list of constants
+        in constant_vectors, with one factorization
+        """
+        return [self.least_squares(constants) for constants in constant_vectors]
+
+
+def helper_reflect(target: List[float], v: List[float], beta: float, start: int) -> None:
+    """Apply the Householder reflection I - 2 v v^T / beta to the entries of target from
+    index start on, in place
+
+    >>> target = [5.0, 3.0, 4.0]
+    >>> helper_reflect(target, [-2.0, 4.0], 20.0, 1)
+    >>> [round(x, 9) for x in target]
+    [5.0, 5.0, 0.0]
+    """
+    tail = target[start: start + len(v)]
+    tau = 2 * sum(map(mul, v, tail)) / beta
+    target[start: start + len(v)] = [tail[i] - tau * v[i] for i in range(len(v))]
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['python_ta.contracts'],
+        'extra-imports': ['python_ta.contracts', 'array', 'math', 'operator'],
         'allowed-io': [],
         'max-line-length': 100,
         'disable': ['R1705', 'C0200']
@@ -0,0 +1,274 @@
+"""
+Single pass parser for NAPS hourly csv files
+
+The file is read as bytes, line by line. The bilingual preamble is skipped, and each data
+row is typed, has its ID padded and its date normalized as it is read, straight into the
+columns used by loading_data.DataFile.
+"""
+import csv
+import datetime as d
+from array import array
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+# Layout of a NAPS data row
+ID_COL = 1
+DATE_COL = 6
+FIRST_HOUR_COL = 7
+HOURS_PER_DAY = 24
+ROW_LENGTH = FIRST_HOUR_COL + HOURS_PER_DAY
+
+# array typecodes of the columns: int16 station ids, int32 day numbers, float32 readings
+# and uint32 validity masks
+STATION_TYPECODE = 'h'
+DATE_TYPECODE = 'i'
+HOURLY_TYPECODE = 'f'
+VALID_TYPECODE = 'I'
+
+# Validity mask of a row with all of its readings: bit h is set when hour h + 1 is valid
+ALL_VALID = (1 << HOURS_PER_DAY) - 1
+
+# NAPS files are written in latin-1 (the French text in the preamble and city names)
+ENCODING = 'latin-1'
+MISSING = b'-999'
+MISSING_VALUE = float('nan')
+
+
+def parse_naps(file_path: str, station_filter: Optional[Collection[str]] = None) \
+        -> Tuple[Dict[str, Any], Dict[str, memoryview]]:
+    """Parse the NAPS csv file at file_path in one pass.
+
+    If station_filter is given, only the rows of those station codes are kept, and the
+    file is only read up to the last of their rows.
+
+    Returns the DataFile attributes (header_row, stations, pollutant, year, station_codes
+    and station_info) and the DataFile columns (row_station, row_date, hours and
+    row_valid). Every row is kept: a missing (-999) reading is stored as NaN and its bit
+    is cleared in the validity mask of the row.
+
+    Each line is only split into the 7 leading fields and the block of hourly readings;
+    the readings are then split and converted in one go.
+
+    Preconditions:
+        - the rows of each station are contiguous and sorted by date
+
+    >>> attributes, columns = parse_naps('doctest_dataset/O3_2019.csv')
+    >>> attributes['pollutant'], attributes['year'], len(columns['row_date'])
+    ('O3', '2019', 82490)
+    >>> attributes['stations']['010102']
+    [0, 364]
+    >>> bin(columns['row_valid'][10])
+    '0b111111111111100000001111'
+    >>> attributes, columns = parse_naps('doctest_dataset/O3_2019.csv', ['010102'])
+    >>> attributes['stations'], len(columns['row_date'])
+    ({'010102': [0, 364]}, 365)
+    """
+    attributes = {'header_row': [], 'stations': {}, 'pollutant': '', 'year': '',
+                  'station_codes': [], 'station_info': []}
+    stations = attributes['stations']
+    station_col = array(STATION_TYPECODE)
+    date_col = array(DATE_TYPECODE)
+    hour_col = array(HOURLY_TYPECODE)
+    valid_col = array(VALID_TYPECODE)
+
+    # station ids, day numbers and readings by raw bytes, so that repeated codes, dates
+    # and readings are only converted once
+    ids = {}
+    days = {}
+    readings = ReadingMemo({MISSING: MISSING_VALUE})
+    last_code = None
+    st_index = -1
+    station_rows = []
+    found_header = False
+    # the filtered stations that have not been reached yet
+    pending = set() if station_filter is None else set(station_filter)
+
+    with open(file_path, 'rb') as file:
+        for line in file:
+            fields = helper_split_row(line)
+
+            if not found_header:
+                if helper_header_bytes(fields):
+                    found_header = True
+                    attributes['header_row'] = [f.decode(ENCODING) for f in
+                                                fields[:FIRST_HOUR_COL]
+                                                + fields[FIRST_HOUR_COL].split(b',')]
+                    attributes['header_row'][-1] = attributes['header_row'][-1].rstrip()
+                continue
+            # a data row has all of its hourly readings, checked before its station is added
+            if len(fields) <= FIRST_HOUR_COL \
+                    or fields[FIRST_HOUR_COL].count(b',') < HOURS_PER_DAY - 1:
+                continue
+
+            row = len(date_col)
+            if fields[ID_COL] != last_code:
+                last_code = fields[ID_COL]
+                if last_code not in ids:
+                    code = last_code.decode(ENCODING).zfill(6)
+                    if station_filter is not None and code not in station_filter:
+                        ids[last_code] = -1
+                    else:
+                        ids[last_code] = helper_add_station(attributes, code, fields, row)
+                        pending.discard(code)
+                st_index = ids[last_code]
+                if st_index != -1:
+                    station_rows = stations[attributes['station_codes'][st_index]]
+                elif len(pending) == 0:
+                    break  # every filtered station has been read
+            if st_index == -1:
+                continue
+
+            hour_fields = fields[FIRST_HOUR_COL].rstrip().split(b',')[:HOURS_PER_DAY]
+            station_rows[1] = row
+
+            date = fields[DATE_COL]
+            if date not in days:
+                days[date] = helper_parse_day(date)
+            station_col.append(st_index)
+            date_col.append(days[date])
+            hour_col.extend(map(readings.__getitem__, hour_fields))
+            if MISSING in hour_fields:
+                valid_col.append(helper_valid_mask(hour_fields))
+            else:
+                valid_col.append(ALL_VALID)
+
+            if row == 0:
+                attributes['pollutant'] = fields[0].decode(ENCODING)
+                attributes['year'] = str(d.date.fromordinal(days[date]).year)
+
+    columns = {'row_station': memoryview(station_col),
+               'row_date': memoryview(date_col),
+               'hours': memoryview(hour_col),
+               'row_valid': memoryview(valid_col)}
+    return (attributes, columns)
+
+
+class ReadingMemo(dict):
+    """
+    A dictionary from the bytes of a reading to its float value, which converts and
+    remembers readings it has not seen yet. NAPS readings take few distinct values,
+    so looking them up is faster than converting every one of them.
+
+    >>> memo = ReadingMemo()
+    >>> memo[b'35'], memo[b'0.5'], len(memo)
+    (35.0, 0.5, 2)
+    """
+
+    def __missing__(self, key: bytes) -> float:
+        value = self[key] = float(key)
+        return value
+
+
+def helper_split_row(line: bytes) -> List[bytes]:
+    """Split a line of a NAPS file into its first FIRST_HOUR_COL fields followed by the
+    unsplit block of hourly readings. Quoted fields are handled by the csv module.
+
+    >>> helper_split_row(b'O3,010102,St Johns,NL,47.5,-52.7,2019-01-01,35,35\\r\\n')[6:]
+    [b'2019-01-01', b'35,35\\r\\n']
+    """
+    if b'"' not in line:
+        return line.split(b',', FIRST_HOUR_COL)
+    fields = [f.encode(ENCODING) for f in next(csv.reader([line.decode(ENCODING)]))]
+    return fields[:FIRST_HOUR_COL] + [b','.join(fields[FIRST_HOUR_COL:])]
+
+
+def helper_add_station(attributes: Dict[str, Any], code: str, fields: List[bytes],
+                       row: int) -> int:
+    """Add the station with the given code, whose first row is row and has the given
+    fields, to attributes and return its station id.
+
+    The station code must be padded to 6 digits, as spreadsheet exports of NAPS files drop
+    the leading 0 of the Atlantic station codes.
+    """
+    attributes['stations'][code] = [row, row]
+    attributes['station_codes'].append(code)
+    attributes['station_info'].append([f.decode(ENCODING) for f in fields[ID_COL + 1: DATE_COL]])
+    return len(attributes['station_codes']) - 1
+
+
+def helper_valid_mask(hour_fields: List[bytes]) -> int:
+    """Return the validity mask of a row with the given hourly readings
+
+    >>> helper_valid_mask([b'1', b'-999', b'3'])
+    5
+    """
+    mask = 0
+    for hour in range(len(hour_fields)):
+        if hour_fields[hour] != MISSING:
+            mask |= 1 << hour
+    return mask
+
+
+def helper_parse_day(date: bytes) -> int:
+    """Return the day number of a NAPS date written as YYYY-MM-DD, YYYY/MM/DD or YYYYMMDD
+
+    >>> helper_parse_day(b'2019-01-02') == helper_parse_day(b'20190102') == 737061
+    True
+    """
+    digits = date.replace(b'-', b'').replace(b'/', b'')
+    return d.date(int(digits[0:4]), int(digits[4:6]), int(digits[6:8])).toordinal()
+
+
+def helper_header_bytes(fields: List[bytes]) -> bool:
+    """Return whether the row fields is the header of the data table
+
+    >>> helper_header_bytes([b'Pollutant//Polluant', b'NAPS ID//Identifiant SNPA'])
+    True
+    >>> helper_header_bytes([b'Units // Unit\\xe9s', b' ppb'])
+    False
+    """
+    return len(fields) >= 2 and b'NAPS' in fields[1] and b'ID' in fields[1]
+
+
+def legacy_parse(file_path: str) -> List[List[Any]]:
+    """Parse the NAPS csv file at file_path the way DataFile.load() and DataFile.format()
+    used to: read every row as text with the csv module, then walk every cell again to
+    pad the IDs, strip the date separators and convert the readings.
+
+    This is kept as the reference that parse_naps is checked and timed against (see
+    bench_parsing.py). Unlike parse_naps, it drops every row with a missing reading, so
+    both give the same rows when parse_naps keeps its complete rows only:
+
+    >>> file_path = 'doctest_dataset/O3_2019.csv'
+    >>> attributes, columns = parse_naps(file_path)
+    >>> codes, hours = attributes['station_codes'], columns['hours']
+    >>> parsed = [[codes[columns['row_station'][i]], columns['row_date'][i]]
+    ...           + hours[i * HOURS_PER_DAY: (i + 1) * HOURS_PER_DAY].tolist()
+    ...           for i in range(len(columns['row_valid']))
+    ...           if columns['row_valid'][i] == ALL_VALID]
+    >>> legacy = [[row[ID_COL], helper_parse_day(row[DATE_COL].encode())]
+    ...           + row[FIRST_HOUR_COL:] for row in legacy_parse(file_path)]
+    >>> len(parsed) > 0 and parsed == legacy
+    True
+    """
+    found_header = False
+    rows = []
+    with open(file_path, 'r', errors='replace') as file:
+        for row in csv.reader(file, delimiter=','):
+            if not found_header:
+                found_header = len(row) >= 2 and 'NAPS' in row[1] and 'ID' in row[1]
+            elif '-999' not in row:
+                rows.append(row)
+
+    for i in range(len(rows)):
+        for j in range(len(rows[i])):
+            if j == ID_COL and len(rows[i][j]) < 6:
+                rows[i][j] = '0' + rows[i][j]
+            if j == DATE_COL:
+                rows[i][j] = rows[i][j].replace('-', '').replace('/', '')
+            if FIRST_HOUR_COL <= j < ROW_LENGTH:
+                rows[i][j] = float(rows[i][j])
+    return rows
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['csv', 'datetime', 'array', 'typing'],
+        'allowed-io': ['parse_naps', 'legacy_parse'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,255 @@
+"""
+Hourly odd oxygen (Ox = O3 + NO2) for every station of a pair of NAPS files
+
+An OxFile is a DataFile whose rows are computed from an O3 and an NO2 DataFile of the
+same year instead of being read from a csv file. It has a row for every day of every
+station with both pollutants, and the hourly Ox readings of that day; an hour is valid
+only when both of its readings are. Being a DataFile, it is queried, aggregated and
+loaded lazily like any other.
+
+Many stations only measure one of the two pollutants. Given a radius, an OxFile pairs
+each O3 station without NO2 with the closest NO2 station within the radius (see
+stations.match_stations). The pairing only goes that way: an NO2 station without O3 has
+no Ox, since the Ox of a station is located by its O3 readings, which make up most of it.
+The pairing table is written next to the O3 file in '<Ox file path>.pairs', so later
+loads only read the rows of the paired stations.
+"""
+import json
+import os
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+import data_cache
+from compute import merge_join
+from loading_data import DataFile
+from stations import match_stations
+from naps_parser import HOURS_PER_DAY, STATION_TYPECODE, DATE_TYPECODE, HOURLY_TYPECODE, \
+    VALID_TYPECODE
+
+OX = 'Ox'
+PAIRS_SUFFIX = '.pairs'
+# Default distance within which an NO2 station stands in for a missing one, in km
+DEFAULT_RADIUS_KM = 25.0
+
+
+class OxFile(DataFile):
+    """
+    The hourly Ox of the stations measuring both O3 and NO2 in a year
+
+    file_path is where an Ox csv file of the year would be, next to the O3 file; it is
+    only used as a name, as the readings are computed when the OxFile is loaded.
+
+    The Ox of an O3 station is computed with the NO2 readings of the station it is paired
+    with, and takes the code and location of the O3 station.
+
+    Instance Attributes:
+        - o3: the O3 readings of the year
+        - no2: the NO2 readings of the year
+        - radius_km: how far the NO2 station paired with an O3 station may be, or None to
+          only pair stations with the same code
+        - pairs: the NO2 station code paired with each O3 station code, or None until it
+          is needed
+
+    Representation Invariants:
+        - not self.loaded or self.o3.year == self.no2.year
+        - self.radius_km is None or self.radius_km >= 0
+
+    >>> o3 = DataFile('doctest_dataset/O3_2019.csv')
+    >>> ox = OxFile(o3, o3)
+    >>> ox.file_path
+    'doctest_dataset/Ox_2019.csv'
+    >>> ox.return_plot_daily('010102', '20190101', '20190102')[2]
+    [63.75, 62.5]
+    >>> ox.pollutant, ox.num_rows(), len(ox.stations)
+    ('Ox', 82490, 226)
+    """
+    o3: DataFile
+    no2: DataFile
+    radius_km: Optional[float]
+    pairs: Optional[Dict[str, str]]
+
+    def __init__(self, o3: DataFile, no2: DataFile, radius_km: Optional[float] = None) -> None:
+        name = os.path.basename(o3.file_path)
+        name = OX + name[name.index('_'):] if '_' in name else OX + '_' + name
+        DataFile.__init__(self, os.path.join(os.path.dirname(o3.file_path), name))
+        self.o3 = o3
+        self.no2 = no2
+        self.radius_km = radius_km
+        self.pairs = None
+
+    def load(self, use_cache: bool = True, station_filter: Optional[List[str]] = None) -> None:
+        """Compute the columns of this OxFile from the O3 and NO2 files, loading their
+        rows of the stations in station_filter (every station if None) if needed.
+        Ox is never cached, so use_cache only applies to the O3 and NO2 files and the
+        pairing table."""
+        self.loaded = True
+        if not use_cache:
+            self.o3.load(False, station_filter)
+            self.no2.load(False)
+            self.pairs = None
+        pairs = self.station_pairs(use_cache) if self.radius_km is not None else None
+        self.o3.ensure_loaded(station_filter)
+        if station_filter is not None and pairs is not None:
+            self.no2.ensure_loaded(sorted({pairs.get(code, code) for code in station_filter}))
+        else:
+            self.no2.ensure_loaded(station_filter)
+        attributes, columns = compute_ox(self.o3, self.no2, station_filter, pairs)
+        self.helper_set_columns(attributes, columns)
+        self.station_filter = list(station_filter) if station_filter is not None else None
+
+    def station_pairs(self, use_cache: bool = True) -> Dict[str, str]:
+        """Return the NO2 station code paired with each O3 station code (see
+        stations.match_stations), computing it if it isn't known yet.
+
+        Stations are only paired by code if radius_km is None. Otherwise the pairing
+        needs the locations of every station of both files, so the table is read from
+        the pairs file of this OxFile if it is valid, and written to it when it is
+        computed.
+
+        >>> o3 = DataFile('doctest_dataset/O3_2019.csv')
+        >>> pairs = OxFile(o3, o3, DEFAULT_RADIUS_KM).station_pairs()
+        >>> len(pairs), pairs['010102']
+        (226, '010102')
+        >>> again = OxFile(DataFile(o3.file_path), DataFile(o3.file_path), DEFAULT_RADIUS_KM)
+        >>> again.station_pairs() == pairs, again.o3.loaded
+        (True, False)
+        """
+        if self.pairs is not None:
+            return self.pairs
+        if self.radius_km is None:
+            self.o3.ensure_loaded()
+            self.pairs = {code: code for code in self.o3.station_codes}
+            return self.pairs
+
+        key = self.helper_pairs_key()
+        if use_cache and key is not None:
+            self.pairs = read_pairs(self.file_path + PAIRS_SUFFIX, key)
+        if self.pairs is None:
+            self.o3.ensure_loaded()
+            self.no2.ensure_loaded()
+            self.pairs = match_stations(self.o3.catalog, self.no2.catalog, self.radius_km)
+            if key is not None:
+                write_pairs(self.file_path + PAIRS_SUFFIX, key, self.pairs)
+        return self.pairs
+
+    def helper_pairs_key(self) -> Optional[Dict[str, Any]]:
+        """Return the values that must match for a pairs file of this OxFile to be valid,
+        or None if the O3 or NO2 csv file is missing, so there is nothing to key it on
+
+        >>> o3 = DataFile('doctest_dataset/O3_2019.csv')
+        >>> OxFile(o3, DataFile('doctest_dataset/NO2_2019.csv'), 25.0).helper_pairs_key()
+        """
+        if not (os.path.isfile(self.o3.file_path) and os.path.isfile(self.no2.file_path)):
+            return None
+        return {'o3': data_cache.cache_key(self.o3.file_path, 0),
+                'no2': data_cache.cache_key(self.no2.file_path, 0),
+                'radius': self.radius_km}
+
+    def save_cache(self) -> bool:
+        """Ox has no csv file to key a cache on, so nothing is written"""
+        return False
+
+    def load_cache(self) -> bool:
+        """Ox has no csv file to key a cache on, so there is no cache to read"""
+        return False
+
+
+def compute_ox(o3: DataFile, no2: DataFile, stations: Optional[List[str]] = None,
+               pairs: Optional[Dict[str, str]] = None) \
+        -> Tuple[Dict[str, Any], Dict[str, memoryview]]:
+    """Return the DataFile attributes and columns (see naps_parser.parse_naps) of the
+    hourly Ox of the O3 stations (only those in stations if given) with NO2 readings at
+    the station they are paired with in pairs, or at the same station if pairs is None.
+    Each station is done in one pass over its rows.
+
+    The days of a station are matched with compute.merge_join, as the rows of a station
+    are sorted by date. The Ox reading of an hour is NaN, and not valid, if either of its
+    readings is missing.
+
+    Preconditions:
+        - o3.loaded and no2.loaded
+        - o3.year == no2.year
+    """
+    attributes = {'header_row': list(o3.header_row), 'stations': {}, 'pollutant': OX,
+                  'year': o3.year, 'station_codes': [], 'station_info': []}
+    station_col = array(STATION_TYPECODE)
+    date_col = array(DATE_TYPECODE)
+    hour_col = array(HOURLY_TYPECODE)
+    valid_col = array(VALID_TYPECODE)
+
+    for code in o3.station_codes:
+        no2_code = code if pairs is None else pairs.get(code, '')
+        if no2_code not in no2.stations or (stations is not None and code not in stations):
+            continue
+        [a, b] = o3.stations[code]
+        [c, e] = no2.stations[no2_code]
+        matched = merge_join(o3.row_date[a: b + 1].tolist(), no2.row_date[c: e + 1].tolist())
+        if matched == []:
+            continue
+
+        st_index = len(attributes['station_codes'])
+        attributes['stations'][code] = [len(date_col), len(date_col) + len(matched) - 1]
+        attributes['station_codes'].append(code)
+        attributes['station_info'].append(list(o3.station_info[o3.row_station[a]]))
+
+        o3_hours = o3.hours[a * HOURS_PER_DAY: (b + 1) * HOURS_PER_DAY].tolist()
+        no2_hours = no2.hours[c * HOURS_PER_DAY: (e + 1) * HOURS_PER_DAY].tolist()
+        for (i, j) in matched:
+            station_col.append(st_index)
+            date_col.append(o3.row_date[a + i])
+            hour_col.extend(map(float.__add__,
+                                o3_hours[i * HOURS_PER_DAY: (i + 1) * HOURS_PER_DAY],
+                                no2_hours[j * HOURS_PER_DAY: (j + 1) * HOURS_PER_DAY]))
+            valid_col.append(o3.row_valid[a + i] & no2.row_valid[c + j])
+
+    columns = {'row_station': memoryview(station_col),
+               'row_date': memoryview(date_col),
+               'hours': memoryview(hour_col),
+               'row_valid': memoryview(valid_col)}
+    return (attributes, columns)
+
+
+def read_pairs(path: str, key: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """Return the pairing table stored in the pairs file at path, or None if there is no
+    such file or it was not written with the given key"""
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            stored = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(stored, dict) or stored.get('key') != key:
+        return None
+    return stored.get('pairs')
+
+
+def write_pairs(path: str, key: Dict[str, Any], pairs: Dict[str, str]) -> bool:
+    """Write the pairing table pairs with its key to the pairs file at path. Returns
+    whether the file was written; like the binary caches, a file that cannot be written
+    is simply skipped."""
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'key': key, 'pairs': pairs}, file)
+        os.replace(temp_path, path)
+    except OSError:
+        return False
+    return True
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['json', 'os', 'array', 'typing', 'data_cache', 'compute', 'loading_data',
+                          'naps_parser', 'stations'],
+        'allowed-io': ['read_pairs', 'write_pairs'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,140 @@
+"""
+Load many NAPS csv files at once across a pool of processes
+
+Each worker process parses one file and writes its binary cache (see data_cache), so the
+parsed columns come back to the main process by memory-mapping the cache file rather than
+being pickled. Files whose cache cannot be written come back as the raw bytes of their
+columns instead.
+"""
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+import naps_parser
+from compute import RunningStats
+from loading_data import DataFile
+
+
+def find_files(directory: str) -> List[str]:
+    """Return the paths of the csv files in directory, sorted by name
+
+    >>> find_files('doctest_dataset')
+    ['doctest_dataset/O3_2019.csv']
+    """
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.lower().endswith('.csv')]
+
+
+def load_files(paths: Union[str, List[str]],
+               max_workers: Optional[int] = None) -> List[DataFile]:
+    """Return loaded DataFiles for the csv files in paths, parsing the files that are not
+    cached yet in parallel, using up to max_workers processes (one per core if None).
+
+    paths is either a list of csv file paths or a directory of csv files.
+
+    >>> files = load_files('doctest_dataset')
+    >>> [(f.pollutant, f.year, f.num_rows()) for f in files]
+    [('O3', '2019', 82490)]
+    """
+    if isinstance(paths, str):
+        paths = find_files(paths)
+
+    files = [DataFile(path) for path in paths]
+    to_parse = [f for f in files if not f.load_cache()]
+
+    if len(to_parse) == 1:
+        to_parse[0].load()
+    elif len(to_parse) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(helper_parse_file, [f.file_path for f in to_parse])
+            for data_file, result in zip(to_parse, results):
+                if result is not None:
+                    data_file.helper_set_columns(result[0], helper_unpack_columns(result[1]))
+                elif not data_file.load_cache():
+                    data_file.load()  # the file changed since it was parsed
+
+    for data_file in files:
+        data_file.loaded = True
+    return files
+
+
+def stats_of_files(paths: Union[str, List[str]],
+                   max_workers: Optional[int] = None) -> Dict[str, RunningStats]:
+    """Return the summary statistics of the valid hourly readings of each pollutant over
+    the csv files in paths (a list of csv file paths or a directory of csv files).
+
+    Each file is summarized in a worker process, streaming its rows, and only the
+    RunningStats of the files come back to be merged.
+
+    >>> stats = stats_of_files('doctest_dataset')
+    >>> stats['O3'].count, round(stats['O3'].mean, 3)
+    (1851327, 25.313)
+    """
+    if isinstance(paths, str):
+        paths = find_files(paths)
+
+    stats = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for pollutant, file_stats in executor.map(helper_file_stats, paths):
+            if pollutant not in stats:
+                stats[pollutant] = RunningStats()
+            stats[pollutant].merge(file_stats)
+    return stats
+
+
+def helper_file_stats(file_path: str) -> Tuple[str, RunningStats]:
+    """Return the pollutant and the summary statistics of the valid hourly readings of
+    the csv file at file_path. This runs in a worker process."""
+    data_file = DataFile(file_path)
+    data_file.load()
+    stats = RunningStats()
+    for _, _, values in data_file.iter_rows():
+        stats.update_many(values)
+    return (data_file.pollutant, stats)
+
+
+def helper_parse_file(file_path: str) \
+        -> Optional[Tuple[Dict[str, Any], Dict[str, Tuple[str, bytes]]]]:
+    """Parse the csv file at file_path and write its binary cache. This runs in a worker
+    process.
+
+    Returns None if the cache was written. Otherwise returns the parsed attributes, and the
+    typecode and bytes of every column.
+    """
+    attributes, columns = naps_parser.parse_naps(file_path)
+    data_file = DataFile(file_path)
+    data_file.helper_set_columns(attributes, columns)
+    if data_file.save_cache():
+        return None
+    return (attributes, {name: (columns[name].format, columns[name].tobytes())
+                         for name in columns})
+
+
+def helper_unpack_columns(packed: Dict[str, Tuple[str, bytes]]) -> Dict[str, memoryview]:
+    """Rebuild the columns sent back by helper_parse_file
+
+    >>> helper_unpack_columns({'row_date': ('i', array('i', [1, 2]).tobytes())})['row_date'][1]
+    2
+    """
+    columns = {}
+    for name in packed:
+        column = array(packed[name][0])
+        column.frombytes(packed[name][1])
+        columns[name] = memoryview(column)
+    return columns
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['os', 'array', 'concurrent.futures', 'typing',
+                          'naps_parser', 'compute', 'loading_data'],
+        'allowed-io': ['find_files', 'load_files', 'stats_of_files', 'helper_file_stats',
+                       'helper_parse_file'],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,87 @@
+"""
+Registry of the emission regulations whose effects on NO2, O3 and Ox are studied
+
+Graphs mark the regulations that fall within their dates, and intervention.py measures
+the levels and trends of every station before and after each of them.
+"""
+import datetime
+from typing import List, Optional
+
+
+class Regulation:
+    """
+    An emission regulation
+
+    Instance Attributes:
+        - code: the short name shown on graphs, e.g. 'CEPA'
+        - name: the full name of the regulation
+        - date: the date the regulation was passed
+
+    Representation Invariants:
+        - len(self.code) > 0
+    """
+    code: str
+    name: str
+    date: datetime.date
+
+    def __init__(self, code: str, name: str, date: datetime.date) -> None:
+        self.code = code
+        self.name = name
+        self.date = date
+
+    def __repr__(self) -> str:
+        return 'Regulation(' + self.code + ', ' + self.date.isoformat() + ')'
+
+
+REGULATIONS = [
+    Regulation('CEPA', 'Canadian Environmental Protection Act, 1999',
+               datetime.date(1999, 9, 14)),
+    Regulation('FACVEF', 'Federal Agenda on Cleaner Vehicles, Engines and Fuels',
+               datetime.date(2001, 2, 13)),
+    Regulation('CEPAA', 'Passenger Automobile and Light Truck Greenhouse Gas Emission '
+                        'Regulations', datetime.date(2010, 6, 10))
+]
+
+
+def regulations_between(start: datetime.date, end: datetime.date,
+                        registry: Optional[List[Regulation]] = None) -> List[Regulation]:
+    """Return the regulations of registry (REGULATIONS if None) passed between start and
+    end (INCLUSIVE), by date
+
+    >>> regulations_between(datetime.date(1999, 1, 1), datetime.date(2001, 12, 31))
+    [Regulation(CEPA, 1999-09-14), Regulation(FACVEF, 2001-02-13)]
+    """
+    registry = REGULATIONS if registry is None else registry
+    return sorted([r for r in registry if start <= r.date <= end], key=lambda r: r.date)
+
+
+def find_regulation(code: str, registry: Optional[List[Regulation]] = None) -> Regulation:
+    """Return the regulation of registry (REGULATIONS if None) with the given code
+
+    Preconditions:
+        - any(r.code == code for r in registry)
+
+    >>> find_regulation('FACVEF').date
+    datetime.date(2001, 2, 13)
+    """
+    registry = REGULATIONS if registry is None else registry
+    return [r for r in registry if r.code == code][0]
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['datetime', 'typing'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,406 @@
+"""
+Robust trends of pollution series: Sen's slope and the Mann-Kendall test
+
+Sen's slope is the median of the slopes between every pair of points, so a few spikes do
+not move it the way they move a least squares line. The Mann-Kendall test measures how
+often a later value is higher than an earlier one, and tests whether there is a trend.
+
+Pairs of points with the same x (e.g. in a scatter of two pollutants) have no slope, and
+are left out of both, as in Sen's definition.
+
+Neither looks at the n(n - 1) / 2 pairs one by one:
+
+    - the number of pairs with a slope of at most s is the number of inversions of the
+      order of the points by y - s * x with respect to their order by x, which a Fenwick
+      tree counts in O(n log n)
+    - Sen's slope is selected by randomized interval contraction: the slopes of an
+      interval of slopes are the inversions between the orders of its two bounds, so n of
+      them can be drawn at random while merge sorting, and the two sample slopes around
+      the median narrow the interval. When few slopes are left, they are listed and
+      sorted. This takes O(n log n) time on average.
+    - the Mann-Kendall statistic S is the number of pairs of increasing values minus the
+      number of pairs of decreasing values, counted with a Fenwick tree over the ranks
+      of the values
+"""
+import random
+from math import erfc, isnan, sqrt
+from typing import Dict, List, Optional, Tuple
+from loading_data import DataFile
+
+# The bounds of an interval of slopes are (dy, dx, closed): the slope dy / dx (dx >= 0,
+# with dx == 0 for the infinite slopes) and whether the slopes equal to it are below it
+LOWEST = (-1.0, 0.0, True)
+HIGHEST = (1.0, 0.0, True)
+
+
+class RobustTrend:
+    """
+    The robust trend of a series
+
+    Instance Attributes:
+        - slope: Sen's slope, in units of y per unit of x
+        - intercept: the median of y - slope * x
+        - s: the Mann-Kendall statistic
+        - z: the normal score of s, corrected for continuity and ties
+        - p_value: the two-sided p-value of the Mann-Kendall test
+        - count: the number of points of the series
+
+    Representation Invariants:
+        - self.count >= 2
+        - 0 <= self.p_value <= 1
+    """
+    slope: float
+    intercept: float
+    s: int
+    z: float
+    p_value: float
+    count: int
+
+    def __init__(self, slope: float, intercept: float, s: int, z: float,
+                 p_value: float, count: int) -> None:
+        self.slope = slope
+        self.intercept = intercept
+        self.s = s
+        self.z = z
+        self.p_value = p_value
+        self.count = count
+
+
+class FenwickTree:
+    """
+    Counts of the integers 0 to size - 1, with prefix sums in O(log size)
+
+    Instance Attributes:
+        - tree: the partial sums of the counts, tree[i] holding the counts of the
+          integers i - (i & -i) to i - 1
+
+    Representation Invariants:
+        - len(self.tree) > 0
+
+    >>> counts = FenwickTree(5)
+    >>> counts.add(3)
+    >>> counts.add(1)
+    >>> counts.count_below(3), counts.count_below(4)
+    (1, 2)
+    """
+    tree: List[int]
+
+    def __init__(self, size: int) -> None:
+        self.tree = [0] * (size + 1)
+
+    def add(self, value: int) -> None:
+        """Count value once more"""
+        i = value + 1
+        while i < len(self.tree):
+            self.tree[i] += 1
+            i += i & -i
+
+    def count_below(self, value: int) -> int:
+        """Return the number of counted integers lower than value"""
+        total = 0
+        i = value
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+def sen_slope(x_val: List[float], y_val: List[float], seed: int = 0) -> float:
+    """Return Sen's slope of the points (x_val[i], y_val[i]): the median of the slopes
+    between every two points with different x, or NaN if there are none
+
+    Preconditions:
+        - len(x_val) == len(y_val) >= 2
+
+    >>> sen_slope([1.0, 2.0, 3.0, 4.0, 5.0], [1.0, 2.0, 3.0, 100.0, 5.0])
+    1.0
+    >>> x = [float(i) for i in range(300)]
+    >>> noise = random.Random(2)
+    >>> y = [0.5 * i + noise.gauss(0, 5) for i in x]
+    >>> slope = sen_slope(x, y)
+    >>> slopes = sorted((y[j] - y[i]) / (x[j] - x[i]) for j in range(300) for i in range(j))
+    >>> slope == (slopes[22424] + slopes[22425]) / 2
+    True
+    >>> x = [float(i // 3) for i in range(60)]
+    >>> y = [0.5 * i + noise.gauss(0, 5) for i in x]
+    >>> slopes = sorted((y[j] - y[i]) / (x[j] - x[i]) for j in range(60) for i in range(j)
+    ...                 if x[j] != x[i])
+    >>> len(slopes), sen_slope(x, y) == (slopes[854] + slopes[855]) / 2
+    (1710, True)
+    >>> sen_slope([1.0, 1.0], [2.0, 3.0])
+    nan
+    """
+    # points with the same x are sorted by y, which every order of helper_order keeps, so
+    # their pairs are never counted below a bound nor drawn between two bounds
+    order = sorted(range(len(x_val)), key=lambda i: (x_val[i], y_val[i]))
+    x_val = [float(x_val[i]) for i in order]
+    y_val = [float(y_val[i]) for i in order]
+    pairs = helper_count_pairs(x_val)
+    if pairs == 0:
+        return float('nan')
+    rng = random.Random(seed)
+    if pairs % 2 == 1:
+        return helper_select_slope(x_val, y_val, pairs // 2, rng)
+    return (helper_select_slope(x_val, y_val, pairs // 2 - 1, rng)
+            + helper_select_slope(x_val, y_val, pairs // 2, rng)) / 2
+
+
+def helper_select_slope(x_val: List[float], y_val: List[float], rank: int,
+                        rng: random.Random) -> float:
+    """Return the slope of the given rank (from 0) among the slopes between every two of
+    the points with different x, sorted by x and then y, by randomized interval
+    contraction. The slopes of the interval are those above its lower bound and below
+    its upper bound."""
+    n = len(x_val)
+    lower, upper = LOWEST, HIGHEST
+    below_lower, below_upper = 0, helper_count_pairs(x_val)
+    while True:
+        inside = below_upper - below_lower
+        lower_order = helper_order(x_val, y_val, lower)
+        upper_order = helper_order(x_val, y_val, upper)
+        if inside <= max(n, 64):
+            slopes = sorted(helper_slope(x_val, y_val, pair) for pair in
+                            helper_crossings(lower_order, upper_order, list(range(inside))))
+            return slopes[rank - below_lower]
+
+        drawn = sorted(rng.randrange(inside) for _ in range(n))
+        sample = sorted((helper_slope(x_val, y_val, pair), pair) for pair in
+                        helper_crossings(lower_order, upper_order, drawn))
+        position = (rank - below_lower) * n / inside
+        spread = sqrt(n)
+        candidates = [sample[max(0, int(position - spread))],
+                      sample[min(n - 1, int(position + spread) + 1)]]
+        for (slope, (i, j)) in candidates:
+            dy, dx = y_val[j] - y_val[i], x_val[j] - x_val[i]
+            below_open = helper_count_below(x_val, y_val, (dy, dx, False))
+            below_closed = helper_count_below(x_val, y_val, (dy, dx, True))
+            if below_open <= rank < below_closed:
+                return slope
+            elif below_open > rank:
+                # the second candidate is at least as high, so it cannot narrow further
+                upper, below_upper = (dy, dx, False), below_open
+                break
+            else:
+                lower, below_lower = (dy, dx, True), below_closed
+
+
+def helper_count_pairs(x_val: List[float]) -> int:
+    """Return the number of pairs of the sorted x_val with different values
+
+    >>> helper_count_pairs([1.0, 1.0, 2.0, 3.0, 3.0, 3.0])
+    11
+    """
+    pairs = len(x_val) * (len(x_val) - 1) // 2
+    run = 1
+    for i in range(1, len(x_val)):
+        run = run + 1 if x_val[i] == x_val[i - 1] else 1
+        pairs -= run - 1
+    return pairs
+
+
+def helper_slope(x_val: List[float], y_val: List[float], pair: Tuple[int, int]) -> float:
+    """Return the slope between the two points of pair"""
+    (i, j) = pair
+    return (y_val[j] - y_val[i]) / (x_val[j] - x_val[i])
+
+
+def helper_order(x_val: List[float], y_val: List[float],
+                 bound: Tuple[float, float, bool]) -> List[int]:
+    """Return the indices of the points, sorted by x and then y, in the order of
+    y - s * x at the slope s of bound. A pair of points with different x is out of order
+    by x exactly when its slope is below bound; a pair with the same x stays in order.
+    Keys are computed as y * dx - dy * x, so there is no division."""
+    (dy, dx, closed) = bound
+    tie = -1.0 if closed else 1.0
+    return sorted(range(len(x_val)), key=lambda i: (y_val[i] * dx - dy * x_val[i],
+                                                     tie * x_val[i], y_val[i]))
+
+
+def helper_count_below(x_val: List[float], y_val: List[float],
+                       bound: Tuple[float, float, bool]) -> int:
+    """Return the number of pairs of points, sorted by x, whose slope is below bound"""
+    return count_inversions(helper_order(x_val, y_val, bound))
+
+
+def count_inversions(sequence: List[int]) -> int:
+    """Return the number of pairs of positions i < j with sequence[i] > sequence[j], using
+    a Fenwick tree
+
+    Preconditions:
+        - sorted(sequence) == list(range(len(sequence)))
+
+    >>> count_inversions([2, 0, 3, 1])
+    3
+    """
+    counts = FenwickTree(len(sequence))
+    inversions = 0
+    for position in range(len(sequence)):
+        inversions += position - counts.count_below(sequence[position])
+        counts.add(sequence[position])
+    return inversions
+
+
+def helper_crossings(lower_order: List[int], upper_order: List[int],
+                     wanted: List[int]) -> List[Tuple[int, int]]:
+    """Return the pairs of points (i, j), i < j, that are the wanted (sorted, counted from
+    0) pairs in opposite orders in lower_order and upper_order, i.e. the slopes between
+    the two bounds. They are found by merge sorting the positions in upper_order of the
+    points in lower_order, in which they are the inversions.
+
+    >>> sorted(helper_crossings([0, 1, 2], [2, 0, 1], [0, 1]))
+    [(0, 2), (1, 2)]
+    """
+    position = [0] * len(upper_order)
+    for p in range(len(upper_order)):
+        position[upper_order[p]] = p
+    state = {'counted': 0, 'next': 0, 'found': []}
+    helper_merge_sort([position[i] for i in lower_order], list(wanted), state)
+    return [(min(upper_order[a], upper_order[b]), max(upper_order[a], upper_order[b]))
+            for (a, b) in state['found']]
+
+
+def helper_merge_sort(values: List[int], wanted: List[int], state: dict) -> List[int]:
+    """Return values sorted, adding to state['found'] the wanted inversions of values, by
+    their number in the order the merges meet them"""
+    if len(values) <= 1:
+        return values
+    middle = len(values) // 2
+    left = helper_merge_sort(values[:middle], wanted, state)
+    right = helper_merge_sort(values[middle:], wanted, state)
+    merged = []
+    li = 0
+    for value in right:
+        while li < len(left) and left[li] < value:
+            merged.append(left[li])
+            li += 1
+        # value is out of order with every value left in left
+        later = state['counted'] + len(left) - li
+        while state['next'] < len(wanted) and wanted[state['next']] < later:
+            offset = wanted[state['next']] - state['counted']
+            state['found'].append((left[li + offset], value))
+            state['next'] += 1
+        state['counted'] = later
+        merged.append(value)
+    merged.extend(left[li:])
+    return merged
+
+
+def mann_kendall(x_val: List[float], y_val: List[float]) -> Tuple[int, float, float]:
+    """Return the Mann-Kendall statistic S of the points (x_val[i], y_val[i]), its normal
+    score and its two-sided p-value. The variance of S is corrected for tied values.
+    Pairs of points with the same x are not counted in S.
+
+    Preconditions:
+        - len(x_val) == len(y_val) >= 2
+
+    >>> mann_kendall([1.0, 2.0, 3.0, 4.0], [1.0, 3.0, 2.0, 4.0])[0]
+    4
+    >>> s, z, p = mann_kendall([float(i) for i in range(10)], [0.0] * 5 + [1.0] * 5)
+    >>> s, round(z, 3), round(p, 4)
+    (25, 2.507, 0.0122)
+    >>> mann_kendall([1.0, 1.0, 2.0], [5.0, 0.0, 3.0])[0]
+    0
+    """
+    order = sorted(range(len(x_val)), key=lambda i: x_val[i])
+    distinct = sorted(set(y_val))
+    ranks = {distinct[r]: r for r in range(len(distinct))}
+    counts = FenwickTree(len(distinct))
+    s = 0
+    start = 0
+    while start < len(order):
+        # the points with the same x are compared with the earlier ones, not each other
+        end = start
+        while end < len(order) and x_val[order[end]] == x_val[order[start]]:
+            end += 1
+        group = [ranks[y_val[order[position]]] for position in range(start, end)]
+        for rank in group:
+            s += counts.count_below(rank) - (start - counts.count_below(rank + 1))
+        for rank in group:
+            counts.add(rank)
+        start = end
+
+    n = len(y_val)
+    tied = {}
+    for y in y_val:
+        tied[y] = tied.get(y, 0) + 1
+    variance = (n * (n - 1) * (2 * n + 5)
+                - sum(t * (t - 1) * (2 * t + 5) for t in tied.values())) / 18
+    if variance == 0 or s == 0:
+        return (s, 0.0, 1.0)
+    z = (s - 1 if s > 0 else s + 1) / sqrt(variance)
+    return (s, z, erfc(abs(z) / sqrt(2)))
+
+
+def robust_trend(x_val: List[float], y_val: List[float], seed: int = 0) \
+        -> Optional[RobustTrend]:
+    """Return the robust trend of the points (x_val[i], y_val[i]) whose y is not NaN, or
+    None if there are fewer than 2 distinct x-values among them
+
+    Preconditions:
+        - len(x_val) == len(y_val)
+
+    >>> trend = robust_trend([0.0, 1.0, 2.0, 3.0, 4.0], [2.0, 4.0, float('nan'), 8.0, 10.0])
+    >>> trend.slope, trend.intercept, trend.s, trend.count
+    (2.0, 2.0, 6, 4)
+    """
+    keep = [i for i in range(len(y_val)) if not isnan(y_val[i])]
+    if len({x_val[i] for i in keep}) < 2:
+        return None
+    x_val = [float(x_val[i]) for i in keep]
+    y_val = [float(y_val[i]) for i in keep]
+    slope = sen_slope(x_val, y_val, seed)
+    residuals = sorted(y_val[i] - slope * x_val[i] for i in range(len(keep)))
+    middle = len(residuals) // 2
+    if len(residuals) % 2 == 1:
+        intercept = residuals[middle]
+    else:
+        intercept = (residuals[middle - 1] + residuals[middle]) / 2
+    (s, z, p_value) = mann_kendall(x_val, y_val)
+    return RobustTrend(slope, intercept, s, z, p_value, len(keep))
+
+
+def batch_robust_trend(x_val: List[float], y_stack: List[List[float]], seed: int = 0) \
+        -> List[Optional[RobustTrend]]:
+    """Return the robust trend of every series of y_stack against the shared x_val, as
+    taken by the batched regressions of compute (NaN for the missing values)
+
+    >>> trends = batch_robust_trend([0.0, 1.0, 2.0], [[1.0, 2.0, 3.0], [3.0, 2.0, 1.0]])
+    >>> [(t.slope, t.s) for t in trends]
+    [(1.0, 3), (-1.0, -3)]
+    """
+    return [robust_trend(x_val, y_val, seed) for y_val in y_stack]
+
+
+def file_trends(data_file: DataFile, station_ids: Optional[List[str]] = None,
+                seed: int = 0) -> Dict[str, RobustTrend]:
+    """Return the robust trend of the daily averages of every station in station_ids
+    (every station if None) of data_file, by station code, in units per day. Stations
+    with fewer than 2 days of data are left out.
+
+    >>> trends = file_trends(DataFile('doctest_dataset/O3_2019.csv'), ['010102'])
+    >>> trend = trends['010102']
+    >>> trend.count, round(trend.slope, 4)
+    (362, -0.0375)
+    """
+    days, codes, table = data_file.daily_table(station_ids)
+    trends = batch_robust_trend([float(day) for day in days], table, seed)
+    return {codes[i]: trends[i] for i in range(len(codes)) if trends[i] is not None}
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['random', 'math', 'typing', 'loading_data'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
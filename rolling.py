@@ -0,0 +1,247 @@
+"""
+Rolling window statistics of hourly readings
+
+Every statistic is taken over the trailing window of the last `window` hours, ending at
+the hour it is reported for, and is computed in one pass over the series: a running sum
+for the mean, a running (Welford) mean and squared deviation for the standard deviation,
+and a monotonic deque of candidates for the maximum and minimum.
+
+Missing hours are NaN. A window with fewer than min_periods valid hours gives NaN.
+
+The 8-hour O3 average of the Canadian Ambient Air Quality Standards is rolling_mean
+with a window of 8 hours and at least 6 valid hours, and its daily maximum is taken
+over the averages ending in the day, when at least 18 of them are valid.
+"""
+from collections import deque
+from math import isnan, sqrt
+from typing import Dict, List, Optional, Tuple
+from loading_data import DataFile
+from naps_parser import HOURS_PER_DAY
+
+STATISTICS = ('mean', 'max', 'min', 'std')
+
+O3_WINDOW = 8
+O3_MIN_HOURS = 6
+O3_MIN_AVERAGES = 18
+
+
+def rolling_mean(values: List[float], window: int,
+                 min_periods: Optional[int] = None) -> List[float]:
+    """Return the mean of the valid values of the window ending at each value
+
+    min_periods is the number of valid values a window needs (window if None).
+
+    Preconditions:
+        - window > 0
+        - min_periods is None or 0 < min_periods <= window
+
+    >>> nan = float('nan')
+    >>> rolling_mean([1.0, 2.0, nan, 4.0, 5.0], 3, 2)
+    [nan, 1.5, 1.5, 3.0, 4.5]
+    """
+    min_periods = window if min_periods is None else min_periods
+    total, count = 0.0, 0
+    means = []
+    for i in range(len(values)):
+        if not isnan(values[i]):
+            total += values[i]
+            count += 1
+        if i >= window and not isnan(values[i - window]):
+            total -= values[i - window]
+            count -= 1
+        means.append(total / count if count >= min_periods else float('nan'))
+    return means
+
+
+def rolling_std(values: List[float], window: int,
+                min_periods: Optional[int] = None) -> List[float]:
+    """Return the sample standard deviation of the valid values of the window ending at
+    each value. Values enter and leave the window through Welford's updates, so there is
+    no cancellation between large running sums. A window with fewer than 2 valid values
+    has no sample standard deviation and gives NaN, whatever min_periods is (so every
+    window of 1 value gives NaN).
+
+    Preconditions:
+        - window > 0
+        - min_periods is None or 0 < min_periods <= window
+
+    >>> [round(s, 6) for s in rolling_std([1.0, 2.0, 4.0, 8.0], 2)[1:]]
+    [0.707107, 1.414214, 2.828427]
+    >>> rolling_std([1.0, 2.0], 1)
+    [nan, nan]
+    """
+    min_periods = max(window if min_periods is None else min_periods, 2)
+    mean, m2, count = 0.0, 0.0, 0
+    deviations = []
+    for i in range(len(values)):
+        value = values[i]
+        if not isnan(value):
+            count += 1
+            delta = value - mean
+            mean += delta / count
+            m2 += delta * (value - mean)
+        if i >= window and not isnan(values[i - window]):
+            old = values[i - window]
+            count -= 1
+            if count == 0:
+                mean, m2 = 0.0, 0.0
+            else:
+                new_mean = mean + (mean - old) / count
+                m2 -= (old - mean) * (old - new_mean)
+                mean = new_mean
+        if count >= min_periods:
+            deviations.append(sqrt(max(m2, 0.0) / (count - 1)))
+        else:
+            deviations.append(float('nan'))
+    return deviations
+
+
+def rolling_max(values: List[float], window: int,
+                min_periods: Optional[int] = None) -> List[float]:
+    """Return the highest valid value of the window ending at each value
+
+    Preconditions:
+        - window > 0
+        - min_periods is None or 0 < min_periods <= window
+
+    >>> nan = float('nan')
+    >>> rolling_max([3.0, 1.0, nan, 2.0, 0.0], 2, 1)
+    [3.0, 3.0, 1.0, 2.0, 2.0]
+    """
+    return helper_rolling_extreme(values, window, min_periods, True)
+
+
+def rolling_min(values: List[float], window: int,
+                min_periods: Optional[int] = None) -> List[float]:
+    """Return the lowest valid value of the window ending at each value
+
+    Preconditions:
+        - window > 0
+        - min_periods is None or 0 < min_periods <= window
+
+    >>> rolling_min([3.0, 1.0, 2.0, 5.0, 4.0], 3)
+    [nan, nan, 1.0, 1.0, 2.0]
+    """
+    return helper_rolling_extreme(values, window, min_periods, False)
+
+
+def helper_rolling_extreme(values: List[float], window: int, min_periods: Optional[int],
+                           highest: bool) -> List[float]:
+    """Return the highest (or lowest if not highest) valid value of the window ending at
+    each value.
+
+    The deque holds the indices of the values of the window that may still become its
+    extreme, their values being in decreasing (increasing) order, so every index is
+    added and removed at most once.
+    """
+    min_periods = window if min_periods is None else min_periods
+    candidates = deque()
+    count = 0
+    extremes = []
+    for i in range(len(values)):
+        value = values[i]
+        if not isnan(value):
+            count += 1
+            while len(candidates) > 0 and (values[candidates[-1]] <= value if highest
+                                           else values[candidates[-1]] >= value):
+                candidates.pop()
+            candidates.append(i)
+        if i >= window and not isnan(values[i - window]):
+            count -= 1
+        while len(candidates) > 0 and candidates[0] <= i - window:
+            candidates.popleft()
+        extremes.append(values[candidates[0]] if count >= min_periods else float('nan'))
+    return extremes
+
+
+def station_hours(data_file: DataFile, station_id: str) -> Tuple[int, List[float]]:
+    """Return the day number of the first day of station_id, and its hourly readings from
+    that day on, with NaN for the missing readings and for the hours of missing days
+
+    Preconditions:
+        - station_id in data_file.stations
+
+    >>> first_day, hours = station_hours(DataFile('doctest_dataset/O3_2019.csv'), '010102')
+    >>> len(hours), hours[:3]
+    (8760, [35.0, 35.0, 34.0])
+    """
+    dates = data_file.station_dates(station_id)
+    [a, b] = data_file.stations[station_id]
+    first_day = dates[0]
+    hours = [float('nan')] * ((dates[-1] - first_day + 1) * HOURS_PER_DAY)
+    readings = data_file.hours[a * HOURS_PER_DAY: (b + 1) * HOURS_PER_DAY].tolist()
+    for i in range(len(dates)):
+        start = (dates[i] - first_day) * HOURS_PER_DAY
+        hours[start: start + HOURS_PER_DAY] = \
+            readings[i * HOURS_PER_DAY: (i + 1) * HOURS_PER_DAY]
+    return (first_day, hours)
+
+
+def rolling_stations(data_file: DataFile, window: int, statistic: str = 'mean',
+                     min_periods: Optional[int] = None,
+                     station_ids: Optional[List[str]] = None) \
+        -> Dict[str, Tuple[int, List[float]]]:
+    """Return the rolling statistic of the hourly readings of every station in
+    station_ids (every station if None), as the day number of its first day and the
+    statistic at every hour from that day on (see station_hours)
+
+    Preconditions:
+        - statistic in STATISTICS
+        - window > 0
+
+    >>> rolled = rolling_stations(DataFile('doctest_dataset/O3_2019.csv'), 8,
+    ...                           station_ids=['010102'])
+    >>> rolled['010102'][1][7]
+    34.125
+    """
+    functions = {'mean': rolling_mean, 'max': rolling_max, 'min': rolling_min,
+                 'std': rolling_std}
+    data_file.ensure_loaded(station_ids)
+    codes = list(data_file.stations) if station_ids is None else station_ids
+    rolled = {}
+    for code in codes:
+        first_day, hours = station_hours(data_file, code)
+        rolled[code] = (first_day, functions[statistic](hours, window, min_periods))
+    return rolled
+
+
+def daily_max_8_hour(data_file: DataFile, station_id: str) -> Tuple[List[int], List[float]]:
+    """Return the days of station_id with enough valid 8-hour O3 averages, and the
+    highest 8-hour average ending in each of those days (see the module docstring)
+
+    Preconditions:
+        - station_id in data_file.stations
+
+    >>> days, maxima = daily_max_8_hour(DataFile('doctest_dataset/O3_2019.csv'), '010102')
+    >>> len(days), maxima[0]
+    (356, 34.5)
+    """
+    first_day, hours = station_hours(data_file, station_id)
+    averages = rolling_mean(hours, O3_WINDOW, O3_MIN_HOURS)
+    days, maxima = [], []
+    for day in range(len(averages) // HOURS_PER_DAY):
+        valid = [a for a in averages[day * HOURS_PER_DAY: (day + 1) * HOURS_PER_DAY]
+                 if not isnan(a)]
+        if len(valid) >= O3_MIN_AVERAGES:
+            days.append(first_day + day)
+            maxima.append(max(valid))
+    return (days, maxima)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'math', 'typing', 'loading_data', 'naps_parser'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,308 @@
+"""
+Significance of the change in level and slope of a series at a date (e.g. a regulation)
+
+The observed changes are those of intervention.py: the difference between the mean (and
+the slope) of the values from the date on and before it. They are tested against the
+changes that noise alone gives: the residuals of the lines fitted to each side,
+rearranged in blocks of consecutive days, which keeps the autocorrelation of the
+residuals within a block. Both changes are linear in the values and are 0 for the
+residuals themselves, so the changes of a rearrangement are its sampling error.
+
+    - block bootstrap: every block of the null series is a block of residuals drawn with
+      replacement from all of the blocks of consecutive residuals
+    - block permutation: the residuals are cut into consecutive pieces of the lengths of
+      the slots below, and the null series is a random order of these pieces, each piece
+      going to a slot of its length, so that every residual is used exactly once
+
+A p-value is the share of the null series whose change is at least as large (in absolute
+value) as the observed one.
+
+The null series are placed in fixed slots of at most block_days values, which never
+straddle the date. The sums of every block of residuals in every slot are computed once,
+so a resample only adds up one precomputed sum per slot instead of going through every
+value. Series are tested in parallel across a pool of processes, each with its own
+random number generator seeded from the seed and the series, so that results can be
+reproduced.
+"""
+import datetime as d
+import random
+from concurrent.futures import ProcessPoolExecutor
+from math import isnan
+from operator import mul
+from typing import Dict, List, Optional, Tuple
+import compute
+from dataset import Dataset
+from intervention import DAYS_PER_YEAR
+from regulations import Regulation
+
+DEFAULT_RESAMPLES = 1000
+DEFAULT_BLOCK_DAYS = 7
+
+
+class SignificanceResult:
+    """
+    The observed change of a series at a date, and its p-values
+
+    Instance Attributes:
+        - mean_change: the mean of the values from the date on minus the mean before it
+        - slope_change: the slope of the values from the date on minus the slope before it
+        - mean_p_bootstrap: the block bootstrap p-value of mean_change
+        - slope_p_bootstrap: the block bootstrap p-value of slope_change
+        - mean_p_permutation: the block permutation p-value of mean_change
+        - slope_p_permutation: the block permutation p-value of slope_change
+        - resamples: the number of null series of each test
+
+    Representation Invariants:
+        - self.resamples > 0
+    """
+    mean_change: float
+    slope_change: float
+    mean_p_bootstrap: float
+    slope_p_bootstrap: float
+    mean_p_permutation: float
+    slope_p_permutation: float
+    resamples: int
+
+    def __init__(self, changes: Tuple[float, float], bootstrap: Tuple[float, float],
+                 permutation: Tuple[float, float], resamples: int) -> None:
+        self.mean_change, self.slope_change = changes
+        self.mean_p_bootstrap, self.slope_p_bootstrap = bootstrap
+        self.mean_p_permutation, self.slope_p_permutation = permutation
+        self.resamples = resamples
+
+
+def significance_of_change(times: List[float], values: List[float], split: float,
+                           resamples: int = DEFAULT_RESAMPLES,
+                           block_days: int = DEFAULT_BLOCK_DAYS,
+                           seed: str = '0') -> SignificanceResult:
+    """Return the change in mean and slope of the points (times[i], values[i]) at split,
+    and their block bootstrap and block permutation p-values. NaN values are left out.
+
+    Preconditions:
+        - times is sorted in ascending order
+        - at least 2 points with distinct times on each side of split
+        - resamples > 0 and block_days > 0
+
+    >>> times = [float(t) for t in range(-60, 60)]
+    >>> noise = random.Random(4)
+    >>> flat = [noise.gauss(0, 1) for _ in times]
+    >>> result = significance_of_change(times, flat, 0.0, 200)
+    >>> result.mean_p_bootstrap > 0.05, result.mean_p_permutation > 0.05
+    (True, True)
+    >>> jump = [flat[i] + (5.0 if times[i] >= 0 else 0.0) for i in range(len(times))]
+    >>> result = significance_of_change(times, jump, 0.0, 200)
+    >>> round(result.mean_change, 1), result.mean_p_bootstrap < 0.01
+    (5.2, True)
+    >>> again = significance_of_change(times, jump, 0.0, 200)
+    >>> again.mean_p_permutation == result.mean_p_permutation
+    True
+    """
+    keep = [i for i in range(len(values)) if not isnan(values[i])]
+    times = [float(times[i]) for i in keep]
+    values = [float(values[i]) for i in keep]
+    n_pre = sum(1 for t in times if t < split)
+    sides = [(0, n_pre), (n_pre, len(times))]
+
+    # sums of t and of (t - mean of t) ** 2 of each side
+    t_sums = [sum(times[a: b]) for (a, b) in sides]
+    t_means = [t_sums[s] / (sides[s][1] - sides[s][0]) for s in range(2)]
+    sxx = [sum((t - t_means[s]) ** 2 for t in times[sides[s][0]: sides[s][1]])
+           for s in range(2)]
+
+    observed = helper_changes([sum(values[a: b]) for (a, b) in sides],
+                              [sum(map(mul, times[a: b], values[a: b])) for (a, b) in sides],
+                              sides, t_means, sxx)
+
+    # the residuals of the line fitted to each side
+    residuals = []
+    for (a, b) in sides:
+        (level, slope) = compute.polynomial_regression(1, times[a: b], values[a: b])
+        residuals.extend([values[i] - (level + slope * times[i]) for i in range(a, b)])
+
+    block = min(block_days, len(times))
+    slots = [(start, min(start + block, b), s) for s, (a, b) in enumerate(sides)
+             for start in range(a, b, block)]
+    sums, t_products = helper_slot_sums(times, residuals, slots, block)
+
+    rng = random.Random(seed)
+    n_starts = len(times) - block + 1
+    bootstrap_hits = [0, 0]
+    permutation_hits = [0, 0]
+    for _ in range(resamples):
+        drawn = [rng.randrange(n_starts) for _ in slots]
+        helper_count_hits(bootstrap_hits, observed, drawn, slots, (sums, t_products),
+                          sides, t_means, sxx)
+        permuted = helper_permuted_starts(slots, rng)
+        helper_count_hits(permutation_hits, observed, permuted, slots,
+                          (sums, t_products), sides, t_means, sxx)
+
+    return SignificanceResult(observed,
+                              ((1 + bootstrap_hits[0]) / (1 + resamples),
+                               (1 + bootstrap_hits[1]) / (1 + resamples)),
+                              ((1 + permutation_hits[0]) / (1 + resamples),
+                               (1 + permutation_hits[1]) / (1 + resamples)),
+                              resamples)
+
+
+def helper_changes(y_sums: List[float], ty_sums: List[float], sides: List[Tuple[int, int]],
+                   t_means: List[float], sxx: List[float]) -> Tuple[float, float]:
+    """Return the change in mean and in slope between the two sides of a series, given
+    the sums of y and of t * y of each side"""
+    means, slopes = [], []
+    for s in range(2):
+        count = sides[s][1] - sides[s][0]
+        means.append(y_sums[s] / count)
+        slopes.append((ty_sums[s] - t_means[s] * y_sums[s]) / sxx[s])
+    return (means[1] - means[0], slopes[1] - slopes[0])
+
+
+def helper_slot_sums(times: List[float], residuals: List[float],
+                     slots: List[Tuple[int, int, int]], block: int) \
+        -> Tuple[List[List[float]], List[List[float]]]:
+    """Return, for every slot and every block start b, the sum of the residuals of the
+    block starting at b placed in the slot, and the sum of their products with the times
+    of the slot. A slot shorter than block takes the start of the block, and also has
+    the starts of the blocks of its length after len(residuals) - block."""
+    prefix = compute.helper_prefix(residuals)
+    sums, t_products = [], []
+    for (first, last, _) in slots:
+        length = last - first
+        starts = range(len(residuals) - min(length, block) + 1)
+        slot_times = times[first: last]
+        sums.append([prefix[b + length] - prefix[b] for b in starts])
+        t_products.append([sum(map(mul, slot_times, residuals[b: b + length]))
+                           for b in starts])
+    return (sums, t_products)
+
+
+def helper_permuted_starts(slots: List[Tuple[int, int, int]], rng: random.Random) -> List[int]:
+    """Return the start of the piece of residuals placed in every slot by a random block
+    permutation. The residuals are cut into the pieces of the slots themselves (the slots
+    partition the series), and the pieces of every length are shuffled among the slots of
+    that length.
+
+    >>> slots = [(0, 7, 0), (7, 10, 0), (10, 17, 1), (17, 20, 1), (20, 23, 1)]
+    >>> starts = helper_permuted_starts(slots, random.Random(1))
+    >>> residuals = [float(i) for i in range(23)]
+    >>> permuted = [residuals[starts[k] + i] for k in range(len(slots))
+    ...             for i in range(slots[k][1] - slots[k][0])]
+    >>> sorted(permuted) == residuals, permuted != residuals
+    (True, True)
+    """
+    by_length = {}
+    for k in range(len(slots)):
+        length = slots[k][1] - slots[k][0]
+        if length not in by_length:
+            by_length[length] = []
+        by_length[length].append(k)
+
+    starts = [0] * len(slots)
+    for length in by_length:
+        pieces = [slots[k][0] for k in by_length[length]]
+        rng.shuffle(pieces)
+        for i in range(len(pieces)):
+            starts[by_length[length][i]] = pieces[i]
+    return starts
+
+
+def helper_count_hits(hits: List[int], observed: Tuple[float, float], drawn: List[int],
+                      slots: List[Tuple[int, int, int]],
+                      slot_sums: Tuple[List[List[float]], List[List[float]]],
+                      sides: List[Tuple[int, int]], t_means: List[float],
+                      sxx: List[float]) -> None:
+    """Add 1 to hits[0] (hits[1]) if the change in mean (slope) of the residuals made of
+    the blocks starting at drawn is at least as large as the observed one. slot_sums are
+    the sums of helper_slot_sums."""
+    y_sums = [0.0, 0.0]
+    ty_sums = [0.0, 0.0]
+    for k in range(len(slots)):
+        side = slots[k][2]
+        y_sums[side] += slot_sums[0][k][drawn[k]]
+        ty_sums[side] += slot_sums[1][k][drawn[k]]
+    changes = helper_changes(y_sums, ty_sums, sides, t_means, sxx)
+    for i in range(2):
+        if abs(changes[i]) >= abs(observed[i]):
+            hits[i] += 1
+
+
+def significance_of_stations(series: Dict[str, Tuple[List[float], List[float]]],
+                             split: float, resamples: int = DEFAULT_RESAMPLES,
+                             block_days: int = DEFAULT_BLOCK_DAYS, seed: str = '0',
+                             max_workers: Optional[int] = None) \
+        -> Dict[str, SignificanceResult]:
+    """Return significance_of_change of the (times, values) of every station in series,
+    testing the stations in parallel, using up to max_workers processes (one per core if
+    None). The random numbers of a station only depend on seed and its code.
+
+    Stations with fewer than 2 points on a side of split are left out.
+    """
+    codes = [code for code in sorted(series) if helper_testable(series[code], split)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(helper_station_significance,
+                               [(series[code], split, resamples, block_days,
+                                 seed + '/' + code) for code in codes])
+        return dict(zip(codes, results))
+
+
+def helper_station_significance(job: Tuple[Tuple[List[float], List[float]], float, int,
+                                           int, str]) -> SignificanceResult:
+    """Run significance_of_change for one station. This runs in a worker process."""
+    ((times, values), split, resamples, block_days, seed) = job
+    return significance_of_change(times, values, split, resamples, block_days, seed)
+
+
+def helper_testable(points: Tuple[List[float], List[float]], split: float) -> bool:
+    """Return whether points has at least 2 distinct times with a value on each side of
+    split
+
+    >>> helper_testable(([-2.0, -1.0, 0.0, 1.0], [1.0, 1.0, 1.0, float('nan')]), 0.0)
+    False
+    """
+    before = {points[0][i] for i in range(len(points[0]))
+              if points[0][i] < split and not isnan(points[1][i])}
+    after = {points[0][i] for i in range(len(points[0]))
+             if points[0][i] >= split and not isnan(points[1][i])}
+    return len(before) >= 2 and len(after) >= 2
+
+
+def regulation_significance(dataset: Dataset, pollutant: str, regulation: Regulation,
+                            window_days: int, resamples: int = DEFAULT_RESAMPLES,
+                            block_days: int = DEFAULT_BLOCK_DAYS, seed: str = '0',
+                            max_workers: Optional[int] = None) \
+        -> Dict[str, SignificanceResult]:
+    """Return the significance of the change of the daily averages of pollutant at every
+    station of dataset, within window_days of the date of regulation. Times are in years
+    since the regulation, as in intervention.py.
+
+    >>> import regulations
+    >>> test = regulations.Regulation('TEST', 'Test', d.date(2019, 7, 1))
+    >>> results = regulation_significance(Dataset('doctest_dataset'), 'O3', test, 30,
+    ...                                   resamples=50, max_workers=2)
+    >>> result = results['010102']
+    >>> 0 < result.mean_p_bootstrap <= 1 and result.resamples == 50
+    True
+    """
+    start = regulation.date - d.timedelta(days=window_days)
+    end = regulation.date + d.timedelta(days=window_days)
+    queried = dataset.query(pollutant, None, start.strftime('%Y%m%d'), end.strftime('%Y%m%d'))
+    reg_day = regulation.date.toordinal()
+    series = {code: ([(x.toordinal() - reg_day) / DAYS_PER_YEAR for x in queried[code][0]],
+                     queried[code][1]) for code in queried}
+    return significance_of_stations(series, 0.0, resamples, block_days,
+                                    seed + '/' + regulation.code + '/' + pollutant,
+                                    max_workers)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['datetime', 'random', 'concurrent.futures', 'math', 'operator',
+                          'typing', 'compute', 'dataset', 'intervention', 'regulations'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,213 @@
+"""
+Metrics of the Canadian Ambient Air Quality Standards, by station and year
+
+    - NO2: the 98th percentile of the daily maximum 1-hour readings of a year, over the
+      days with at least NO2_MIN_HOURS valid readings. As in the standards, this is the
+      k-th highest daily maximum, where k = ceil(0.02 * days): the highest for up to 50
+      days, the 2nd highest for 51 to 100 days, ... and the 8th highest for 351 to 366.
+    - O3: the 4th highest daily maximum 8-hour average of a year (see rolling.py)
+
+Both are exact order statistics of at most MAX_DAYS values, computed in one pass over the
+row stream of a file (DataFile.iter_rows), without keeping the daily maxima: only the
+highest daily maxima a year can need go into a compute.TopK. The 8-hour averages of the
+first hours of a day are taken with the last hours of the day before, which are carried
+from row to row.
+
+The metrics of a station merge, so the stations of a year summarized in separate
+processes merge into the metrics of all of them. A file holds a single pollutant, and
+only the metric of that pollutant is computed.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil, isnan
+from typing import Dict, List, Optional, Tuple, Union
+from compute import TopK
+from loading_data import DataFile
+from naps_parser import HOURS_PER_DAY
+from parallel_loading import find_files
+from rolling import O3_MIN_AVERAGES, O3_MIN_HOURS, O3_WINDOW, rolling_mean
+
+NO2_PERCENTILE = 0.98
+NO2_MIN_HOURS = 18
+O3_RANK = 4
+# the most days of a year
+MAX_DAYS = 366
+
+
+class StationMetrics:
+    """
+    The highest daily maxima of a station in a year
+
+    Instance Attributes:
+        - daily_max: the highest daily maximum 1-hour readings, as many as the NO2 metric
+          of a year can need
+        - daily_max_8_hour: the O3_RANK highest daily maximum 8-hour averages
+        - days: the number of days with a daily maximum (1-hour or 8-hour)
+
+    Representation Invariants:
+        - self.daily_max.k == helper_no2_rank(MAX_DAYS)
+        - len(self.daily_max.heap) + len(self.daily_max_8_hour.heap) <= self.days
+
+    >>> metrics = StationMetrics()
+    >>> for value in range(1, 101):
+    ...     metrics.add_daily_max(float(value))
+    >>> metrics.days, metrics.no2_percentile()  # the 2nd highest of 100 days
+    (100, 99.0)
+    >>> other = StationMetrics()
+    >>> other.add_daily_max(150.0)
+    >>> metrics.merge(other)
+    >>> metrics.days, metrics.no2_percentile()  # the 3rd highest of 101 days
+    (101, 99.0)
+    """
+    daily_max: TopK
+    daily_max_8_hour: TopK
+    days: int
+
+    def __init__(self) -> None:
+        self.daily_max = TopK(helper_no2_rank(MAX_DAYS))
+        self.daily_max_8_hour = TopK(O3_RANK)
+        self.days = 0
+
+    def add_daily_max(self, value: float) -> None:
+        """Add the daily maximum 1-hour reading of a day"""
+        self.daily_max.update(value)
+        self.days += 1
+
+    def add_daily_max_8_hour(self, value: float) -> None:
+        """Add the daily maximum 8-hour average of a day"""
+        self.daily_max_8_hour.update(value)
+        self.days += 1
+
+    def merge(self, other: 'StationMetrics') -> None:
+        """Add the days summarized by other, of the same year, to this summary
+
+        Preconditions:
+            - self.days + other.days <= MAX_DAYS
+        """
+        self.daily_max.merge(other.daily_max)
+        self.daily_max_8_hour.merge(other.daily_max_8_hour)
+        self.days += other.days
+
+    def no2_percentile(self) -> float:
+        """Return the NO2 metric: the helper_no2_rank(days)-th highest daily maximum
+        1-hour reading (NaN if there are none)
+
+        Preconditions:
+            - self.days <= MAX_DAYS
+        """
+        highest = self.daily_max.values()
+        if highest == []:
+            return float('nan')
+        return highest[helper_no2_rank(self.days) - 1]
+
+    def o3_fourth_highest(self) -> float:
+        """Return the O3 metric: the O3_RANK-th highest daily maximum 8-hour average (NaN
+        if there are fewer than O3_RANK)"""
+        return self.daily_max_8_hour.kth()
+
+
+def helper_no2_rank(days: int) -> int:
+    """Return the rank, from the highest, of the NO2_PERCENTILE percentile of days daily
+    maxima
+
+    >>> helper_no2_rank(50), helper_no2_rank(51), helper_no2_rank(355)
+    (1, 2, 8)
+    """
+    # rounded first, since 1 - NO2_PERCENTILE is not exact in floating point
+    return max(1, int(ceil(round((1 - NO2_PERCENTILE) * days, 9))))
+
+
+def file_metrics(data_file: DataFile, station_ids: Optional[List[str]] = None) \
+        -> Dict[str, StationMetrics]:
+    """Return the metrics of every station in station_ids (every station if None) of
+    data_file, by station code, in one pass over its rows. Only the metric of the
+    pollutant of data_file (NO2 or O3) is computed.
+
+    >>> import rolling
+    >>> my_data = DataFile('doctest_dataset/O3_2019.csv')
+    >>> metrics = file_metrics(my_data, ['010102'])['010102']
+    >>> maxima = rolling.daily_max_8_hour(my_data, '010102')[1]
+    >>> metrics.o3_fourth_highest() == sorted(maxima, reverse=True)[O3_RANK - 1]
+    True
+    >>> metrics.days == len(maxima), metrics.daily_max.values()
+    (True, [])
+    """
+    data_file.ensure_loaded(station_ids)
+    pollutant = data_file.pollutant
+    metrics = {}
+    carried = {}
+    for code, day, values in data_file.iter_rows(station_ids, keep_missing=True):
+        if code not in metrics:
+            metrics[code] = StationMetrics()
+        station = metrics[code]
+
+        if pollutant == 'NO2':
+            valid = [v for v in values if not isnan(v)]
+            if len(valid) >= NO2_MIN_HOURS:
+                station.add_daily_max(max(valid))
+
+        elif pollutant == 'O3':
+            # the 8-hour averages ending at every hour of the day, starting with the last
+            # hours of the day before when there was a row for it
+            previous_day, previous_hours = carried.get(code, (None, []))
+            before = previous_hours if previous_day == day - 1 \
+                else [float('nan')] * (O3_WINDOW - 1)
+            averages = rolling_mean(before + values, O3_WINDOW, O3_MIN_HOURS)[O3_WINDOW - 1:]
+            valid_averages = [a for a in averages if not isnan(a)]
+            if len(valid_averages) >= O3_MIN_AVERAGES:
+                station.add_daily_max_8_hour(max(valid_averages))
+            carried[code] = (day, values[HOURS_PER_DAY - O3_WINDOW + 1:])
+    return metrics
+
+
+def metrics_of_files(paths: Union[str, List[str]], max_workers: Optional[int] = None) \
+        -> Dict[Tuple[str, str, str], StationMetrics]:
+    """Return the metrics of every station of the csv files in paths (a list of csv file
+    paths or a directory of csv files), by (pollutant, year, station code).
+
+    Each file is summarized in a worker process, streaming its rows, and only the
+    metrics of its stations come back to be merged.
+
+    >>> metrics = metrics_of_files('doctest_dataset', max_workers=2)
+    >>> len(metrics), metrics[('O3', '2019', '010102')].days
+    (226, 356)
+    """
+    if isinstance(paths, str):
+        paths = find_files(paths)
+
+    metrics = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for pollutant, year, stations in executor.map(helper_file_metrics, paths):
+            for code in stations:
+                key = (pollutant, year, code)
+                if key not in metrics:
+                    metrics[key] = StationMetrics()
+                metrics[key].merge(stations[code])
+    return metrics
+
+
+def helper_file_metrics(file_path: str) -> Tuple[str, str, Dict[str, StationMetrics]]:
+    """Return the pollutant, the year and the metrics of every station of the csv file at
+    file_path. This runs in a worker process."""
+    data_file = DataFile(file_path)
+    data_file.load()
+    return (data_file.pollutant, data_file.year, file_metrics(data_file))
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['concurrent.futures', 'math', 'typing', 'compute', 'loading_data',
+                          'naps_parser', 'parallel_loading', 'rolling'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)
@@ -0,0 +1,248 @@
+"""
+Catalog of NAPS stations with a spatial index over their locations
+
+Every data row of a NAPS file repeats the city, province, latitude and longitude of its
+station. DataFile keeps these once per station, and a StationCatalog holds them as
+Station objects in a uniform latitude/longitude grid so that stations can be looked up
+by distance or by area.
+"""
+from math import asin, cos, radians, sin, sqrt
+from typing import Dict, List, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.195
+# Longest possible distance between two points on the earth
+MAX_DISTANCE_KM = 20015.1
+# Size of a grid cell, in degrees of latitude and longitude
+CELL_DEGREES = 1.0
+
+
+class Station:
+    """
+    A NAPS station
+
+    Instance Attributes:
+        - code: the 6 digit NAPS ID of the station
+        - city: the city the station is in
+        - province: the province or territory code of the station, e.g. 'ON'
+        - latitude: latitude of the station, in degrees
+        - longitude: longitude of the station, in degrees
+
+    Representation Invariants:
+        - len(self.code) == 6
+        - -90 <= self.latitude <= 90
+        - -180 <= self.longitude <= 180
+    """
+    code: str
+    city: str
+    province: str
+    latitude: float
+    longitude: float
+
+    def __init__(self, code: str, city: str, province: str,
+                 latitude: float, longitude: float) -> None:
+        self.code = code
+        self.city = city
+        self.province = province
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __repr__(self) -> str:
+        return 'Station(' + self.code + ', ' + self.city + ', ' + self.province + ')'
+
+
+class StationCatalog:
+    """
+    A deduplicated collection of stations, indexed by code and by a uniform grid of
+    CELL_DEGREES x CELL_DEGREES cells over their locations.
+
+    Instance Attributes:
+        - stations: the stations of the catalog, by code
+        - grid: the codes of the stations in each grid cell, by (row, column) of the cell
+
+    >>> catalog = StationCatalog()
+    >>> catalog.add(Station('010102', 'St Johns', 'NL', 47.56038, -52.71147))
+    >>> catalog.add(Station('010602', 'Mount Pearl', 'NL', 47.52262, -52.81305))
+    >>> catalog.add(Station('060435', 'Toronto', 'ON', 43.70944, -79.5435))
+    >>> catalog.nearest(47.5, -52.7, 2)
+    [Station(010102, St Johns, NL), Station(010602, Mount Pearl, NL)]
+    >>> catalog.within_radius(43.65, -79.38, 50)
+    [Station(060435, Toronto, ON)]
+    >>> catalog.in_box(40.0, -80.0, 48.0, -60.0)
+    [Station(060435, Toronto, ON)]
+    >>> catalog.in_province('NL')
+    [Station(010102, St Johns, NL), Station(010602, Mount Pearl, NL)]
+    """
+    stations: Dict[str, Station]
+    grid: Dict[Tuple[int, int], List[str]]
+
+    def __init__(self) -> None:
+        self.stations = {}
+        self.grid = {}
+
+    def add(self, station: Station) -> None:
+        """Add station to this catalog, unless a station with the same code is already in it"""
+        if station.code in self.stations:
+            return
+        self.stations[station.code] = station
+        cell = helper_cell(station.latitude, station.longitude)
+        if cell not in self.grid:
+            self.grid[cell] = []
+        self.grid[cell].append(station.code)
+
+    def merge(self, other: 'StationCatalog') -> None:
+        """Add the stations of other to this catalog"""
+        for code in other.stations:
+            self.add(other.stations[code])
+
+    def within_radius(self, latitude: float, longitude: float,
+                      radius_km: float) -> List[Station]:
+        """Return the stations within radius_km of the given point, closest first"""
+        return [s for _, s in self.helper_within_radius(latitude, longitude, radius_km)]
+
+    def nearest(self, latitude: float, longitude: float, n: int) -> List[Station]:
+        """Return the n stations closest to the given point, closest first.
+
+        The search radius is doubled until it holds n stations, so only the grid cells
+        near the point are looked at.
+
+        Preconditions:
+            - n >= 0
+        """
+        radius = 50.0
+        found = self.helper_within_radius(latitude, longitude, radius)
+        while len(found) < min(n, len(self.stations)):
+            radius *= 2
+            found = self.helper_within_radius(latitude, longitude, radius)
+        return [s for _, s in found[:n]]
+
+    def in_box(self, min_latitude: float, min_longitude: float,
+               max_latitude: float, max_longitude: float) -> List[Station]:
+        """Return the stations inside the given latitude/longitude box, sorted by code
+
+        Preconditions:
+            - min_latitude <= max_latitude
+            - min_longitude <= max_longitude
+        """
+        (row_min, col_min) = helper_cell(min_latitude, min_longitude)
+        (row_max, col_max) = helper_cell(max_latitude, max_longitude)
+        found = []
+        for cell in helper_cells(row_min, row_max, col_min, col_max, self.grid):
+            for code in self.grid[cell]:
+                station = self.stations[code]
+                if min_latitude <= station.latitude <= max_latitude \
+                        and min_longitude <= station.longitude <= max_longitude:
+                    found.append(station)
+        return sorted(found, key=lambda s: s.code)
+
+    def in_province(self, province: str) -> List[Station]:
+        """Return the stations in the given province or territory, sorted by code"""
+        return sorted([s for s in self.stations.values() if s.province == province],
+                      key=lambda s: s.code)
+
+    def helper_within_radius(self, latitude: float, longitude: float,
+                             radius_km: float) -> List[Tuple[float, Station]]:
+        """Return the (distance, station) pairs of the stations within radius_km of the
+        given point, closest first"""
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        max_lat = min(abs(latitude) + lat_span, 90.0)
+        if radius_km >= MAX_DISTANCE_KM / 2 or max_lat >= 89.0:
+            lon_span = 180.0
+        else:
+            lon_span = min(lat_span / cos(radians(max_lat)), 180.0)
+
+        (row_min, col_min) = helper_cell(latitude - lat_span, longitude - lon_span)
+        (row_max, col_max) = helper_cell(latitude + lat_span, longitude + lon_span)
+        found = []
+        for cell in helper_cells(row_min, row_max, col_min, col_max, self.grid):
+            for code in self.grid[cell]:
+                station = self.stations[code]
+                distance = distance_km(latitude, longitude, station.latitude, station.longitude)
+                if distance <= radius_km:
+                    found.append((distance, code, station))
+        return [(item[0], item[2]) for item in sorted(found)]
+
+
+def match_stations(catalog: StationCatalog, other: StationCatalog,
+                   radius_km: float) -> Dict[str, str]:
+    """Return the code of the station of other paired with each station of catalog: the
+    station with the same code if other has one, and otherwise the station of other
+    closest to it within radius_km. Stations with no station of other in range are left
+    out.
+
+    Preconditions:
+        - radius_km >= 0
+
+    >>> o3 = StationCatalog()
+    >>> o3.add(Station('010102', 'St Johns', 'NL', 47.56038, -52.71147))
+    >>> o3.add(Station('060435', 'Toronto', 'ON', 43.70944, -79.5435))
+    >>> no2 = StationCatalog()
+    >>> no2.add(Station('010602', 'Mount Pearl', 'NL', 47.52262, -52.81305))
+    >>> match_stations(o3, no2, 25.0)
+    {'010102': '010602'}
+    """
+    pairs = {}
+    for code in sorted(catalog.stations):
+        if code in other.stations:
+            pairs[code] = code
+            continue
+        station = catalog.stations[code]
+        found = other.helper_within_radius(station.latitude, station.longitude, radius_km)
+        if found != []:
+            pairs[code] = found[0][1].code
+    return pairs
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Return the great circle distance between two points, in km
+
+    >>> round(distance_km(43.65, -79.38, 45.50, -73.57))
+    504
+    """
+    d_lat = radians(lat2 - lat1)
+    d_lon = radians(lon2 - lon1)
+    a = sin(d_lat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+def helper_cell(latitude: float, longitude: float) -> Tuple[int, int]:
+    """Return the (row, column) of the grid cell containing the given point
+
+    >>> helper_cell(47.56, -52.71)
+    (47, -53)
+    """
+    return (int(latitude // CELL_DEGREES), int(longitude // CELL_DEGREES))
+
+
+def helper_cells(row_min: int, row_max: int, col_min: int, col_max: int,
+                 grid: Dict[Tuple[int, int], List[str]]) -> List[Tuple[int, int]]:
+    """Return the non-empty cells of grid in the given range of rows and columns.
+    Columns wrap around at +-180 degrees of longitude."""
+    n_cols = int(360 // CELL_DEGREES)
+    if col_max - col_min + 1 >= n_cols:
+        columns = range(-n_cols // 2, n_cols // 2)
+    else:
+        columns = [(c + n_cols // 2) % n_cols - n_cols // 2 for c in range(col_min, col_max + 1)]
+    if (row_max - row_min + 1) * len(columns) > len(grid):
+        return [cell for cell in grid if row_min <= cell[0] <= row_max and cell[1] in columns]
+    return [(row, col) for row in range(row_min, row_max + 1) for col in columns
+            if (row, col) in grid]
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['math', 'typing'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['R1705', 'C0200']
+    })
+
+    import python_ta.contracts
+
+    python_ta.contracts.DEBUG_CONTRACTS = False
+    python_ta.contracts.check_all_contracts()
+
+    import doctest
+    doctest.testmod(verbose=True)